@@ -14,6 +14,7 @@ from langchain_core.messages import (
     ToolMessage,
 )
 from langchain_openai import ChatOpenAI
+from pydantic import ValidationError
 
 from app.config import (
     OPENAI_API_KEY,
@@ -23,7 +24,11 @@ from app.config import (
 )
 from prompts.tool_prompt import TOOL_SYSTEM_PROMPT
 from agents.logging_callback import AgentLoggingCallback
-from tools.search_knowledge import create_search_knowledge_tool
+from tools.search_knowledge import (
+    SearchKnowledgeInput,
+    create_search_knowledge_tool,
+    search_knowledge_many,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +49,26 @@ def _to_langchain_messages(messages: list[dict]) -> list:
     return lc_messages
 
 
+def _batch_search_calls(tool_calls: list[dict], sources_collector: list[dict]) -> dict[str, str]:
+    """
+    Executa em lote as chamadas de search_knowledge de um round com mais de
+    uma delas (uma unica busca no RAG). Retorna tool_call_id -> resultado;
+    chamadas com argumentos invalidos ficam de fora e seguem pelo caminho normal.
+    """
+    calls, ids = [], []
+    for tool_call in tool_calls:
+        if tool_call['name'] != 'search_knowledge':
+            continue
+        try:
+            calls.append(SearchKnowledgeInput(**tool_call['args']))
+        except ValidationError:
+            continue
+        ids.append(tool_call['id'])
+    if len(calls) < 2:
+        return {}
+    return dict(zip(ids, search_knowledge_many(calls, sources_collector)))
+
+
 # ---------------------------------------------------------------------------
 # Loop de orquestracao
 # ---------------------------------------------------------------------------
@@ -109,6 +134,9 @@ def chat_with_tools(messages: list[dict], interaction_id: str | None = None) ->
         # Adicionar resposta do assistente ao historico
         lc_messages.append(response)
 
+        # Varias buscas no mesmo round vao em lote para o RAG
+        batched_results = _batch_search_calls(response.tool_calls, all_sources)
+
         # Executar cada tool call
         for tool_call in response.tool_calls:
             tool_name = tool_call['name']
@@ -119,7 +147,9 @@ def chat_with_tools(messages: list[dict], interaction_id: str | None = None) ->
             )
 
             selected_tool = tools_by_name.get(tool_name)
-            if selected_tool:
+            if tool_call['id'] in batched_results:
+                tool_result = batched_results[tool_call['id']]
+            elif selected_tool:
                 tool_result = selected_tool.invoke(tool_args)
             else:
                 tool_result = f'Erro: Ferramenta desconhecida "{tool_name}".'
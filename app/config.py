@@ -14,9 +14,25 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent
 # --- Data paths ---
 DATA_DIR = PROJECT_ROOT / 'data'
 NOTES_FILE = DATA_DIR / 'notes.json'
+NOTES_JOURNAL_FILE = DATA_DIR / 'notes.journal.jsonl'
 TAGS_FILE = DATA_DIR / 'tags.json'
-CHATS_FILE = DATA_DIR / 'chats.json'
-MAX_CHATS = 10
+CHATS_FILE = DATA_DIR / 'chats.json'  # legacy single-file store, migrated to CHATS_DIR
+CHATS_DIR = DATA_DIR / 'chats'
+MAX_CHATS: int = int(os.environ.get('MAX_CHATS', '10'))
+
+# --- Storage settings ---
+# 'json' keeps notes/tags in the JSON files above; 'sqlite' uses a single
+# SQLite database (WAL mode). The first SQLite start migrates the JSON data.
+STORAGE_BACKEND: str = os.environ.get('STORAGE_BACKEND', 'json').lower()
+SQLITE_DB_FILE: str = os.environ.get(
+    'SQLITE_DB_FILE',
+    str(DATA_DIR / 'knowledge.db'),
+)
+# JSON backend: note writes are appended to NOTES_JOURNAL_FILE and folded into
+# notes.json by a background compactor once the journal passes this size.
+NOTES_JOURNAL_COMPACT_BYTES: int = int(
+    os.environ.get('NOTES_JOURNAL_COMPACT_BYTES', str(4 * 1024 * 1024))
+)
 FAISS_INDEX_DIR: str = os.environ.get(
     'FAISS_INDEX_DIR',
     str(DATA_DIR / 'faiss_index'),
@@ -30,7 +46,76 @@ OPENAI_TIMEOUT: float = float(os.environ.get('OPENAI_TIMEOUT', '120'))
 
 # --- RAG settings ---
 EMBEDDING_MODEL_NAME: str = os.environ.get('EMBEDDING_MODEL_NAME', 'all-MiniLM-L6-v2')
+# Backend dos embeddings: 'torch' (sentence-transformers) ou 'onnx' (o mesmo
+# modelo em int8 no ONNX Runtime, lido de EMBEDDING_ONNX_DIR; requer o pacote
+# onnxruntime e um diretorio gerado por onnx_embeddings.export_model).
+EMBEDDING_BACKEND: str = os.environ.get('EMBEDDING_BACKEND', 'torch').lower()
+EMBEDDING_ONNX_DIR: str = os.environ.get('EMBEDDING_ONNX_DIR', str(DATA_DIR / 'embedding_onnx'))
 RAG_TOP_K: int = int(os.environ.get('RAG_TOP_K', '5'))
+# Orcamento de tokens do contexto devolvido por retrieve() (por chamada da ferramenta).
+RAG_CONTEXT_MAX_TOKENS: int = int(os.environ.get('RAG_CONTEXT_MAX_TOKENS', '1500'))
+# Cache persistente de embeddings por hash do texto (0 desativa).
+EMBEDDING_CACHE_DIR: str = os.environ.get(
+    'EMBEDDING_CACHE_DIR',
+    str(DATA_DIR / 'embedding_cache'),
+)
+EMBEDDING_CACHE_MAX_MB: int = int(os.environ.get('EMBEDDING_CACHE_MAX_MB', '256'))
+# Cache LRU em memoria dos embeddings de consultas (entradas; 0 desativa).
+RAG_QUERY_CACHE_SIZE: int = int(os.environ.get('RAG_QUERY_CACHE_SIZE', '1024'))
+# Cache LRU dos resultados de retrieve() por (pergunta, filtros, top_k) e
+# versao do índice (entradas; 0 desativa).
+RAG_RESULT_CACHE_SIZE: int = int(os.environ.get('RAG_RESULT_CACHE_SIZE', '256'))
+# Micro-batching do embedding de consultas concorrentes: tamanho maximo do
+# lote e espera maxima por outras consultas (1 desativa o batching).
+RAG_QUERY_BATCH_SIZE: int = int(os.environ.get('RAG_QUERY_BATCH_SIZE', '32'))
+RAG_QUERY_BATCH_WAIT_MS: float = float(os.environ.get('RAG_QUERY_BATCH_WAIT_MS', '5'))
+# Motor de busca vetorial: 'numpy' (produto matricial exato sobre os vetores
+# memory-mapped, sem índice FAISS), 'faiss' ou 'auto' (numpy abaixo de
+# RAG_NUMPY_MAX_VECTORS vetores, FAISS acima; troca sozinho conforme o corpus).
+# Em 'auto', um RAG_INDEX_TYPE explicito (diferente de 'auto') usa sempre FAISS.
+RAG_VECTOR_BACKEND: str = os.environ.get('RAG_VECTOR_BACKEND', 'auto').lower()
+RAG_NUMPY_MAX_VECTORS: int = int(os.environ.get('RAG_NUMPY_MAX_VECTORS', '20000'))
+# Tipo do índice FAISS: 'flat' (busca exata), 'hnsw', 'ivf_flat', 'ivf_pq' ou
+# 'auto' (flat abaixo de RAG_HNSW_MIN_VECTORS, hnsw abaixo de
+# RAG_IVF_MIN_VECTORS e ivf_pq acima). Os tipos IVF usam flat ate haver
+# vetores suficientes para treinar os centroides. O índice salvo e aberto
+# memory-mapped (sem copia em RAM) no flat e no hnsw; nos tipos IVF o FAISS
+# ainda le as listas invertidas inteiras para a memoria ao abrir, entao o
+# tempo de abertura e a RAM crescem com o corpus.
+RAG_INDEX_TYPE: str = os.environ.get('RAG_INDEX_TYPE', 'auto').lower()
+RAG_HNSW_MIN_VECTORS: int = int(os.environ.get('RAG_HNSW_MIN_VECTORS', '20000'))
+RAG_IVF_MIN_VECTORS: int = int(os.environ.get('RAG_IVF_MIN_VECTORS', '500000'))
+RAG_HNSW_M: int = int(os.environ.get('RAG_HNSW_M', '32'))
+RAG_HNSW_EF_CONSTRUCTION: int = int(os.environ.get('RAG_HNSW_EF_CONSTRUCTION', '80'))
+RAG_HNSW_EF_SEARCH: int = int(os.environ.get('RAG_HNSW_EF_SEARCH', '64'))
+RAG_IVF_NLIST: int = int(os.environ.get('RAG_IVF_NLIST', '0'))  # 0 = ~4*sqrt(n)
+RAG_IVF_NPROBE: int = int(os.environ.get('RAG_IVF_NPROBE', '16'))
+RAG_PQ_M: int = int(os.environ.get('RAG_PQ_M', '48'))  # subquantizadores (bytes por vetor) do PQ
+# Codificacao dos vetores no índice: 'float32', 'fp16', 'int8' (quantizacao
+# escalar) ou 'pq'. Com perda, os RAG_RERANK_FACTOR * k melhores candidatos
+# sao reordenados pela distancia exata, com os vetores float32 guardados em disco.
+RAG_VECTOR_ENCODING: str = os.environ.get('RAG_VECTOR_ENCODING', 'float32').lower()
+RAG_RERANK_FACTOR: int = int(os.environ.get('RAG_RERANK_FACTOR', '4'))
+# Mantem um sub-índice FAISS por tag (buscas por uma unica tag so consultam
+# a particao dela). Custa uma copia extra dos vetores por tag da nota; cada
+# particao e montada na primeira busca pela tag depois de abrir o índice.
+RAG_TAG_PARTITIONS: bool = os.environ.get('RAG_TAG_PARTITIONS', 'false').lower() in ('1', 'true', 'yes')
+# Notas longas sao indexadas em trechos de ate RAG_CHUNK_SIZE caracteres (o
+# modelo trunca textos longos), com RAG_CHUNK_OVERLAP de sobreposicao. A busca
+# traz RAG_CHUNK_FETCH_FACTOR * top_k trechos e os agrega por nota.
+RAG_CHUNK_SIZE: int = int(os.environ.get('RAG_CHUNK_SIZE', '800'))
+RAG_CHUNK_OVERLAP: int = int(os.environ.get('RAG_CHUNK_OVERLAP', '100'))
+RAG_CHUNK_FETCH_FACTOR: int = int(os.environ.get('RAG_CHUNK_FETCH_FACTOR', '3'))
+# Fila de indexacao em background: tamanho maximo do lote de embeddings,
+# espera para acumular um lote e intervalo sem escritas antes de salvar o índice.
+INDEX_BATCH_SIZE: int = int(os.environ.get('INDEX_BATCH_SIZE', '64'))
+INDEX_BATCH_WAIT_MS: int = int(os.environ.get('INDEX_BATCH_WAIT_MS', '50'))
+INDEX_PERSIST_DEBOUNCE_S: float = float(os.environ.get('INDEX_PERSIST_DEBOUNCE_S', '2.0'))
+# Lotes que falham voltam para a fila com espera exponencial (a partir de
+# INDEX_RETRY_BACKOFF_S, ate 60 s); apos INDEX_RETRY_MAX_ATTEMPTS tentativas a
+# nota fica para o ensure_index da proxima inicializacao.
+INDEX_RETRY_BACKOFF_S: float = float(os.environ.get('INDEX_RETRY_BACKOFF_S', '1.0'))
+INDEX_RETRY_MAX_ATTEMPTS: int = int(os.environ.get('INDEX_RETRY_MAX_ATTEMPTS', '5'))
 
 # --- Tool calling settings ---
 TOOL_CALLING_MAX_ROUNDS: int = int(os.environ.get('TOOL_CALLING_MAX_ROUNDS', '5'))
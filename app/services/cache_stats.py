@@ -0,0 +1,32 @@
+"""
+cache_stats.py
+Estatisticas comuns aos caches do rag_service (EmbeddingCache,
+QueryEmbeddingCache e ResultCache): acertos, falhas, taxa de acerto,
+entradas e capacidade.
+"""
+
+from abc import ABC, abstractmethod
+
+
+class CacheStats(ABC):
+    """
+    Base dos caches com contadores `hits`/`misses` protegidos por `_lock`.
+    A subclasse informa a ocupacao em _occupancy.
+    """
+
+    @abstractmethod
+    def _occupancy(self) -> tuple[int, int]:
+        """(entradas, capacidade); chamado com o _lock adquirido."""
+
+    def stats(self) -> dict:
+        """Retorna hits, misses, taxa de acerto, entradas e capacidade."""
+        with self._lock:
+            total = self.hits + self.misses
+            entries, capacity = self._occupancy()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': entries,
+                'capacity': capacity,
+            }
@@ -0,0 +1,160 @@
+"""
+context_packer.py
+Montagem do contexto de retrieve() dentro de um orcamento de tokens. As
+notas entram por ordem de relevancia, cada uma com os seus trechos mais
+relevantes, ate o orcamento acabar; o trecho que nao cabe inteiro e
+cortado. Metadados iguais em todas as notas (ex: a tag da busca) aparecem
+uma unica vez no topo, e campos vazios sao omitidos.
+"""
+
+import logging
+
+import tiktoken
+from langchain_core.documents import Document
+
+from app.config import CHAT_MODEL
+
+logger = logging.getLogger(__name__)
+
+_NOTE_SEPARATOR = '\n---\n'
+# Nao abre uma nota nova se sobrarem menos tokens que isto para o conteudo.
+_MIN_BODY_TOKENS = 32
+# Estimativa usada quando o tokenizer nao esta disponivel (ex: sem rede para
+# baixar o BPE do tiktoken).
+_CHARS_PER_TOKEN = 4
+_FIELDS = (
+    ('source_name', 'Fonte'),
+    ('source_type', 'Tipo'),
+    ('source_author', 'Autor'),
+    ('tags', 'Tags'),
+)
+
+_encoding = None
+
+
+def _get_encoding():
+    """Tokenizer do modelo de chat, ou None se nao puder ser carregado."""
+    global _encoding
+    if _encoding is None:
+        try:
+            try:
+                _encoding = tiktoken.encoding_for_model(CHAT_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding('o200k_base')
+        except Exception as e:
+            logger.warning('Tokenizer indisponivel, tokens serao estimados: %s', e)
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Numero de tokens do texto para o modelo de chat (estimado sem tokenizer)."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return -(-len(text) // _CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Corta o texto em max_tokens tokens, marcando o corte com '[...]'."""
+    encoding = _get_encoding()
+    if encoding is None:
+        cut = text[:max_tokens * _CHARS_PER_TOKEN]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    return cut.rstrip() + ' [...]' if len(cut) < len(text) else text
+
+
+def _field(metadata: dict, key: str) -> str:
+    if key == 'tags':
+        return ', '.join(t for t in metadata.get('tags', '').split('|') if t)
+    return metadata.get(key, '')
+
+
+def _chunk_text(chunk: Document) -> str:
+    """Texto do trecho sem o titulo da nota, que ja esta no cabecalho."""
+    text = chunk.page_content
+    title = chunk.metadata.get('title', '')
+    if chunk.metadata.get('chunk', 0) == 0 and title and text.startswith(title):
+        text = text[len(title):].lstrip('\n')
+    return text
+
+
+def _source(metadata: dict) -> dict:
+    return {
+        'note_id': metadata.get('note_id', ''),
+        'title': metadata.get('title', ''),
+        'source_type': metadata.get('source_type', ''),
+        'source_name': metadata.get('source_name', ''),
+        'source_author': metadata.get('source_author', ''),
+        'tags': [t for t in metadata.get('tags', '').split('|') if t],
+    }
+
+
+def pack_context(notes: list[list[Document]], max_tokens: int) -> dict:
+    """
+    Monta o contexto das notas recuperadas sem passar de max_tokens.
+
+    Args:
+        notes: Uma lista de trechos por nota, notas e trechos em ordem de
+               relevancia; os metadados da nota vem no primeiro trecho.
+        max_tokens: Orcamento de tokens do contexto.
+
+    Returns:
+        dict com:
+            'context': str - Contexto formatado.
+            'sources': list[dict] - Metadados das notas que entraram no contexto.
+            'tokens': int - Tokens usados pelo contexto.
+    """
+    if not notes:
+        return {'context': '', 'sources': [], 'tokens': 0}
+
+    metadatas = [chunks[0].metadata for chunks in notes]
+    shared = {}
+    if len(notes) > 1:
+        for key, label in _FIELDS:
+            values = {_field(meta, key) for meta in metadatas}
+            if len(values) == 1 and '' not in values:
+                shared[key] = f'{label}: {values.pop()}'
+
+    parts = []
+    used = 0
+    if shared:
+        parts.append('Todas as notas - ' + ' | '.join(shared.values()))
+        used = count_tokens(parts[0] + _NOTE_SEPARATOR)
+    sources = []
+    for chunks in notes:
+        meta = chunks[0].metadata
+        header = f"[Nota {len(sources) + 1}] {meta.get('title') or 'Sem titulo'}"
+        details = [f'{label}: {_field(meta, key)}' for key, label in _FIELDS
+                   if key not in shared and _field(meta, key)]
+        if details:
+            header += '\n' + ' | '.join(details)
+        remaining = max_tokens - used - count_tokens(header + '\n' + _NOTE_SEPARATOR)
+        if sources and remaining < _MIN_BODY_TOKENS:
+            break
+
+        selected = []
+        for chunk in chunks:
+            text = _chunk_text(chunk)
+            tokens = count_tokens(text)
+            if tokens <= remaining:
+                selected.append((chunk, text))
+                remaining -= tokens
+            else:
+                if not selected or remaining >= _MIN_BODY_TOKENS:
+                    selected.append((chunk, _truncate(text, max(remaining, 0))))
+                break
+        selected.sort(key=lambda item: item[0].metadata.get('chunk', 0))
+
+        body = selected[0][1]
+        for (prev, _), (chunk, text) in zip(selected, selected[1:]):
+            contiguous = chunk.metadata.get('chunk', 0) == prev.metadata.get('chunk', 0) + 1
+            body += ('\n' if contiguous else '\n[...]\n') + text
+        note_text = f'{header}\n{body}'
+        parts.append(note_text)
+        used += count_tokens(note_text + _NOTE_SEPARATOR)
+        sources.append(_source(meta))
+
+    context = _NOTE_SEPARATOR.join(parts)
+    return {'context': context, 'sources': sources, 'tokens': count_tokens(context)}
@@ -0,0 +1,171 @@
+"""
+doc_store.py
+Docstore do índice vetorial em SQLite (docstore.db, ao lado de index.faiss).
+Cada trecho (chunk) indexado e uma linha com seu rotulo (label) FAISS, com
+os metadados da nota em colunas e o texto a parte; so as linhas dos resultados de uma
+busca sao lidas, e a abertura nao carrega o corpus para a memoria. Nada e
+desserializado com pickle: metadados fora das colunas vao em msgpack.
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+
+import ormsgpack
+from langchain_core.documents import Document
+
+# Versao do formato (PRAGMA user_version). Um banco de outra versao e
+# recriado vazio; o token muda e o índice e reconstruido.
+FORMAT_VERSION = 3
+# Metadados com coluna propria, na ordem do Document montado por _build_document.
+_COLUMNS = ('note_id', 'title', 'source_type', 'source_name', 'source_author', 'tags', 'created_at')
+# Parametros por consulta IN (...), abaixo do limite do SQLite.
+_MAX_PARAMS = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    label INTEGER PRIMARY KEY,
+    note_id TEXT NOT NULL,
+    chunk INTEGER NOT NULL,
+    doc_hash TEXT NOT NULL,
+    title TEXT NOT NULL,
+    source_type TEXT NOT NULL,
+    source_name TEXT NOT NULL,
+    source_author TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    extra BLOB,
+    page_content TEXT NOT NULL,
+    UNIQUE (note_id, chunk)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class DocStore:
+    """
+    Documentos por rotulo. As escritas ficam na transacao aberta ate
+    commit(), chamado quando o índice FAISS e salvo, para que os dois
+    avancem juntos.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            if conn.execute('PRAGMA user_version').fetchone()[0] != FORMAT_VERSION:
+                conn.executescript('DROP TABLE IF EXISTS docs; DROP TABLE IF EXISTS meta;')
+                conn.execute(f'PRAGMA user_version = {FORMAT_VERSION}')
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def reset(self) -> None:
+        """Apaga o docstore inteiro (arquivos do banco inclusos)."""
+        self.close()
+        for suffix in ('', '-wal', '-shm'):
+            Path(f'{self.path}{suffix}').unlink(missing_ok=True)
+
+    # -- escrita ------------------------------------------------------------
+    def add(self, labels: list[int], docs: list[Document], hashes: list[str]) -> None:
+        rows = []
+        for label, doc, doc_hash in zip(labels, docs, hashes):
+            meta = doc.metadata
+            extra = {key: value for key, value in meta.items()
+                     if key not in _COLUMNS and key != 'chunk'}
+            rows.append((label, int(meta.get('chunk', 0)), doc_hash,
+                         *(str(meta.get(col, '')) for col in _COLUMNS),
+                         ormsgpack.packb(extra) if extra else None, doc.page_content))
+        with self._lock:
+            self._connect().executemany(
+                f'INSERT OR REPLACE INTO docs (label, chunk, doc_hash, {", ".join(_COLUMNS)}, '
+                f'extra, page_content) VALUES ({", ".join("?" * (len(_COLUMNS) + 5))})',
+                rows,
+            )
+
+    def delete(self, labels: list[int]) -> None:
+        with self._lock:
+            self._connect().executemany('DELETE FROM docs WHERE label = ?',
+                                        [(label,) for label in labels])
+
+    def commit(self, token: str) -> None:
+        """Confirma as escritas pendentes, gravando o token do salvamento."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('token', ?)", (token,))
+            conn.commit()
+
+    # -- leitura ------------------------------------------------------------
+    def token(self) -> str | None:
+        """Token do ultimo commit (confere com o manifesto do índice)."""
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM meta WHERE key = 'token'").fetchone()
+        return row[0] if row else None
+
+    def get_many(self, labels: list[int]) -> list[Document]:
+        """Documentos dos rotulos pedidos, na mesma ordem (ausentes sao ignorados)."""
+        if not labels:
+            return []
+        placeholders = ','.join('?' * len(labels))
+        with self._lock:
+            rows = self._connect().execute(
+                f'SELECT label, chunk, {", ".join(_COLUMNS)}, extra, page_content FROM docs '
+                f'WHERE label IN ({placeholders})',
+                [int(label) for label in labels],
+            ).fetchall()
+        found = {}
+        for label, chunk, *values, extra, text in rows:
+            metadata = dict(zip(_COLUMNS, values), chunk=chunk)
+            if extra is not None:
+                metadata.update(ormsgpack.unpackb(extra))
+            found[label] = Document(page_content=text, metadata=metadata)
+        return [found[int(label)] for label in labels if int(label) in found]
+
+    def label_rows(self) -> list[tuple[int, str, str, str]]:
+        """(label, note_id, source_type, tags) de todos os documentos, por rotulo."""
+        with self._lock:
+            return self._connect().execute(
+                'SELECT label, note_id, source_type, tags FROM docs ORDER BY label'
+            ).fetchall()
+
+    def labels_of(self, note_ids: list[str]) -> dict[str, list[int]]:
+        """note_id -> rotulos dos trechos da nota, so para as notas indexadas."""
+        found: dict[str, list[int]] = {}
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(note_ids), _MAX_PARAMS):
+                chunk = note_ids[start:start + _MAX_PARAMS]
+                rows = conn.execute(
+                    f'SELECT note_id, label FROM docs WHERE note_id IN ({",".join("?" * len(chunk))}) '
+                    'ORDER BY label',
+                    chunk,
+                )
+                for note_id, label in rows:
+                    found.setdefault(note_id, []).append(label)
+        return found
+
+    def max_label(self) -> int:
+        """Maior rotulo em uso (-1 se vazio)."""
+        with self._lock:
+            row = self._connect().execute('SELECT MAX(label) FROM docs').fetchone()
+        return -1 if row[0] is None else row[0]
+
+    def hashes(self) -> dict[str, str]:
+        """note_id -> hash da nota indexada (o mesmo em todos os trechos dela)."""
+        with self._lock:
+            return dict(self._connect().execute('SELECT DISTINCT note_id, doc_hash FROM docs'))
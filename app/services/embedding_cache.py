@@ -0,0 +1,319 @@
+"""
+embedding_cache.py
+Cache persistente de embeddings indexado por (modelo, hash do texto).
+Os vetores ficam em uma matriz float32 memory-mapped (vectors.f32) e o
+mapa chave -> linha (slot), com a ordem LRU, em SQLite (index.db), para que
+reconstrucoes do índice so embedem textos novos ou alterados. Gravar uma
+entrada toca so as linhas dela. Os embeddings de consultas ficam em um LRU
+em memoria a parte (QueryEmbeddingCache).
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.services.cache_stats import CacheStats
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    slot INTEGER NOT NULL UNIQUE,
+    used INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def text_key(text: str) -> str:
+    """Retorna o hash de conteudo usado como chave do cache."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def normalize_query(text: str) -> str:
+    """Forma canonica de uma consulta: Unicode NFC e espacos colapsados."""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+class EmbeddingCache(CacheStats):
+    """
+    Cache de embeddings em disco para um unico modelo.
+
+    Cada entrada ocupa uma linha (slot) da matriz; quando o cache atinge
+    max_bytes, o slot da entrada usada ha mais tempo e reaproveitado. Uma
+    chave so aponta para um slot no index.db depois que o vetor dela esta
+    gravado, e a chave despejada sai do index.db antes que o slot seja
+    sobrescrito: uma queda nunca deixa uma chave com o vetor de outro texto.
+    """
+
+    def __init__(self, directory: str | Path, model_name: str, max_bytes: int) -> None:
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.directory = Path(directory) / safe_name
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.dim: int | None = None
+        self.capacity = 0
+        self._slots: OrderedDict[str, int] = OrderedDict()
+        # Chaves lidas desde a ultima escrita, na ordem de uso: a recencia
+        # delas vai para o index.db junto com a proxima escrita.
+        self._touched: OrderedDict[str, None] = OrderedDict()
+        self._clock = 0
+        self._next_slot = 0
+        self._matrix: np.memmap | None = None
+        self._file = None
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    # -- persistencia -------------------------------------------------------
+    @property
+    def _db_file(self) -> Path:
+        return self.directory / 'index.db'
+
+    @property
+    def _vectors_file(self) -> Path:
+        return self.directory / 'vectors.f32'
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._db_file, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # FULL: a remocao das chaves despejadas precisa estar no disco
+            # antes que os slots delas sejam sobrescritos.
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _load(self) -> None:
+        if not self._db_file.exists() or not self._vectors_file.exists():
+            return
+        try:
+            conn = self._connect()
+            meta = dict(conn.execute('SELECT key, value FROM meta'))
+            if meta.get('model') != self.model_name or 'dim' not in meta:
+                return
+            self._open(int(meta['dim']))
+            rows = 0 if self._matrix is None else len(self._matrix)
+            self._slots = OrderedDict(conn.execute(
+                'SELECT key, slot FROM entries WHERE slot < ? ORDER BY used', (rows,)))
+            self._clock = conn.execute('SELECT COALESCE(MAX(used), 0) FROM entries').fetchone()[0]
+            self._next_slot = max(self._slots.values(), default=-1) + 1
+        except Exception as e:
+            logger.warning('Cache de embeddings ignorado (%s): %s', self.directory, e)
+            self.dim, self._matrix, self._slots = None, None, OrderedDict()
+
+    def _open(self, dim: int) -> None:
+        """Abre (ou cria) a matriz memory-mapped para vetores de dimensao dim."""
+        self.dim = dim
+        self.capacity = max(1, self.max_bytes // (dim * 4))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if not self._vectors_file.exists():
+            self._vectors_file.touch()
+        if self._file is not None:
+            self._file.close()
+        # Escritas pelo arquivo (so as linhas gravadas ficam sujas), leituras
+        # pelo memmap somente leitura.
+        self._file = open(self._vectors_file, 'r+b')
+        self._map(self._vectors_file.stat().st_size // (dim * 4))
+
+    def _map(self, rows: int) -> None:
+        self._matrix = None
+        if rows:
+            self._matrix = np.memmap(self._vectors_file, dtype=np.float32,
+                                     mode='r', shape=(rows, self.dim))
+
+    def _reset(self, dim: int) -> None:
+        """Descarta todas as entradas e recomeca com vetores de dimensao dim."""
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM entries')
+            conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                             [('model', self.model_name), ('dim', str(dim))])
+        self._slots = OrderedDict()
+        self._touched = OrderedDict()
+        self._next_slot = 0
+        self._matrix = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._vectors_file.unlink(missing_ok=True)
+        # Formato anterior, com as chaves em JSON.
+        (self.directory / 'index.json').unlink(missing_ok=True)
+        self._open(dim)
+
+    def _grow(self, rows: int) -> None:
+        """Estende o arquivo de vetores para pelo menos `rows` linhas."""
+        current = 0 if self._matrix is None else len(self._matrix)
+        if rows <= current:
+            return
+        new_rows = min(self.capacity, max(rows, current * 2, 64))
+        self._file.truncate(new_rows * self.dim * 4)
+        self._map(new_rows)
+
+    def _write_vectors(self, slots: list[int], vectors: list[np.ndarray]) -> None:
+        """Grava os vetores nos slots e espera chegarem ao disco."""
+        row_bytes = self.dim * 4
+        for slot, vector in sorted(zip(slots, vectors), key=lambda item: item[0]):
+            self._file.seek(slot * row_bytes)
+            self._file.write(vector.tobytes())
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    # -- API ----------------------------------------------------------------
+    def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+        """Retorna o vetor de cada chave, ou None quando ausente."""
+        with self._lock:
+            found: list[np.ndarray | None] = []
+            for key in keys:
+                slot = self._slots.get(key)
+                if slot is None:
+                    self.misses += 1
+                    found.append(None)
+                else:
+                    self.hits += 1
+                    self._slots.move_to_end(key)
+                    self._touched[key] = None
+                    self._touched.move_to_end(key)
+                    found.append(np.array(self._matrix[slot]))
+            return found
+
+    def put_many(self, keys: list[str], vectors: np.ndarray) -> None:
+        """Grava vetores novos, despejando as entradas menos usadas se preciso."""
+        if not keys:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim != vectors.shape[1]:
+                self._reset(vectors.shape[1])
+            evicted, added = [], []
+            for key, vector in zip(keys, vectors):
+                if key in self._slots:
+                    continue  # mesma chave, mesmo texto: o vetor ja esta gravado
+                if self._next_slot < self.capacity:
+                    slot = self._next_slot
+                    self._next_slot += 1
+                else:
+                    old_key, slot = self._slots.popitem(last=False)
+                    self._touched.pop(old_key, None)
+                    evicted.append(old_key)
+                self._slots[key] = slot
+                added.append((key, slot, vector))
+            # Uma chave nova deste lote pode ter sido despejada por outra.
+            added = [(key, slot, vector) for key, slot, vector in added if self._slots.get(key) == slot]
+            if not added:
+                return
+            try:
+                conn = self._connect()
+                if evicted:
+                    with conn:
+                        conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in evicted])
+                self._grow(max(slot for _, slot, _ in added) + 1)
+                self._write_vectors([slot for _, slot, _ in added], [vector for _, _, vector in added])
+                touched = [key for key in self._touched if key in self._slots]
+                clock = self._clock
+                self._clock += len(touched) + len(added)
+                with conn:
+                    conn.executemany('UPDATE entries SET used = ? WHERE key = ?',
+                                     [(clock + i + 1, key) for i, key in enumerate(touched)])
+                    clock += len(touched)
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO entries (key, slot, used) VALUES (?, ?, ?)',
+                        [(key, slot, clock + i + 1) for i, (key, slot, _) in enumerate(added)],
+                    )
+            except Exception:
+                # Nada foi confirmado para as chaves novas: elas saem do cache.
+                for key, _, _ in added:
+                    self._slots.pop(key, None)
+                raise
+            self._touched.clear()
+
+    def _occupancy(self) -> tuple[int, int]:
+        return len(self._slots), self.capacity
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envolve um modelo de embeddings: embed_documents consulta o cache e so
+    envia ao modelo, em um unico lote, os textos que ainda nao estao nele.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache) -> None:
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [text_key(t) for t in texts]
+        found = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(found) if vector is None]
+        if missing:
+            new_vectors = np.asarray(
+                self.embeddings.embed_documents([texts[i] for i in missing]),
+                dtype=np.float32,
+            )
+            self.cache.put_many([keys[i] for i in missing], new_vectors)
+            for i, vector in zip(missing, new_vectors):
+                found[i] = vector
+        return [vector.tolist() for vector in found]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+
+class QueryEmbeddingCache(CacheStats):
+    """
+    LRU em memoria de embeddings de consultas, por (modelo, consulta
+    normalizada). Perguntas repetidas (ex: retentativas do guardrail) nao
+    passam de novo pelo modelo.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str], np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_name: str, text: str) -> list[float] | None:
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return vector.tolist()
+
+    def put(self, model_name: str, text: str, vector: list[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        key = (model_name, normalize_query(text))
+        with self._lock:
+            self._entries[key] = np.asarray(vector, dtype=np.float32)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _occupancy(self) -> tuple[int, int]:
+        return len(self._entries), self.max_entries
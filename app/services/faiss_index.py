@@ -0,0 +1,424 @@
+"""
+faiss_index.py
+Criacao e busca dos índices FAISS do rag_service: flat (exato), HNSW,
+IVF-Flat e IVF-PQ, com vetores em float32 ou comprimidos (fp16, int8 ou PQ).
+Todos guardam um rotulo (label) int64 estavel por documento, de modo que
+inclusoes e remocoes nao renumeram os demais vetores. FaissBackend expoe
+esses índices pela interface de vector_store.py.
+"""
+
+import math
+import os
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from app.config import (
+    RAG_INDEX_TYPE,
+    RAG_HNSW_MIN_VECTORS,
+    RAG_IVF_MIN_VECTORS,
+    RAG_HNSW_M,
+    RAG_HNSW_EF_CONSTRUCTION,
+    RAG_HNSW_EF_SEARCH,
+    RAG_IVF_NLIST,
+    RAG_IVF_NPROBE,
+    RAG_PQ_M,
+    RAG_VECTOR_ENCODING,
+    RAG_RERANK_FACTOR,
+)
+from app.services.vector_file import FloatVectorFile
+from app.services.vector_store import INDEX_FILE, VectorBackend
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivf_flat', 'ivf_pq')
+_MMAP_FLAGS = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+ENCODINGS = ('float32', 'fp16', 'int8', 'pq')
+_SQ_TYPES = {
+    'fp16': faiss.ScalarQuantizer.QT_fp16,
+    'int8': faiss.ScalarQuantizer.QT_8bit,
+}
+# Com poucos candidatos (filtro seletivo) a busca e feita de forma exata so
+# sobre eles, em vez de passar pelo grafo/listas do ANN ou, no flat, de
+# percorrer o índice inteiro testando o seletor.
+EXACT_SEARCH_MAX_CANDIDATES = 4096
+# FAISS recomenda ao menos 39 pontos de treino por centroide.
+_MIN_POINTS_PER_CENTROID = 39
+_MIN_SQ8_TRAIN_POINTS = 1000
+# Amostra de treino padrao (PQ e SQ); IVF usa mais se tiver muitas listas.
+_TRAIN_SAMPLE_POINTS = 65536
+
+
+def _unwrap(index):
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def index_kind(index) -> str:
+    """Retorna o tipo ('flat', 'hnsw', 'ivf_flat' ou 'ivf_pq') de um índice."""
+    index = _unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(index, faiss.IndexIVF):
+        return 'ivf_flat'
+    return 'flat'
+
+
+def index_encoding(index) -> str:
+    """Retorna como os vetores sao guardados: 'float32', 'fp16', 'int8' ou 'pq'."""
+    index = _unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ, faiss.IndexHNSWPQ)):
+        return 'pq'
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return 'fp16' if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else 'int8'
+    return 'float32'
+
+
+def ivf_nlist(n: int) -> int:
+    """Numero de listas IVF para n vetores (RAG_IVF_NLIST ou ~4*sqrt(n))."""
+    if RAG_IVF_NLIST > 0:
+        return RAG_IVF_NLIST
+    return max(16, min(65536, int(4 * math.sqrt(n))))
+
+
+def choose_index_type(n: int) -> str:
+    """
+    Tipo de índice para um corpus de n vetores. Em 'auto' decide pelo
+    tamanho; tipos IVF caem para flat enquanto nao ha pontos para treinar.
+    """
+    kind = RAG_INDEX_TYPE
+    if kind == 'auto':
+        if n < RAG_HNSW_MIN_VECTORS:
+            kind = 'flat'
+        elif n < RAG_IVF_MIN_VECTORS:
+            kind = 'hnsw'
+        else:
+            kind = 'ivf_pq'
+    if kind.startswith('ivf') and n < ivf_nlist(n) * _MIN_POINTS_PER_CENTROID:
+        kind = 'flat'
+    return kind if kind in INDEX_TYPES else 'flat'
+
+
+def choose_encoding(kind: str, n: int) -> str:
+    """
+    Codificacao dos vetores para um índice do tipo kind com n vetores.
+    IVF-PQ e sempre 'pq'. Codificacoes treinadas ficam em float32 ate haver
+    pontos suficientes: PQ para os 256 centroides de cada subquantizador e
+    int8 para estimar a faixa de valores de cada dimensao.
+    """
+    if kind == 'ivf_pq':
+        return 'pq'
+    encoding = RAG_VECTOR_ENCODING if RAG_VECTOR_ENCODING in ENCODINGS else 'float32'
+    if encoding == 'pq' and n < 256 * _MIN_POINTS_PER_CENTROID:
+        return 'float32'
+    if encoding == 'int8' and n < _MIN_SQ8_TRAIN_POINTS:
+        return 'float32'
+    return encoding
+
+
+def choose_spec(n: int) -> tuple[str, str]:
+    """(tipo, codificacao) desejados para um corpus de n vetores."""
+    kind = choose_index_type(n)
+    return kind, choose_encoding(kind, n)
+
+
+def index_spec(index) -> tuple[str, str]:
+    """(tipo, codificacao) de um índice existente."""
+    return index_kind(index), index_encoding(index)
+
+
+def _pq_m(dim: int) -> int:
+    """Maior numero de subquantizadores <= RAG_PQ_M que divide a dimensao."""
+    m = max(1, min(RAG_PQ_M, dim))
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _training_sample(train_vectors: np.ndarray, nlist: int = 0) -> np.ndarray:
+    """
+    Amostra aleatoria de train_vectors para o treino: _TRAIN_SAMPLE_POINTS
+    vetores, ou _MIN_POINTS_PER_CENTROID por lista quando o IVF tem nlist
+    listas demais para isso, limitada ao total disponivel.
+    """
+    train_vectors = np.asarray(train_vectors, dtype=np.float32)
+    sample = min(len(train_vectors), max(_TRAIN_SAMPLE_POINTS, nlist * _MIN_POINTS_PER_CENTROID))
+    if sample < len(train_vectors):
+        rows = np.random.default_rng(0).choice(len(train_vectors), sample, replace=False)
+        train_vectors = train_vectors[rows]
+    return train_vectors
+
+
+def create_index(kind: str, encoding: str, dim: int, train_vectors: np.ndarray | None = None):
+    """
+    Cria um índice vazio do tipo e codificacao pedidos, treinado com
+    train_vectors quando preciso. Tipos IVF usam direct map em hashtable
+    (remocao e reconstrucao por id); os demais sao envolvidos em IndexIDMap2.
+    """
+    nlist = 0
+    if kind in ('ivf_flat', 'ivf_pq'):
+        nlist = ivf_nlist(len(train_vectors))
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == 'ivf_pq' or encoding == 'pq':
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim), 8)
+        elif encoding in _SQ_TYPES:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, _SQ_TYPES[encoding])
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    elif kind == 'hnsw':
+        if encoding == 'pq':
+            inner = faiss.IndexHNSWPQ(dim, _pq_m(dim), RAG_HNSW_M)
+        elif encoding in _SQ_TYPES:
+            inner = faiss.IndexHNSWSQ(dim, _SQ_TYPES[encoding], RAG_HNSW_M)
+        else:
+            inner = faiss.IndexHNSWFlat(dim, RAG_HNSW_M)
+        inner.hnsw.efConstruction = RAG_HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap2(inner)
+    elif encoding == 'pq':
+        index = faiss.IndexIDMap2(faiss.IndexPQ(dim, _pq_m(dim), 8))
+    elif encoding in _SQ_TYPES:
+        index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, _SQ_TYPES[encoding]))
+    else:
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+    if not index.is_trained:
+        index.train(_training_sample(train_vectors, nlist))
+    return index
+
+
+def supports_remove(index) -> bool:
+    """HNSW nao remove vetores: as remocoes viram tombstones ate a reconstrucao."""
+    return index_kind(index) != 'hnsw'
+
+
+def supports_selector(index) -> bool:
+    """IndexPQ (flat com PQ) rejeita SearchParameters com seletor (sel)."""
+    return not isinstance(_unwrap(index), faiss.IndexPQ)
+
+
+def stored_labels(index) -> np.ndarray:
+    """Rotulos de todos os vetores guardados (inclusive tombstones no HNSW)."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        return faiss.vector_to_array(index.id_map)
+    return np.empty(0, dtype=np.int64)
+
+
+def _search_params(kind: str, selector, k: int):
+    extra = {'sel': selector} if selector is not None else {}
+    if kind == 'hnsw':
+        return faiss.SearchParametersHNSW(efSearch=max(RAG_HNSW_EF_SEARCH, k), **extra)
+    if kind.startswith('ivf'):
+        return faiss.SearchParametersIVF(nprobe=RAG_IVF_NPROBE, **extra)
+    return faiss.SearchParameters(**extra) if extra else None
+
+
+def search(index, query, k: int, mask: np.ndarray | None = None,
+           vectors=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Busca os k vizinhos mais proximos de uma consulta. Com mask (bitmap
+    indexado por rotulo) so os rotulos marcados sao considerados.
+
+    `vectors` (FloatVectorFile com os vetores float32 por rotulo) torna as
+    distancias exatas em índices comprimidos: o índice seleciona
+    RAG_RERANK_FACTOR * k candidatos e eles sao reordenados com os vetores
+    originais. Retorna (distancias L2, rotulos), sem o preenchimento -1.
+    """
+    query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+    kind = index_kind(index)
+    lossy = index_encoding(index) != 'float32'
+    selector = None
+    if mask is not None:
+        labels = np.flatnonzero(mask)
+        k = min(k, len(labels))
+        if k == 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        if len(labels) <= EXACT_SEARCH_MAX_CANDIDATES:
+            return _exact_topk(index, query, labels, k, vectors)
+        if supports_selector(index):
+            packed = np.packbits(mask, bitorder='little')
+            selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(packed))
+    k = min(k, index.ntotal)
+    if k == 0:
+        return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+    fetch_k = min(k * RAG_RERANK_FACTOR, index.ntotal) if lossy and vectors is not None else k
+    if mask is not None and selector is None:
+        distances, labels = _search_post_filter(index, query, fetch_k, mask, kind)
+    else:
+        distances, labels = index.search(query, fetch_k, params=_search_params(kind, selector, fetch_k))
+        keep = labels[0] >= 0
+        distances, labels = distances[0][keep], labels[0][keep]
+    if fetch_k > k:
+        return _exact_topk(index, query, labels, k, vectors)
+    return distances, labels
+
+
+def _search_post_filter(index, query: np.ndarray, k: int, mask: np.ndarray,
+                        kind: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Busca sem seletor e filtra pelo mask depois (índices sem suporte a
+    seletor): busca k vizinhos divididos pela fracao de rotulos marcados e
+    dobra a busca ate achar k rotulos do mask ou percorrer o índice inteiro.
+    """
+    allowed = int(np.count_nonzero(mask))
+    k = min(k, allowed)
+    fetch = min(index.ntotal, 2 * math.ceil(k * index.ntotal / max(allowed, 1)))
+    while True:
+        distances, labels = index.search(query, fetch, params=_search_params(kind, None, fetch))
+        distances, labels = distances[0], labels[0]
+        keep = (labels >= 0) & (labels < len(mask))
+        keep[keep] = mask[labels[keep]]
+        if np.count_nonzero(keep) >= k or fetch >= index.ntotal:
+            return distances[keep][:k], labels[keep][:k]
+        fetch = min(fetch * 2, index.ntotal)
+
+
+def _exact_topk(index, query: np.ndarray, labels: np.ndarray, k: int,
+                vectors=None) -> tuple[np.ndarray, np.ndarray]:
+    """Top-k por distancia exata entre os rotulos candidatos."""
+    if vectors is not None:
+        candidates = vectors.read(labels)
+    else:
+        candidates = index.reconstruct_batch(labels)
+    distances = ((candidates - query) ** 2).sum(axis=1)
+    top = np.argsort(distances, kind='stable')[:k]
+    return distances[top], labels[top]
+
+
+def search_many(index, queries, ks: list[int], masks: list[np.ndarray | None],
+                vectors=None) -> list[tuple[np.ndarray, np.ndarray]]:
+    """
+    Busca varias consultas com uma unica chamada ao índice. Cada consulta tem
+    seu k e seu mask (ou None); a busca usa a uniao dos masks e os resultados
+    sao filtrados por consulta. Como a uniao contem cada mask, os primeiros
+    rotulos que passam no mask de uma consulta sao o top-k dela; se sobrarem
+    menos que k, a consulta e refeita sozinha com search(). Consultas cujo
+    mask cai no caminho exato de search() tambem sao feitas a parte.
+    """
+    queries = np.asarray(queries, dtype=np.float32).reshape(len(ks), -1)
+    kind = index_kind(index)
+    lossy = index_encoding(index) != 'float32'
+    rerank = lossy and vectors is not None
+    results: list[tuple[np.ndarray, np.ndarray] | None] = [None] * len(ks)
+    batch = []
+    for row, mask in enumerate(masks):
+        if mask is not None and np.count_nonzero(mask) <= EXACT_SEARCH_MAX_CANDIDATES:
+            results[row] = search(index, queries[row], ks[row], mask, vectors)
+        else:
+            batch.append(row)
+    if not batch:
+        return results
+
+    union = None
+    # Sem seletor, a busca e feita no índice todo e filtrada por consulta.
+    if supports_selector(index) and all(masks[row] is not None for row in batch):
+        union = np.logical_or.reduce([masks[row] for row in batch])
+    selector = None
+    candidates = index.ntotal
+    if union is not None:
+        candidates = int(np.count_nonzero(union))
+        packed = np.packbits(union, bitorder='little')
+        selector = faiss.IDSelectorBitmap(len(union), faiss.swig_ptr(packed))
+    wants = {row: ks[row] * RAG_RERANK_FACTOR if rerank else ks[row] for row in batch}
+    # Consultas com filtros diferentes disputam a mesma lista: busca mais fundo.
+    depth = len({None if masks[row] is None else id(masks[row]) for row in batch})
+    fetch_k = min(max(wants.values()) * depth, candidates)
+    if fetch_k > 0:
+        distances, labels = index.search(queries[batch], fetch_k,
+                                         params=_search_params(kind, selector, fetch_k))
+    for i, row in enumerate(batch):
+        mask, want = masks[row], wants[row]
+        if fetch_k <= 0:
+            results[row] = (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64))
+            continue
+        keep = labels[i] >= 0
+        if mask is not None:
+            keep &= mask[np.clip(labels[i], 0, len(mask) - 1)]
+        found_d, found_l = distances[i][keep][:want], labels[i][keep][:want]
+        available = candidates if mask is None else int(np.count_nonzero(mask))
+        if len(found_l) < min(want, available):
+            results[row] = search(index, queries[row], ks[row], mask, vectors)
+        elif want > ks[row]:
+            results[row] = _exact_topk(index, queries[row:row + 1], found_l, ks[row], vectors)
+        else:
+            results[row] = (found_d, found_l)
+    return results
+
+
+class FaissBackend(VectorBackend):
+    """
+    Backend vetorial (vector_store.py) sobre um índice FAISS. Aberto
+    memory-mapped e somente leitura: a primeira escrita troca-o por uma copia
+    em memoria (prepare_write). Nos tipos IVF o FAISS le as listas invertidas
+    para a memoria mesmo com o mmap.
+    """
+
+    name = 'faiss'
+
+    def __init__(self, index, vectors: FloatVectorFile, mmap_path: Path | None = None) -> None:
+        super().__init__(vectors, index.d)
+        self.index = index
+        self._mmap_path = mmap_path
+
+    @classmethod
+    def open(cls, directory: Path, vectors: FloatVectorFile, dim: int) -> 'FaissBackend':
+        path = Path(directory) / INDEX_FILE
+        if not path.exists():
+            raise FileNotFoundError(f'{path} nao encontrado')
+        index = faiss.read_index(str(path), _MMAP_FLAGS)
+        if index.d != dim:
+            raise ValueError(f'{path} tem dimensao {index.d}, o manifesto {dim}')
+        return cls(index, vectors, path)
+
+    def save(self, directory: Path) -> None:
+        if self._mmap_path is not None:
+            return  # nada escrito desde a abertura
+        path = Path(directory) / INDEX_FILE
+        tmp_path = path.with_suffix('.tmp')
+        faiss.write_index(self.index, str(tmp_path))
+        os.replace(tmp_path, path)
+
+    def prepare_write(self) -> None:
+        if self._mmap_path is not None:
+            self.index = faiss.read_index(str(self._mmap_path))
+            self._mmap_path = None
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def spec(self) -> tuple[str, str]:
+        return index_spec(self.index)
+
+    def add(self, labels: np.ndarray, vectors: np.ndarray) -> None:
+        self.index.add_with_ids(vectors, np.asarray(labels, dtype=np.int64))
+
+    def remove(self, labels: np.ndarray) -> bool:
+        if not supports_remove(self.index):
+            return False
+        self.index.remove_ids(np.asarray(labels, dtype=np.int64))
+        return True
+
+    def stored_labels(self) -> np.ndarray:
+        return stored_labels(self.index)
+
+    def reconstruct(self, labels: np.ndarray) -> np.ndarray:
+        return self.index.reconstruct_batch(np.asarray(labels, dtype=np.int64))
+
+    def nbytes(self) -> int:
+        return faiss.serialize_index(self.index).nbytes
+
+    def search(self, query, k: int, mask: np.ndarray | None = None,
+               rerank: bool = True) -> tuple[np.ndarray, np.ndarray]:
+        return search(self.index, query, k, mask, self.vectors if rerank else None)
+
+    def search_many(self, queries, ks: list[int],
+                    masks: list[np.ndarray | None]) -> list[tuple[np.ndarray, np.ndarray]]:
+        return search_many(self.index, queries, ks, masks, self.vectors)
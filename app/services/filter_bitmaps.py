@@ -0,0 +1,125 @@
+"""
+filter_bitmaps.py
+Bitmaps de filtro mantidos ao lado do índice FAISS: para cada tag e cada
+source_type, um vetor booleano indexado pelo rotulo (label) interno do
+documento no índice. Permitem restringir a busca FAISS (IDSelectorBitmap)
+aos candidatos do filtro e obter o top-k exato dentro dele. Sao salvos
+compactados (1 bit por rotulo) em filters.npz junto com o índice, para que a
+abertura nao precise reler o docstore.
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def _tags_of(metadata: dict) -> list[str]:
+    return [t for t in metadata.get('tags', '').split('|') if t]
+
+
+class FilterBitmaps:
+    """
+    Bitmaps tag -> rotulos e source_type -> rotulos, mais o bitmap `live`
+    dos rotulos em uso (rotulos removidos nunca sao reaproveitados).
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.live = np.zeros(0, dtype=bool)
+        self.tags: dict[str, np.ndarray] = {}
+        self.source_types: dict[str, np.ndarray] = {}
+
+    def _bitmap(self, bitmaps: dict[str, np.ndarray], key: str) -> np.ndarray:
+        if key not in bitmaps:
+            bitmaps[key] = np.zeros(len(self.live), dtype=bool)
+        return bitmaps[key]
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self.live)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+
+        def grown(bits: np.ndarray) -> np.ndarray:
+            return np.concatenate([bits, np.zeros(capacity - len(bits), dtype=bool)])
+
+        self.live = grown(self.live)
+        for bitmaps in (self.tags, self.source_types):
+            for key, bits in bitmaps.items():
+                bitmaps[key] = grown(bits)
+
+    def add(self, labels: list[int], metadatas: list[dict]) -> None:
+        """Registra documentos novos com seus rotulos."""
+        if not labels:
+            return
+        self._grow(max(labels) + 1)
+        for label, metadata in zip(labels, metadatas):
+            self.live[label] = True
+            for tag in _tags_of(metadata):
+                self._bitmap(self.tags, tag)[label] = True
+            self._bitmap(self.source_types, metadata.get('source_type', ''))[label] = True
+
+    def remove(self, labels: list[int]) -> None:
+        """Desmarca os rotulos removidos em todos os bitmaps."""
+        labels = [label for label in labels if label < len(self.live)]
+        if not labels:
+            return
+        self.live[labels] = False
+        for bitmaps in (self.tags, self.source_types):
+            for bits in bitmaps.values():
+                bits[labels] = False
+
+    def mask(self, source_type: str = '', tags: list[str] | None = None) -> np.ndarray:
+        """Rotulos que passam no filtro: QUALQUER uma das tags E o source_type."""
+        if tags:
+            mask = np.zeros(len(self.live), dtype=bool)
+            for tag in tags:
+                if tag in self.tags:
+                    mask |= self.tags[tag]
+        else:
+            mask = self.live.copy()
+        if source_type:
+            bits = self.source_types.get(source_type)
+            if bits is None:
+                return np.zeros(len(self.live), dtype=bool)
+            mask &= bits
+        return mask
+
+    def save(self, path: str | Path, token: str) -> None:
+        """Grava os bitmaps (1 bit por rotulo) com o token do commit do docstore."""
+        path = Path(path)
+        arrays = {'token': np.array(token), 'size': np.array(len(self.live)),
+                  'live': np.packbits(self.live)}
+        for prefix, bitmaps in (('tag', self.tags), ('source', self.source_types)):
+            names = list(bitmaps)
+            arrays[f'{prefix}_names'] = np.array(names, dtype=str)
+            arrays[f'{prefix}_bits'] = np.array([np.packbits(bitmaps[name]) for name in names],
+                                                dtype=np.uint8).reshape(len(names), (len(self.live) + 7) // 8)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str | Path, token: str | None) -> bool:
+        """
+        Le os bitmaps salvos por save(). Retorna False (sem alterar nada) se o
+        arquivo falta, esta ilegivel ou e de outro commit do docstore.
+        """
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if token is None or str(data['token']) != token:
+                    return False
+                size = int(data['size'])
+                live = np.unpackbits(data['live'], count=size).astype(bool)
+                loaded = []
+                for prefix in ('tag', 'source'):
+                    bits = np.unpackbits(data[f'{prefix}_bits'], axis=1, count=size).astype(bool)
+                    loaded.append(dict(zip(data[f'{prefix}_names'].tolist(), bits)))
+        except (OSError, KeyError, ValueError):
+            return False
+        self.live = live
+        self.tags, self.source_types = loaded
+        return True
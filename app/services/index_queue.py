@@ -0,0 +1,214 @@
+"""
+index_queue.py
+Fila de indexacao em background para o vector store.
+As escritas de notas so enfileiram ids; uma thread worker agrupa os ids em
+lotes, aplica cada lote ao índice e salva o índice no disco depois de um
+intervalo sem alteracoes (debounce). Lotes que falham voltam para a fila com
+espera exponencial (backoff).
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Espera maxima entre novas tentativas de um lote que falhou (segundos).
+_MAX_BACKOFF = 60.0
+
+
+class IndexingQueue:
+    """
+    Fila de ids de notas com uma unica thread worker.
+
+    apply_batch(note_ids) aplica um lote ao índice e persist() salva o índice.
+    Ids repetidos enquanto pendentes sao coalescidos: o worker le o estado
+    atual da nota no momento de aplicar o lote. Se apply_batch levanta
+    excecao, os ids do lote sao reagendados apos retry_backoff * 2^(n-1)
+    segundos (ate _MAX_BACKOFF) e descartados na tentativa max_attempts.
+    """
+
+    def __init__(self, apply_batch: Callable[[list[str]], None], persist: Callable[[], None],
+                 batch_size: int = 64, batch_wait: float = 0.05,
+                 persist_debounce: float = 2.0, retry_backoff: float = 1.0,
+                 max_attempts: int = 5) -> None:
+        self.apply_batch = apply_batch
+        self.persist = persist
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.persist_debounce = persist_debounce
+        self.retry_backoff = retry_backoff
+        self.max_attempts = max(1, max_attempts)
+        self._pending: OrderedDict[str, float] = OrderedDict()  # id -> instante do enqueue
+        # Ids de lotes que falharam: id -> (instante da nova tentativa, do enqueue).
+        self._retrying: dict[str, tuple[float, float]] = {}
+        self._attempts: dict[str, int] = {}
+        self._in_flight = 0
+        self._in_flight_since = 0.0
+        self._dirty = False
+        self._last_change = 0.0
+        self._flush_waiters = 0
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+        self.retried = 0
+        self.dropped = 0
+
+    # -- worker -------------------------------------------------------------
+    def _ensure_worker(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='index-queue', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush, 10.0)
+
+    def _next_batch(self) -> list[str]:
+        """Bloqueia ate haver um lote a aplicar; lista vazia significa 'salvar o índice'."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                retry_wait = self._release_retries(now)
+                if self._pending:
+                    oldest = next(iter(self._pending.values()))
+                    wait = oldest + self.batch_wait - now
+                    if len(self._pending) >= self.batch_size or wait <= 0 or self._flush_waiters:
+                        batch = []
+                        while self._pending and len(batch) < self.batch_size:
+                            note_id, _ = self._pending.popitem(last=False)
+                            batch.append(note_id)
+                        self._in_flight = len(batch)
+                        self._in_flight_since = oldest
+                        return batch
+                    self._cond.wait(wait)
+                elif self._dirty:
+                    wait = self._last_change + self.persist_debounce - now
+                    if wait <= 0 or self._flush_waiters:
+                        return []
+                    self._cond.wait(wait if retry_wait is None else min(wait, retry_wait))
+                else:
+                    self._cond.wait(retry_wait)
+
+    def _release_retries(self, now: float) -> float | None:
+        """
+        Devolve a _pending os ids cuja espera terminou (chamar com _cond).
+        Retorna os segundos ate a proxima nova tentativa, ou None.
+        """
+        for note_id, (ready, since) in list(self._retrying.items()):
+            if ready <= now:
+                del self._retrying[note_id]
+                self._pending.setdefault(note_id, since)
+        if not self._retrying:
+            return None
+        return min(ready for ready, _ in self._retrying.values()) - now
+
+    def _schedule_retry(self, batch: list[str], since: float) -> None:
+        """Reagenda os ids de um lote que falhou (chamar com _cond)."""
+        now = time.monotonic()
+        for note_id in batch:
+            attempts = self._attempts.get(note_id, 0) + 1
+            if attempts >= self.max_attempts:
+                self._attempts.pop(note_id, None)
+                self.dropped += 1
+                logger.error('Nota %s nao indexada apos %d tentativas; fica para o '
+                             'proximo ensure_index', note_id, attempts)
+                continue
+            self._attempts[note_id] = attempts
+            if note_id in self._pending:
+                continue  # reenfileirada enquanto o lote rodava
+            delay = min(self.retry_backoff * 2 ** (attempts - 1), _MAX_BACKOFF)
+            self._retrying[note_id] = (now + delay, since)
+            self.retried += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch:
+                failed = False
+                try:
+                    self.apply_batch(batch)
+                except Exception as e:
+                    logger.error('Falha ao indexar lote de %d notas: %s', len(batch), e)
+                    self.errors += 1
+                    failed = True
+                with self._cond:
+                    if failed:
+                        self._schedule_retry(batch, self._in_flight_since)
+                    else:
+                        for note_id in batch:
+                            self._attempts.pop(note_id, None)
+                        self.processed += len(batch)
+                    self._in_flight = 0
+                    # Mesmo um lote que falhou pode ter alterado parte do índice.
+                    self._dirty = True
+                    self._last_change = time.monotonic()
+                    self.batches += 1
+                    self._cond.notify_all()
+            else:
+                try:
+                    self.persist()
+                except Exception as e:
+                    logger.error('Falha ao salvar o índice: %s', e)
+                    self.errors += 1
+                with self._cond:
+                    self._dirty = False
+                    self._cond.notify_all()
+
+    # -- API ----------------------------------------------------------------
+    def enqueue(self, note_ids: list[str]) -> None:
+        """Agenda a (re)indexacao das notas; retorna imediatamente."""
+        now = time.monotonic()
+        with self._cond:
+            for note_id in note_ids:
+                retry = self._retrying.pop(note_id, None)
+                self._pending.setdefault(note_id, now if retry is None else retry[1])
+            self._ensure_worker()
+            self._cond.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Aplica tudo o que estiver pendente e salva o índice sem esperar o
+        debounce (mas esperando as novas tentativas de lotes que falharam).
+        Retorna False se o timeout expirar antes disso.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            try:
+                while self._pending or self._in_flight or self._dirty or self._retrying:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flush_waiters -= 1
+
+    def stats(self) -> dict:
+        """Retorna profundidade da fila, atraso (lag) do item mais antigo e contadores."""
+        with self._cond:
+            now = time.monotonic()
+            if self._in_flight:
+                oldest = self._in_flight_since
+            elif self._pending:
+                oldest = next(iter(self._pending.values()))
+            else:
+                oldest = None
+            if self._retrying:
+                since = min(since for _, since in self._retrying.values())
+                oldest = since if oldest is None else min(oldest, since)
+            return {
+                'depth': len(self._pending) + self._in_flight + len(self._retrying),
+                'lag_seconds': now - oldest if oldest is not None else 0.0,
+                'processed': self.processed,
+                'batches': self.batches,
+                'errors': self.errors,
+                'retrying': len(self._retrying),
+                'retried': self.retried,
+                'dropped': self.dropped,
+                'unsaved_changes': self._dirty,
+            }
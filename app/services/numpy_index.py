@@ -0,0 +1,120 @@
+"""
+numpy_index.py
+Motor de busca exata em NumPy sobre os vetores float32 memory-mapped do
+rag_service (vectors.f32): um produto matriz-vetor por busca, sem índice
+FAISS em memoria nem em disco. Para corpora pequenos e medios evita ler,
+treinar e salvar um índice; o custo da busca cresce com o numero de vetores.
+"""
+
+import numpy as np
+
+from app.services.vector_file import FloatVectorFile
+
+# Normas calculadas em blocos ao abrir, para nao copiar o arquivo inteiro.
+_NORM_BLOCK_ROWS = 65536
+# Com ate tantos candidatos no filtro, a busca le so as linhas deles em vez
+# de multiplicar o arquivo inteiro.
+SUBSET_MAX_CANDIDATES = 4096
+
+
+def _fit(bits: np.ndarray, size: int) -> np.ndarray:
+    """bits cortado ou completado com False ate `size` posicoes."""
+    if len(bits) >= size:
+        return bits[:size]
+    return np.concatenate([bits, np.zeros(size - len(bits), dtype=bool)])
+
+
+class NumpyIndex:
+    """
+    Índice por rotulo sobre um FloatVectorFile (add_with_ids, remove_ids,
+    reconstruct_batch, ntotal, d), usado pelo NumpyBackend de
+    vector_store.py. Os vetores sao gravados no arquivo pelo proprio
+    rag_service; aqui ficam so os rotulos presentes e as normas.
+    """
+
+    def __init__(self, vectors: FloatVectorFile, dim: int) -> None:
+        self.vectors = vectors
+        self.d = dim
+        self.present = np.zeros(0, dtype=bool)
+        self.norms = np.zeros(0, dtype=np.float32)
+
+    @property
+    def ntotal(self) -> int:
+        return int(np.count_nonzero(self.present))
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self.present)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        self.present = _fit(self.present, capacity)
+        self.norms = np.concatenate([self.norms, np.zeros(capacity - len(self.norms), dtype=np.float32)])
+
+    def add_with_ids(self, vectors: np.ndarray, labels: np.ndarray) -> None:
+        labels = np.asarray(labels, dtype=np.int64)
+        if not len(labels):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._grow(int(labels.max()) + 1)
+        self.present[labels] = True
+        self.norms[labels] = (vectors ** 2).sum(axis=1)
+
+    def restore(self, labels) -> None:
+        """Marca rotulos ja gravados no arquivo (abertura de um índice salvo)."""
+        labels = np.asarray(labels, dtype=np.int64)
+        if len(labels) and labels.max() >= self.vectors.rows:
+            raise IndexError(f'rotulo {labels.max()} alem das {self.vectors.rows} linhas do arquivo')
+        for start in range(0, len(labels), _NORM_BLOCK_ROWS):
+            block = labels[start:start + _NORM_BLOCK_ROWS]
+            self.add_with_ids(self.vectors.read(block), block)
+
+    def remove_ids(self, labels: np.ndarray) -> int:
+        labels = np.asarray(labels, dtype=np.int64)
+        labels = labels[labels < len(self.present)]
+        removed = int(np.count_nonzero(self.present[labels]))
+        self.present[labels] = False
+        return removed
+
+    def reconstruct_batch(self, labels) -> np.ndarray:
+        return self.vectors.read(labels)
+
+    def labels(self) -> np.ndarray:
+        return np.flatnonzero(self.present)
+
+    def search_many(self, queries, ks: list[int],
+                    masks: list[np.ndarray | None]) -> list[tuple[np.ndarray, np.ndarray]]:
+        """
+        Top-k exato de cada consulta, com um unico produto de matrizes sobre o
+        arquivo; cada consulta tem o seu k e o seu mask (ou None). Consultas
+        com poucos candidatos no mask leem so as linhas deles.
+        Retorna (distancias L2, rotulos) por consulta.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(len(ks), -1)
+        empty = (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64))
+        rows = min(len(self.present), self.vectors.rows)
+        if rows == 0:
+            return [empty] * len(ks)
+        distances = None
+        results = []
+        for col, (k, mask) in enumerate(zip(ks, masks)):
+            allowed = self.present[:rows] if mask is None else self.present[:rows] & _fit(mask, rows)
+            candidates = np.flatnonzero(allowed)
+            k = min(k, len(candidates))
+            if k == 0:
+                results.append(empty)
+                continue
+            query = queries[col]
+            if mask is not None and len(candidates) <= SUBSET_MAX_CANDIDATES:
+                found = self.norms[candidates] - 2 * (self.vectors.read(candidates) @ query) + query @ query
+            else:
+                if distances is None:
+                    scores = self.vectors.view(rows) @ queries.T
+                    distances = self.norms[:rows, None] - 2 * scores + (queries ** 2).sum(axis=1)[None, :]
+                found = distances[candidates, col]
+            top = np.argpartition(found, k - 1)[:k] if k < len(found) else np.arange(len(found))
+            top = top[np.argsort(found[top], kind='stable')]
+            results.append((np.maximum(found[top], 0), candidates[top]))
+        return results
+
+    def search(self, query, k: int, mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        return self.search_many(query, [k], [mask])[0]
@@ -0,0 +1,190 @@
+"""
+onnx_embeddings.py
+Backend opcional de embeddings com ONNX Runtime: o modelo do
+sentence-transformers exportado para ONNX e quantizado em int8 (pesos),
+lido de um diretorio local com model.onnx e tokenizer.json. A inferencia
+em CPU dispensa o PyTorch. Requer o pacote onnxruntime (e onnx, para
+exportar), que nao faz parte do requirements.txt; export_model gera o
+diretorio a partir do modelo PyTorch e check_parity compara os embeddings
+dos dois backends (tests/test_onnx_embeddings.py).
+"""
+
+import json
+import logging
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from tokenizers import Tokenizer
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = 'model.onnx'
+TOKENIZER_FILE = 'tokenizer.json'
+# Gravado pelo sentence-transformers com o limite de tokens do modelo.
+_CONFIG_FILE = 'sentence_bert_config.json'
+_DEFAULT_MAX_LENGTH = 256
+# Similaridade de cosseno minima com o PyTorch para aceitar o modelo int8.
+PARITY_MIN_COSINE = 0.99
+
+
+def _import_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise RuntimeError(
+            'o backend ONNX de embeddings requer o pacote onnxruntime '
+            '(pip install onnxruntime; para exportar, tambem onnx)'
+        ) from e
+    return onnxruntime
+
+
+def _read_json(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Embeddings de um modelo ONNX exportado por export_model: mean pooling
+    dos tokens (pela attention mask) seguido de normalizacao L2, como o
+    all-MiniLM-L6-v2 no sentence-transformers. Consultas e documentos usam
+    o mesmo encode.
+    """
+
+    def __init__(self, model_dir: str | Path, batch_size: int = 32, threads: int = 0) -> None:
+        ort = _import_onnxruntime()
+        self.model_dir = Path(model_dir)
+        self.batch_size = batch_size
+        model_path = self.model_dir / MODEL_FILE
+        tokenizer_path = self.model_dir / TOKENIZER_FILE
+        for path in (model_path, tokenizer_path):
+            if not path.exists():
+                raise FileNotFoundError(f'{path} nao encontrado; gere o diretorio com export_model')
+
+        max_length = _read_json(self.model_dir / _CONFIG_FILE).get('max_seq_length', _DEFAULT_MAX_LENGTH)
+        pad_token = _read_json(self.model_dir / 'tokenizer_config.json').get('pad_token', '[PAD]')
+        self._tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        self._tokenizer.enable_truncation(max_length)
+        pad_id = self._tokenizer.token_to_id(pad_token)
+        self._tokenizer.enable_padding(pad_id=pad_id or 0, pad_token=pad_token)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(
+            str(model_path), options, providers=['CPUExecutionProvider'],
+        )
+        self._inputs = {i.name for i in self._session.get_inputs()}
+
+    def _encode_batch(self, texts: list[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feed = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': mask,
+        }
+        if 'token_type_ids' in self._inputs:
+            feed['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self._session.run(None, feed)[0]
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        # Lotes de textos de tamanho parecido: menos padding por lote.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: list[list[float] | None] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            for i, vector in zip(rows, self._encode_batch([texts[i] for i in rows])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+def export_model(model_name: str, model_dir: str | Path, quantize: bool = True) -> Path:
+    """
+    Exporta o modelo sentence-transformers para ONNX em model_dir (modelo,
+    tokenizer e limite de tokens) e, com quantize, quantiza os pesos em int8
+    (quantizacao dinamica do onnxruntime). Usa o PyTorch so aqui.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model_dir = Path(model_dir)
+    model_dir.mkdir(parents=True, exist_ok=True)
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer = model[0].auto_model.eval()
+    model.tokenizer.save_pretrained(str(model_dir))
+    with open(model_dir / _CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'max_seq_length': model.max_seq_length}, f)
+
+    sample = model.tokenizer(['exemplo'], return_tensors='pt')
+    names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    axes = {name: {0: 'batch', 1: 'tokens'} for name in names}
+    axes['last_hidden_state'] = {0: 'batch', 1: 'tokens'}
+    fp32_path = model_dir / ('model.fp32.onnx' if quantize else MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in names),
+            str(fp32_path),
+            input_names=names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=axes,
+            opset_version=17,
+            dynamo=False,
+        )
+    if quantize:
+        _import_onnxruntime()
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(fp32_path), str(model_dir / MODEL_FILE), weight_type=QuantType.QInt8)
+        fp32_path.unlink()
+    logger.info('Modelo %s exportado para %s', model_name, model_dir)
+    return model_dir
+
+
+def check_parity(candidate: Embeddings, reference: Embeddings, texts: list[str],
+                 min_cosine: float = PARITY_MIN_COSINE) -> dict:
+    """
+    Compara os embeddings de candidate (ex: ONNX int8) com os de reference
+    (ex: PyTorch) nos mesmos textos e mede a vazao de cada um.
+
+    Returns:
+        dict com:
+            'texts': int - Textos comparados.
+            'min_cosine' / 'mean_cosine': float - Similaridade de cosseno por texto.
+            'passed': bool - min_cosine >= o minimo pedido.
+            'candidate_texts_per_s' / 'reference_texts_per_s': float - Vazao.
+            'speedup': float - Vazao do candidate sobre a do reference.
+    """
+    if not texts:
+        return {}
+    timings = []
+    matrices = []
+    for model in (candidate, reference):
+        start = time.perf_counter()
+        matrices.append(np.asarray(model.embed_documents(texts), dtype=np.float32))
+        timings.append(max(time.perf_counter() - start, 1e-9))
+    a, b = matrices
+    cosine = (a * b).sum(axis=1) / np.maximum(
+        np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+    return {
+        'texts': len(texts),
+        'min_cosine': float(cosine.min()),
+        'mean_cosine': float(cosine.mean()),
+        'passed': bool(cosine.min() >= min_cosine),
+        'candidate_texts_per_s': len(texts) / timings[0],
+        'reference_texts_per_s': len(texts) / timings[1],
+        'speedup': timings[1] / timings[0],
+    }
@@ -0,0 +1,111 @@
+"""
+query_batcher.py
+Micro-batching do embedding de consultas. Buscas concorrentes (threads do
+run.io_bound de varias sessoes) entregam a pergunta a uma thread worker,
+que espera alguns milissegundos por outras perguntas e codifica o grupo em
+uma unica chamada ao modelo.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingQuery:
+    __slots__ = ('text', 'vector', 'error', 'done')
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.vector: list[float] | None = None
+        self.error: Exception | None = None
+        self.done = threading.Event()
+
+
+class QueryBatcher:
+    """
+    Agrupa consultas concorrentes em lotes de ate max_batch, esperando no
+    maximo max_wait segundos desde a primeira consulta do lote.
+
+    encode_batch(texts) devolve um vetor por texto. Com max_batch <= 1 cada
+    consulta e codificada direto na thread que chamou encode().
+    """
+
+    def __init__(self, encode_batch: Callable[[list[str]], list[list[float]]],
+                 max_batch: int = 32, max_wait: float = 0.005) -> None:
+        self.encode_batch = encode_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: list[_PendingQuery] = []
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self.queries = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    # -- worker -------------------------------------------------------------
+    def _ensure_worker(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='query-batcher', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self) -> list[_PendingQuery]:
+        """Bloqueia ate haver consultas; espera max_wait (ou o lote encher) e retorna o lote."""
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            try:
+                vectors = self.encode_batch([item.text for item in batch])
+                for item, vector in zip(batch, vectors):
+                    item.vector = vector
+            except Exception as e:
+                logger.error('Falha ao codificar lote de %d consultas: %s', len(batch), e)
+                for item in batch:
+                    item.error = e
+            with self._cond:
+                self.queries += len(batch)
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, len(batch))
+            for item in batch:
+                item.done.set()
+
+    # -- API ----------------------------------------------------------------
+    def encode(self, text: str) -> list[float]:
+        """Retorna o embedding da consulta (bloqueia ate o lote dela ser codificado)."""
+        if self.max_batch <= 1:
+            return self.encode_batch([text])[0]
+        item = _PendingQuery(text)
+        with self._cond:
+            self._pending.append(item)
+            self._ensure_worker()
+            self._cond.notify_all()
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        return item.vector
+
+    def stats(self) -> dict:
+        """Retorna consultas codificadas, lotes, tamanho medio e maior lote."""
+        with self._cond:
+            return {
+                'queries': self.queries,
+                'batches': self.batches,
+                'mean_batch': self.queries / self.batches if self.batches else 0.0,
+                'largest_batch': self.largest_batch,
+                'pending': len(self._pending),
+            }
@@ -4,18 +4,59 @@ RAG (Retrieval-Augmented Generation) service para o Knowledge OS.
 Usa LangChain com FAISS para armazenamento vetorial e OpenAI para geracao.
 """
 
+import json
 import logging
+import os
+import threading
+import time
+import uuid
 from pathlib import Path
 
-from langchain_community.vectorstores import FAISS
+import numpy as np
 from langchain_core.documents import Document
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from app.config import (
     FAISS_INDEX_DIR,
     EMBEDDING_MODEL_NAME,
+    EMBEDDING_BACKEND,
+    EMBEDDING_ONNX_DIR,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_MAX_MB,
+    RAG_QUERY_CACHE_SIZE,
+    RAG_RESULT_CACHE_SIZE,
+    RAG_QUERY_BATCH_SIZE,
+    RAG_QUERY_BATCH_WAIT_MS,
+    INDEX_BATCH_SIZE,
+    INDEX_BATCH_WAIT_MS,
+    INDEX_PERSIST_DEBOUNCE_S,
+    INDEX_RETRY_BACKOFF_S,
+    INDEX_RETRY_MAX_ATTEMPTS,
+    RAG_TAG_PARTITIONS,
+    RAG_CHUNK_SIZE,
+    RAG_CHUNK_OVERLAP,
+    RAG_CHUNK_FETCH_FACTOR,
     RAG_TOP_K,
+    RAG_CONTEXT_MAX_TOKENS,
 )
+from app.services.embedding_cache import (
+    CachedEmbeddings,
+    EmbeddingCache,
+    QueryEmbeddingCache,
+    normalize_query,
+    text_key,
+)
+from app.services.onnx_embeddings import OnnxEmbeddings, check_parity
+from app.services import vector_store
+from app.services.filter_bitmaps import FilterBitmaps
+from app.services.tag_partitions import TagPartitions
+from app.services.index_queue import IndexingQueue
+from app.services.vector_file import FloatVectorFile
+from app.services.doc_store import DocStore
+from app.services.result_cache import ResultCache
+from app.services.query_batcher import QueryBatcher
+from app.services.context_packer import pack_context
 
 logger = logging.getLogger(__name__)
 
@@ -23,56 +64,224 @@ logger = logging.getLogger(__name__)
 # Estado do modulo (inicializacao lazy)
 # ---------------------------------------------------------------------------
 _embeddings = None
-_vectorstore = None
+# Identifica os vetores no manifesto e no cache persistente: os do modelo
+# int8 no ONNX Runtime nao se misturam aos do PyTorch.
+_EMBEDDING_ID = f'{EMBEDDING_MODEL_NAME}@onnx-int8' if EMBEDDING_BACKEND == 'onnx' else EMBEDDING_MODEL_NAME
+# Embeddings de consultas recentes (LRU em memoria).
+_query_cache = QueryEmbeddingCache(RAG_QUERY_CACHE_SIZE)
+# Backend vetorial (vector_store.VectorBackend): FAISS ou NumPy.
+_index = None
+_index_loaded = False
 _initialized = False
+# Incrementada a cada escrita no índice; faz parte da chave do cache de
+# resultados, que assim nunca devolve uma busca anterior a uma escrita.
+_index_version = 0
+_result_cache = ResultCache(RAG_RESULT_CACHE_SIZE)
+# manifest.json liga o índice ao docstore.db: backend ('faiss' ou 'numpy'),
+# modelo de embeddings e o token do ultimo commit do docstore. Se nao conferem, o índice em disco e
+# descartado e reconstruido.
+MANIFEST_VERSION = 4
+# Documentos indexados (texto, metadados e hash) por rotulo, em SQLite.
+_docstore = DocStore(Path(FAISS_INDEX_DIR) / 'docstore.db')
+# Notas longas sao indexadas em trechos (chunks), um vetor por trecho.
+_splitter = RecursiveCharacterTextSplitter(chunk_size=RAG_CHUNK_SIZE, chunk_overlap=RAG_CHUNK_OVERLAP)
+# Rotulos (labels) estaveis dos trechos no índice; os de cada nota ficam no
+# docstore (DocStore.labels_of). Os rotulos nunca sao reaproveitados; o HNSW
+# nao remove vetores, entao as remocoes nele viram tombstones ate a proxima
+# reconstrucao do índice.
+_next_label = 0
+_tombstones = 0
+# Reconstroi o HNSW quando os tombstones passam desta fracao do índice.
+_MAX_TOMBSTONE_RATIO = 0.2
+# Bitmaps tag/source_type -> rotulos do índice, para busca filtrada; salvos
+# em filters.npz para abrir o índice sem reler o docstore.
+_filters = FilterBitmaps()
+# Vetores float32 originais por rotulo, em disco (re-ranking exato de
+# índices comprimidos e recriacao do índice sem perda).
+_vectors = FloatVectorFile(Path(FAISS_INDEX_DIR) / 'vectors.f32')
+# Sub-índices por tag (so quando RAG_TAG_PARTITIONS esta ativo).
+_partitions = TagPartitions() if RAG_TAG_PARTITIONS else None
+# Protege o índice: buscas (threads do run.io_bound) e escritas
+# incrementais nao podem se intercalar.
+_lock = threading.RLock()
 
 
 # ---------------------------------------------------------------------------
 # Funcoes internas
 # ---------------------------------------------------------------------------
+def _torch_embeddings() -> HuggingFaceEmbeddings:
+    """O modelo de embeddings no sentence-transformers (PyTorch, CPU)."""
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs={'normalize_embeddings': True},
+    )
+
+
 def _get_embeddings():
-    """Retorna a instancia compartilhada de HuggingFaceEmbeddings."""
+    """
+    Retorna a instancia compartilhada de embeddings (HuggingFaceEmbeddings ou,
+    com EMBEDDING_BACKEND='onnx', OnnxEmbeddings), envolvida pelo cache
+    persistente de embeddings quando EMBEDDING_CACHE_MAX_MB > 0.
+    """
     global _embeddings
     if _embeddings is None:
         try:
-            _embeddings = HuggingFaceEmbeddings(
-                model_name=EMBEDDING_MODEL_NAME,
-                model_kwargs={'device': 'cpu'},
-                encode_kwargs={'normalize_embeddings': True},
-            )
+            if EMBEDDING_BACKEND == 'onnx':
+                embeddings = OnnxEmbeddings(EMBEDDING_ONNX_DIR)
+            else:
+                embeddings = _torch_embeddings()
+            if EMBEDDING_CACHE_MAX_MB > 0:
+                cache = EmbeddingCache(
+                    EMBEDDING_CACHE_DIR,
+                    _EMBEDDING_ID,
+                    EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+                )
+                embeddings = CachedEmbeddings(embeddings, cache)
+            _embeddings = embeddings
         except Exception as e:
             logger.error('Falha ao carregar modelo de embeddings: %s', e)
             raise RuntimeError(
-                f'não foi possivel carregar o modelo "{EMBEDDING_MODEL_NAME}". '
-                f'Verifique se sentence-transformers esta instalado. Erro: {e}'
+                f'não foi possivel carregar o modelo "{_EMBEDDING_ID}". '
+                f'Verifique se sentence-transformers (ou onnxruntime, no backend ONNX) '
+                f'esta instalado. Erro: {e}'
             ) from e
     return _embeddings
 
 
-def _get_vectorstore():
-    """Retorna a instancia compartilhada do FAISS vectorstore, carregando do disco se existir."""
-    global _vectorstore
-    if _vectorstore is None:
-        embeddings = _get_embeddings()
-        index_path = Path(FAISS_INDEX_DIR)
-        if (index_path / 'index.faiss').exists():
-            _vectorstore = FAISS.load_local(
-                FAISS_INDEX_DIR,
-                embeddings,
-                allow_dangerous_deserialization=True,
-            )
-            logger.info('índice FAISS carregado de %s', FAISS_INDEX_DIR)
+def _encode_queries(texts: list[str]) -> list[list[float]]:
+    """
+    Embeddings de um lote de consultas em uma chamada ao modelo. Consultas nao
+    passam pelo cache persistente (so documentos indexados ficam nele).
+    """
+    model = _get_embeddings()
+    if isinstance(model, CachedEmbeddings):
+        model = model.embeddings
+    # Sem query_encode_kwargs, o embed_query do HuggingFace e o mesmo encode
+    # do embed_documents, que aceita o lote inteiro.
+    if isinstance(model, HuggingFaceEmbeddings) and not model.query_encode_kwargs:
+        return model.embed_documents(texts)
+    if isinstance(model, OnnxEmbeddings):
+        return model.embed_documents(texts)
+    return [model.embed_query(text) for text in texts]
+
+
+_query_batcher = QueryBatcher(
+    _encode_queries,
+    max_batch=RAG_QUERY_BATCH_SIZE,
+    max_wait=RAG_QUERY_BATCH_WAIT_MS / 1000,
+)
+
+
+def _embed_query(question: str) -> list[float]:
+    """Embedding da pergunta, consultando antes o cache de consultas."""
+    vector = _query_cache.get(_EMBEDDING_ID, question)
+    if vector is None:
+        vector = _query_batcher.encode(question)
+        _query_cache.put(_EMBEDDING_ID, question, vector)
+    return vector
+
+
+def _embed_queries(questions: list[str]) -> list[list[float]]:
+    """Embeddings de varias perguntas; as que nao estao no cache vao em um unico lote."""
+    vectors = [_query_cache.get(_EMBEDDING_ID, question) for question in questions]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        encoded = _encode_queries([questions[i] for i in missing])
+        for i, vector in zip(missing, encoded):
+            _query_cache.put(_EMBEDDING_ID, questions[i], vector)
+            vectors[i] = vector
+    return vectors
+
+
+def _manifest_path() -> Path:
+    return Path(FAISS_INDEX_DIR) / 'manifest.json'
+
+
+def _filters_path() -> Path:
+    return Path(FAISS_INDEX_DIR) / 'filters.npz'
+
+
+def _read_manifest() -> dict | None:
+    """
+    Le o manifesto; None se ausente, ilegivel, de outro modelo de embeddings
+    ou de outro commit do docstore.
+    """
+    path = _manifest_path()
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning('Manifesto do índice ilegivel: %s', e)
+        return None
+    if (
+        data.get('version') != MANIFEST_VERSION
+        or data.get('model') != _EMBEDDING_ID
+        or data.get('token') is None
+        or data.get('token') != _docstore.token()
+    ):
+        return None
+    return data
+
+
+def _get_index():
+    """
+    Retorna o índice compartilhado. Na primeira chamada abre o índice salvo
+    pelo backend do manifesto (vector_store.open_backend) e recalcula os
+    indices auxiliares a partir do docstore. Um índice sem manifesto valido,
+    ou que nao abre, e descartado.
+    """
+    global _index, _index_loaded
+    if not _index_loaded:
+        _index_loaded = True
+        manifest = _read_manifest()
+        if manifest is not None:
+            try:
+                _vectors.open(manifest['dim'])
+                _index = vector_store.open_backend(manifest['backend'], Path(FAISS_INDEX_DIR),
+                                                   _vectors, manifest['dim'])
+                _rebuild_side_indexes()
+                logger.info('índice %s (%s/%s) aberto de %s',
+                            _index.name, *_index.spec, FAISS_INDEX_DIR)
+            except (KeyError, ValueError, IndexError, OSError, RuntimeError) as e:
+                # Ex: index.faiss ausente ou vectors.f32 mais curto que o docstore.
+                logger.warning('índice em %s ilegivel (%s), sera reconstruido', FAISS_INDEX_DIR, e)
+                _clear_index()
+        elif any((Path(FAISS_INDEX_DIR) / f).exists()
+                 for f in ('index.faiss', 'index.pkl', 'manifest.json')):
+            logger.info('índice em %s sem manifesto valido, sera reconstruido', FAISS_INDEX_DIR)
+            _clear_index()
         else:
-            logger.info('Nenhum índice FAISS encontrado, sera criado no primeiro uso')
-    return _vectorstore
+            logger.info('Nenhum índice encontrado, sera criado no primeiro uso')
+    return _index
 
 
-def _save_vectorstore():
-    """Persiste o vectorstore FAISS no disco."""
-    if _vectorstore is not None:
-        Path(FAISS_INDEX_DIR).parent.mkdir(parents=True, exist_ok=True)
-        _vectorstore.save_local(FAISS_INDEX_DIR)
-        logger.info('índice FAISS salvo em %s', FAISS_INDEX_DIR)
+def _save_index():
+    """
+    Persiste o índice, o docstore e o manifesto no disco. O docstore e
+    confirmado primeiro: uma queda antes do manifesto deixa os tokens
+    diferentes e o índice e reconstruido na proxima inicializacao.
+    """
+    if _index is None:
+        return
+    token = uuid.uuid4().hex
+    _docstore.commit(token)
+    _vectors.flush()
+    _index.save(Path(FAISS_INDEX_DIR))
+    _filters.save(_filters_path(), token)
+    tmp_path = _manifest_path().with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'version': MANIFEST_VERSION,
+            'model': _EMBEDDING_ID,
+            'token': token,
+            'backend': _index.name,
+            'dim': _index.dim,
+        }, f)
+    os.replace(tmp_path, _manifest_path())
+    logger.info('índice %s salvo em %s', _index.name, FAISS_INDEX_DIR)
 
 
 def _build_document(note: dict) -> Document:
@@ -91,88 +300,538 @@ def _build_document(note: dict) -> Document:
     return Document(page_content=page_content, metadata=metadata)
 
 
+def _split_document(doc: Document) -> list[Document]:
+    """
+    Divide o documento de uma nota em trechos que cabem na janela do modelo de
+    embeddings; cada trecho leva os metadados da nota e o seu numero ('chunk').
+    """
+    if len(doc.page_content) <= RAG_CHUNK_SIZE:
+        texts = [doc.page_content]
+    else:
+        texts = _splitter.split_text(doc.page_content)
+    return [Document(page_content=text, metadata={**doc.metadata, 'chunk': i})
+            for i, text in enumerate(texts)]
+
+
+def _chunk_documents(docs: list[Document]) -> tuple[list[Document], list[str]]:
+    """Trechos de varias notas e, para cada trecho, o hash da nota de origem."""
+    chunks, hashes = [], []
+    for doc in docs:
+        doc_chunks = _split_document(doc)
+        chunks.extend(doc_chunks)
+        hashes.extend([_document_hash(doc)] * len(doc_chunks))
+    return chunks, hashes
+
+
+def _live_labels() -> np.ndarray:
+    """Rotulos de todos os trechos no índice (sem tombstones), em ordem."""
+    return np.flatnonzero(_filters.live)
+
+
+def _has_documents() -> bool:
+    return bool(_filters.live.any())
+
+
+def _reset_side_indexes() -> None:
+    global _next_label, _tombstones
+    _next_label = 0
+    _tombstones = 0
+    _filters.reset()
+    if _partitions is not None:
+        _partitions.reset()
+
+
+def _rebuild_side_indexes() -> None:
+    """
+    Restaura os indices auxiliares de um índice aberto: os bitmaps de filtro
+    vem de filters.npz (ou, se ele falta ou e de outro commit, das colunas de
+    filtro do docstore) e as particoes por tag sao montadas sob demanda.
+    """
+    global _next_label, _tombstones
+    _reset_side_indexes()
+    if _index is None:
+        return
+    if not _filters.load(_filters_path(), _docstore.token()):
+        rows = _docstore.label_rows()
+        _filters.add([label for label, _, _, _ in rows],
+                     [{'source_type': source_type, 'tags': tags} for _, _, source_type, tags in rows])
+    labels = _live_labels()
+    _index.restore(labels)
+    stored = _index.stored_labels()
+    _next_label = max(int(stored.max()) if stored.size else -1, _docstore.max_label()) + 1
+    _tombstones = _index.ntotal - len(labels)
+    if len(labels) and _vectors.rows <= labels[-1]:
+        # Índice salvo sem o arquivo de vetores: preenche a partir do índice.
+        _vectors.write(labels, _index.reconstruct(labels))
+    if _partitions is not None:
+        _partitions.reset(_partition_source)
+
+
+def _partition_source(tag: str) -> tuple[np.ndarray, np.ndarray]:
+    """Rotulos e vetores da tag, para montar a particao dela sob demanda."""
+    bits = _filters.tags.get(tag)
+    labels = np.flatnonzero(bits) if bits is not None else np.empty(0, dtype=np.int64)
+    return labels, _vectors.read(labels)
+
+
+def _document_hash(doc: Document) -> str:
+    """Hash do conteudo e dos metadados de um documento (detecta notas alteradas)."""
+    metadata = json.dumps(doc.metadata, sort_keys=True, ensure_ascii=False)
+    return text_key(f'{doc.page_content}\0{metadata}')
+
+
+def _bump_index_version() -> None:
+    """Invalida os resultados em cache (chamar com _lock a cada escrita)."""
+    global _index_version
+    _index_version += 1
+    _result_cache.clear()
+
+
+def _clear_index() -> None:
+    """Descarta o índice e remove os arquivos dele (docstore incluso) do disco."""
+    global _index
+    _bump_index_version()
+    _index = None
+    _reset_side_indexes()
+    _vectors.close()
+    _docstore.reset()
+    index_path = Path(FAISS_INDEX_DIR)
+    # index.pkl e o docstore pickle dos índices salvos pelo LangChain.
+    for f in ('index.faiss', 'index.pkl', 'manifest.json', 'vectors.f32', 'filters.npz'):
+        fpath = index_path / f
+        if fpath.exists():
+            fpath.unlink()
+
+
+def _new_index(docs: list[Document], hashes: list[str], vectors: np.ndarray) -> None:
+    """Cria um índice novo, do tipo indicado para o tamanho do corpus, com os trechos."""
+    global _index
+    _index = vector_store.create_backend(vector_store.choose_spec(len(docs)), vectors.shape[1],
+                                         _vectors, vectors)
+    _reset_side_indexes()
+    _vectors.reset(vectors.shape[1])
+    _docstore.reset()
+    _insert_documents(docs, hashes, vectors)
+
+
+def _insert_documents(docs: list[Document], hashes: list[str], vectors: np.ndarray) -> None:
+    """
+    Adiciona trechos com rotulos novos ao índice, ao docstore e aos indices
+    auxiliares; hashes traz o hash da nota de cada trecho.
+    """
+    global _next_label
+    _index.prepare_write()
+    _bump_index_version()
+    labels = list(range(_next_label, _next_label + len(docs)))
+    _next_label += len(docs)
+    metadatas = [doc.metadata for doc in docs]
+    _index.add(np.array(labels, dtype=np.int64), vectors)
+    _vectors.write(labels, vectors)
+    _docstore.add(labels, docs, hashes)
+    _filters.add(labels, metadatas)
+    if _partitions is not None:
+        _partitions.add(labels, metadatas, vectors)
+
+
+def _reindex(spec: tuple[str, str]) -> None:
+    """
+    Recria o índice com o (tipo, codificacao) pedido a partir dos vetores
+    float32 em disco (sem re-embedar); os rotulos sao mantidos e os
+    tombstones descartados.
+    """
+    global _index, _tombstones
+    labels = _live_labels()
+    vectors = _vectors.read(labels)
+    index = vector_store.create_backend(spec, vectors.shape[1], _vectors, vectors)
+    index.add(labels, vectors)
+    _bump_index_version()
+    _index = index
+    _tombstones = 0
+    logger.info('índice recriado como %s/%s com %d vetores', *spec, len(labels))
+
+
 def _rebuild_index(notes: list[dict]) -> None:
     """Reconstroi o índice FAISS do zero a partir de uma lista de notas."""
-    global _vectorstore
     if not notes:
-        _vectorstore = None
-        # Limpar arquivos do índice se existirem
-        index_path = Path(FAISS_INDEX_DIR)
-        for f in ('index.faiss', 'index.pkl'):
-            fpath = index_path / f
-            if fpath.exists():
-                fpath.unlink()
+        _clear_index()
+        return
+
+    chunks, hashes = _chunk_documents([_build_document(note) for note in notes])
+    vectors = np.asarray(
+        _get_embeddings().embed_documents([chunk.page_content for chunk in chunks]),
+        dtype=np.float32,
+    )
+    # Sem manifesto, uma queda antes do save abaixo forca outra reconstrucao
+    # (o arquivo de vetores ja tera os rotulos novos).
+    _manifest_path().unlink(missing_ok=True)
+    _new_index(chunks, hashes, vectors)
+    _save_index()
+
+
+def _remove_from_index(note_ids: list[str]) -> list[str]:
+    """
+    Remove os vetores dos trechos das notas e suas entradas no docstore.
+    Retorna os ids que de fato estavam no índice.
+    """
+    global _tombstones
+    if _get_index() is None:
+        return []
+    indexed = _docstore.labels_of(note_ids)
+    present = [nid for nid in note_ids if nid in indexed]
+    if present:
+        _index.prepare_write()
+        _bump_index_version()
+        labels = [label for nid in present for label in indexed[nid]]
+        if not _index.remove(np.array(labels, dtype=np.int64)):
+            _tombstones += len(labels)
+        _docstore.delete(labels)
+        _filters.remove(labels)
+        if _partitions is not None:
+            _partitions.remove(labels)
+        if _has_documents() and _tombstones > _MAX_TOMBSTONE_RATIO * _index.ntotal:
+            _reindex(_index.spec)
+    return present
+
+
+def _add_documents(docs: list[Document], hashes: list[str],
+                   vectors: list[list[float]] | None = None) -> None:
+    """
+    Adiciona trechos ao índice (criando-o se preciso). Sem `vectors`, os
+    trechos sao embedados aqui, em um unico lote. Quando o corpus
+    cresce o bastante para outro tipo de índice (ex: IVF ja treinavel), o
+    índice e recriado com ele.
+    """
+    if vectors is None:
+        vectors = _get_embeddings().embed_documents([doc.page_content for doc in docs])
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if _get_index() is None:
+        _new_index(docs, hashes, vectors)
         return
+    _insert_documents(docs, hashes, vectors)
+    wanted = vector_store.choose_spec(len(_live_labels()))
+    # So "sobe" de tipo durante as escritas; trocas para tipos mais simples
+    # (corpus que encolheu) ficam para o ensure_index da proxima inicializacao.
+    if vector_store.spec_rank(wanted) > vector_store.spec_rank(_index.spec):
+        _reindex(wanted)
+
+
+def _reconcile_index(notes: list[dict]) -> tuple[int, int]:
+    """
+    Aplica ao índice carregado so as diferencas em relacao ao storage, usando
+    os hashes do docstore. Retorna (documentos removidos, documentos (re)embedados).
+    """
+    docs = {note['id']: _build_document(note) for note in notes}
+    hashes = {note_id: _document_hash(doc) for note_id, doc in docs.items()}
+    indexed = _docstore.hashes()
+    stale = [nid for nid, h in indexed.items() if hashes.get(nid) != h]
+    fresh = [nid for nid, h in hashes.items() if indexed.get(nid) != h]
+    if stale:
+        _remove_from_index(stale)
+    if fresh:
+        _add_documents(*_chunk_documents([docs[nid] for nid in fresh]))
+    if stale or fresh:
+        _persist_after_change()
+    return len(stale), len(fresh)
+
+
+def _persist_after_change() -> None:
+    """Salva o índice, ou remove os arquivos se ele ficou vazio."""
+    if _index is not None and not _has_documents():
+        _clear_index()
+    else:
+        _save_index()
+
 
-    embeddings = _get_embeddings()
-    docs = [_build_document(note) for note in notes]
-    ids = [note['id'] for note in notes]
-    _vectorstore = FAISS.from_documents(docs, embeddings, ids=ids)
-    _save_vectorstore()
+def _apply_index_batch(note_ids: list[str]) -> None:
+    """
+    Aplica um lote da fila de indexacao: le o estado atual de cada nota,
+    embeda as existentes fora do lock e troca os vetores antigos pelos novos.
+    """
+    from app.storage import get_note
+
+    notes = [note for note in (get_note(note_id) for note_id in note_ids) if note]
+    chunks, hashes = _chunk_documents([_build_document(note) for note in notes])
+    vectors = _get_embeddings().embed_documents([c.page_content for c in chunks]) if chunks else []
+    with _lock:
+        _remove_from_index(note_ids)
+        if chunks:
+            _add_documents(chunks, hashes, vectors)
+
+
+def _persist_index() -> None:
+    with _lock:
+        _persist_after_change()
+
+
+_index_queue = IndexingQueue(
+    _apply_index_batch,
+    _persist_index,
+    batch_size=INDEX_BATCH_SIZE,
+    batch_wait=INDEX_BATCH_WAIT_MS / 1000,
+    persist_debounce=INDEX_PERSIST_DEBOUNCE_S,
+    retry_backoff=INDEX_RETRY_BACKOFF_S,
+    max_attempts=INDEX_RETRY_MAX_ATTEMPTS,
+)
 
 
 # ---------------------------------------------------------------------------
 # Gerenciamento do índice
 # ---------------------------------------------------------------------------
+def embedding_cache_stats() -> dict:
+    """Retorna as estatisticas do cache de embeddings (vazio se desativado)."""
+    embeddings = _embeddings
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.cache.stats()
+    return {}
+
+
+def query_cache_stats() -> dict:
+    """Retorna hits, misses e ocupacao do cache de embeddings de consultas."""
+    return _query_cache.stats()
+
+
+def query_batcher_stats() -> dict:
+    """Retorna consultas codificadas, lotes e tamanho medio dos lotes de consultas."""
+    return _query_batcher.stats()
+
+
+def result_cache_stats() -> dict:
+    """Retorna hits, misses e ocupacao do cache de resultados do retrieve()."""
+    return _result_cache.stats()
+
+
+def benchmark_index(queries: int = 200, top_k: int = RAG_TOP_K) -> dict:
+    """
+    Mede o índice atual: latencia p50/p99 das buscas, bytes por vetor e
+    recall@k contra a busca exata nos vetores float32 em disco, com e sem o
+    re-ranking. As consultas sao vetores indexados escolhidos ao acaso.
+    """
+    with _lock:
+        index = _get_index()
+        if index is None or not _has_documents():
+            return {}
+        labels = _live_labels()
+        matrix = _vectors.read(labels)
+        sample = np.random.default_rng(0).choice(len(labels), min(queries, len(labels)), replace=False)
+        mask = _filters.live if _tombstones else None
+        k = min(top_k, len(labels))
+        latencies, hits, hits_no_rerank = [], 0, 0
+        for row in sample:
+            query = matrix[row]
+            distances = ((matrix - query) ** 2).sum(axis=1)
+            exact = set(labels[np.argsort(distances, kind='stable')[:k]].tolist())
+            start = time.perf_counter()
+            _, found = index.search(query, k, mask)
+            latencies.append((time.perf_counter() - start) * 1000)
+            _, found_no_rerank = index.search(query, k, mask, rerank=False)
+            hits += len(exact & set(found.tolist()))
+            hits_no_rerank += len(exact & set(found_no_rerank.tolist()))
+        kind, encoding = index.spec
+        result = {
+            'index_type': kind,
+            'encoding': encoding,
+            'vectors': len(labels),
+            'bytes_per_vector': index.nbytes() / max(index.ntotal, 1),
+            'float32_bytes_per_vector': index.dim * 4,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'recall_at_k': hits / (len(sample) * k),
+            'recall_at_k_no_rerank': hits_no_rerank / (len(sample) * k),
+        }
+    logger.info('Benchmark do índice: %s', result)
+    return result
+
+
+def check_embedding_parity(samples: int = 200) -> dict:
+    """
+    Compara o modelo ONNX int8 (EMBEDDING_ONNX_DIR) com o mesmo modelo no
+    PyTorch em trechos indexados escolhidos ao acaso: similaridade de
+    cosseno minima e media (aceito com >= 0.99) e vazao de cada backend.
+    """
+    with _lock:
+        labels = _live_labels() if _get_index() is not None else np.empty(0, dtype=np.int64)
+        if len(labels):
+            sample = np.random.default_rng(0).choice(len(labels), min(samples, len(labels)), replace=False)
+            texts = [doc.page_content for doc in _docstore.get_many(labels[np.sort(sample)].tolist())]
+        else:
+            texts = []
+    if not texts:
+        return {}
+    result = check_parity(OnnxEmbeddings(EMBEDDING_ONNX_DIR), _torch_embeddings(), texts)
+    logger.info('Paridade dos embeddings ONNX: %s', result)
+    return result
+
+
 def ensure_index() -> int:
     """
     Reconcilia o vector store com as notas atuais no storage.
-    Reconstroi o índice completo para garantir consistencia.
+    Se o índice em disco tem um manifesto valido (mesmo modelo de embeddings),
+    aplica so as inclusoes, alteracoes e exclusoes; senao reconstroi tudo.
     Retorna o numero de documentos no índice.
     """
     global _initialized
     from app.storage import load_notes
 
     notes = load_notes()
-    _rebuild_index(notes)
-    _initialized = True
-    logger.info('índice FAISS reconciliado com %d notas', len(notes))
+    with _lock:
+        if _get_index() is None:
+            _rebuild_index(notes)
+            logger.info('índice FAISS reconstruido com %d notas', len(notes))
+        else:
+            removed, embedded = _reconcile_index(notes)
+            logger.info(
+                'índice FAISS reconciliado com %d notas (%d removidas, %d embedadas)',
+                len(notes), removed, embedded,
+            )
+            # RAG_INDEX_TYPE ou o tamanho do corpus podem pedir outro tipo de índice.
+            wanted = vector_store.choose_spec(len(_live_labels()))
+            if _index is not None and wanted != _index.spec:
+                _reindex(wanted)
+                _save_index()
+        _initialized = True
     return len(notes)
 
 
 def add_note(note: dict) -> None:
-    """Adiciona uma nota ao vector store."""
-    global _vectorstore
-    try:
-        embeddings = _get_embeddings()
-        doc = _build_document(note)
-        if _vectorstore is None:
-            _vectorstore = FAISS.from_documents([doc], embeddings, ids=[note['id']])
-        else:
-            _vectorstore.add_documents([doc], ids=[note['id']])
-        _save_vectorstore()
-        logger.info('Nota %s adicionada ao vector store', note['id'])
-    except Exception as e:
-        logger.error('Falha ao adicionar nota ao vector store: %s', e)
+    """Agenda a indexacao de uma nota nova (aplicada em background)."""
+    _index_queue.enqueue([note['id']])
 
 
 def update_note(note_id: str, note: dict) -> None:
-    """Atualiza uma nota no vector store (reconstroi o índice)."""
-    try:
-        from app.storage import load_notes
-        notes = load_notes()
-        _rebuild_index(notes)
-        logger.info('Nota %s atualizada no vector store (índice reconstruido)', note_id)
-    except Exception as e:
-        logger.error('Falha ao atualizar nota no vector store: %s', e)
+    """Agenda a troca do vetor de uma nota editada (aplicada em background)."""
+    _index_queue.enqueue([note_id])
 
 
 def delete_note(note_id: str) -> None:
-    """Remove uma nota do vector store (reconstroi o índice)."""
-    try:
-        from app.storage import load_notes
-        notes = load_notes()
-        _rebuild_index(notes)
-        logger.info('Nota %s removida do vector store (índice reconstruido)', note_id)
-    except Exception as e:
-        logger.error('Falha ao remover nota do vector store: %s', e)
+    """Agenda a remocao de uma nota do vector store (aplicada em background)."""
+    _index_queue.enqueue([note_id])
+
+
+def index_notes(note_ids: list[str]) -> None:
+    """Agenda a (re)indexacao de varias notas, ex: apos uma importacao em massa."""
+    _index_queue.enqueue(note_ids)
+
+
+def index_queue_stats() -> dict:
+    """Retorna profundidade, lag (segundos) e contadores da fila de indexacao."""
+    return _index_queue.stats()
+
+
+def flush_index(timeout: float | None = None) -> bool:
+    """
+    Espera a fila de indexacao esvaziar e salva o índice no disco.
+    Retorna False se o timeout expirar antes.
+    """
+    return _index_queue.flush(timeout)
 
 
 # ---------------------------------------------------------------------------
 # Recuperacao de notas (sem geracao LLM)
 # ---------------------------------------------------------------------------
+def _search_documents(index, query_embedding: list[float], top_k: int, source_type: str,
+                      tags: list[str] | None) -> list[list[Document]]:
+    """
+    Top-k notas da busca vetorial (chamar com _lock). Filtros restringem a
+    busca aos rotulos marcados nos bitmaps de tag/source_type; uma busca
+    por uma unica tag usa a particao da tag quando RAG_TAG_PARTITIONS esta
+    ativo. A busca e feita sobre trechos e agrupada por nota (_fetch_notes).
+    """
+    search, candidates = _chunk_search(index, query_embedding, source_type, tags)
+    return _fetch_notes(search, top_k, candidates)
+
+
+def _search_documents_many(index, query_embeddings: list[list[float]],
+                           specs: list[tuple]) -> list[list[list[Document]]]:
+    """
+    Versao em lote de _search_documents (chamar com _lock): as consultas sem
+    particao vao em uma unica chamada ao índice, cada uma com o seu filtro;
+    so as que precisarem aprofundar a busca sao refeitas uma a uma.
+    specs traz (question, source_type, tags, top_k, max_tokens) por consulta.
+    """
+    found: list[list[int] | None] = [None] * len(specs)
+    rows, ks, masks = [], [], []
+    for row, (_, source_type, tags, top_k, _) in enumerate(specs):
+        k = top_k * RAG_CHUNK_FETCH_FACTOR
+        if _use_partition(source_type, tags):
+            found[row] = _partitions.search(tags[0], query_embeddings[row], k)
+        else:
+            rows.append(row)
+            ks.append(k)
+            masks.append(_query_mask(source_type, tags))
+    if rows:
+        queries = [query_embeddings[row] for row in rows]
+        for row, (_, labels) in zip(rows, index.search_many(queries, ks, masks)):
+            found[row] = labels.tolist()
+    results = []
+    for row, (labels, (_, source_type, tags, top_k, _)) in enumerate(zip(found, specs)):
+        search, candidates = _chunk_search(index, query_embeddings[row], source_type, tags)
+        results.append(_fetch_notes(search, top_k, candidates, labels))
+    return results
+
+
+def _chunk_search(index, query_embedding: list[float], source_type: str,
+                  tags: list[str] | None) -> tuple:
+    """
+    (search, candidates) de uma consulta: search(k) devolve os rotulos dos k
+    trechos mais proximos dentro do filtro, entre `candidates` trechos.
+    """
+    if _use_partition(source_type, tags):
+        tag = tags[0]
+        return (lambda k: _partitions.search(tag, query_embedding, k)), _partitions.size(tag)
+    mask = _query_mask(source_type, tags)
+    candidates = index.ntotal if mask is None else int(np.count_nonzero(mask))
+
+    def search(k: int) -> list[int]:
+        return index.search(query_embedding, k, mask)[1].tolist()
+    return search, candidates
+
+
+def _fetch_notes(search, top_k: int, candidates: int,
+                 labels: list[int] | None = None) -> list[list[Document]]:
+    """
+    Busca top_k * RAG_CHUNK_FETCH_FACTOR trechos e agrupa nas top_k notas
+    (_group_chunks). Uma nota longa pode ocupar todos os trechos buscados:
+    enquanto faltarem notas e houver candidatos, a busca e refeita com k
+    dobrado. labels traz o resultado da primeira busca, se ja feita.
+    """
+    k = top_k * RAG_CHUNK_FETCH_FACTOR
+    while True:
+        if labels is None:
+            labels = search(k)
+        groups = _group_chunks(_docstore.get_many(labels), top_k)
+        if len(groups) >= top_k or len(labels) < k or k >= candidates:
+            return groups
+        k = min(k * 2, candidates)
+        labels = None
+
+
+def _use_partition(source_type: str, tags: list[str] | None) -> bool:
+    """Buscas por uma unica tag (sem source_type) usam a particao da tag, se houver."""
+    return _partitions is not None and not source_type and bool(tags) and len(tags) == 1
+
+
+def _query_mask(source_type: str, tags: list[str] | None) -> np.ndarray | None:
+    """Bitmap dos rotulos que passam no filtro (None: todos os vetores do índice)."""
+    if source_type or tags:
+        return _filters.mask(source_type, tags)
+    return _filters.live if _tombstones else None
+
+
+def _group_chunks(chunks: list[Document], top_k: int) -> list[list[Document]]:
+    """
+    Agrupa trechos (em ordem de relevancia) nas top_k notas, ordenadas pelo
+    seu melhor trecho; os trechos de cada nota ficam em ordem de relevancia.
+    """
+    by_note: dict[str, list[Document]] = {}
+    for chunk in chunks:
+        note_id = chunk.metadata['note_id']
+        if note_id in by_note or len(by_note) < top_k:
+            by_note.setdefault(note_id, []).append(chunk)
+    return list(by_note.values())
+
+
 def retrieve(question: str, source_type: str = '', tags: list[str] | None = None,
-             top_k: int = RAG_TOP_K) -> dict:
+             top_k: int = RAG_TOP_K, max_tokens: int = RAG_CONTEXT_MAX_TOKENS) -> dict:
     """
     Recupera notas relevantes da base de conhecimento sem chamar o LLM.
 
@@ -181,68 +840,95 @@ def retrieve(question: str, source_type: str = '', tags: list[str] | None = None
         source_type: Filtro opcional por tipo de fonte (ex: 'livro', 'video').
         tags: Filtro opcional por tags (notas que contenham QUALQUER uma das tags).
         top_k: Numero de documentos a recuperar.
+        max_tokens: Orcamento de tokens do contexto; as notas menos relevantes
+                    ficam de fora e os trechos sao cortados para caber nele.
 
     Returns:
         dict com:
             'context': str - Contexto formatado das notas encontradas.
-            'sources': list[dict] - Metadados das notas recuperadas.
+            'sources': list[dict] - Metadados das notas que entraram no contexto.
+            'tokens': int - Tokens usados pelo contexto.
     """
     global _initialized
     if not _initialized:
         ensure_index()
 
-    vs = _get_vectorstore()
-    if vs is None:
-        return {'context': '', 'sources': []}
-
-    has_filter = bool(source_type or tags)
-    fetch_k = top_k * 3 if has_filter else top_k
+    key = _result_key(question, source_type, tags, top_k, max_tokens)
+    cached = _result_cache.get((_index_version, *key))
+    if cached is not None:
+        return cached
 
     try:
-        results = vs.similarity_search(question, k=fetch_k)
+        # O embedding da pergunta fica fora do lock para nao serializar buscas.
+        query_embedding = _embed_query(question)
+        with _lock:
+            version = _index_version
+            index = _get_index()
+            if index is None:
+                return {'context': '', 'sources': [], 'tokens': 0}
+            results = _search_documents(index, query_embedding, top_k, source_type, tags)
     except Exception as e:
         logger.error('Falha na busca vetorial: %s', e)
-        return {'context': '', 'sources': []}
-
-    if has_filter:
-        filtered = []
-        for doc in results:
-            meta = doc.metadata
-            if source_type and meta.get('source_type', '') != source_type:
-                continue
-            if tags:
-                doc_tags = meta.get('tags', '')
-                if not any(f'|{t}|' in doc_tags for t in tags):
-                    continue
-            filtered.append(doc)
-        results = filtered[:top_k]
-    else:
-        results = results[:top_k]
-
-    if not results:
-        return {'context': '', 'sources': []}
-
-    context_parts = []
-    sources = []
-    for i, doc in enumerate(results, 1):
-        meta = doc.metadata
-        context_parts.append(
-            f"[Nota {i}] Titulo: {meta.get('title', 'Sem titulo')}\n"
-            f"Fonte: {meta.get('source_name', 'N/A')} ({meta.get('source_type', '')})\n"
-            f"Autor: {meta.get('source_author', 'N/A')}\n"
-            f"Tags: {meta.get('tags', '').replace('|', ', ').strip(', ')}\n"
-            f"Conteudo:\n{doc.page_content}\n"
-        )
-        raw_tags = meta.get('tags', '')
-        parsed_tags = [t for t in raw_tags.split('|') if t]
-        sources.append({
-            'note_id': meta.get('note_id', ''),
-            'title': meta.get('title', ''),
-            'source_type': meta.get('source_type', ''),
-            'source_name': meta.get('source_name', ''),
-            'source_author': meta.get('source_author', ''),
-            'tags': parsed_tags,
-        })
-
-    context = '\n---\n'.join(context_parts)
-    return {'context': context, 'sources': sources}
+        return {'context': '', 'sources': [], 'tokens': 0}
+
+    result = pack_context(results, max_tokens)
+    _result_cache.put((version, *key), result)
+    return result
+
+
+def retrieve_many(queries: list[dict]) -> list[dict]:
+    """
+    Varias buscas de uma vez (ex: varias chamadas da ferramenta no mesmo
+    round): as perguntas sao embedadas em um unico lote e buscadas com uma
+    unica chamada ao índice, cada uma com os seus filtros.
+
+    Args:
+        queries: dicts com 'question' e, opcionais, 'source_type', 'tags',
+                 'top_k' e 'max_tokens' (os parametros de retrieve()).
+
+    Returns:
+        O resultado de retrieve() de cada consulta, na mesma ordem.
+    """
+    global _initialized
+    if not _initialized:
+        ensure_index()
+
+    specs = [(
+        query['question'],
+        query.get('source_type', ''),
+        query.get('tags'),
+        query.get('top_k', RAG_TOP_K),
+        query.get('max_tokens', RAG_CONTEXT_MAX_TOKENS),
+    ) for query in queries]
+    keys = [_result_key(*spec) for spec in specs]
+    results = [_result_cache.get((_index_version, *key)) for key in keys]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+
+    try:
+        query_embeddings = _embed_queries([specs[i][0] for i in pending])
+        with _lock:
+            version = _index_version
+            index = _get_index()
+            if index is None:
+                groups = None
+            else:
+                groups = _search_documents_many(index, query_embeddings, [specs[i] for i in pending])
+    except Exception as e:
+        logger.error('Falha na busca vetorial em lote: %s', e)
+        groups = None
+
+    for n, i in enumerate(pending):
+        if groups is None:
+            results[i] = {'context': '', 'sources': [], 'tokens': 0}
+        else:
+            results[i] = pack_context(groups[n], specs[i][4])
+            _result_cache.put((version, *keys[i]), results[i])
+    return results
+
+
+def _result_key(question: str, source_type: str, tags: list[str] | None, top_k: int,
+                max_tokens: int) -> tuple:
+    """Chave do cache de resultados (sem a versao do índice)."""
+    return normalize_query(question), source_type, tuple(sorted(set(tags or []))), top_k, max_tokens
@@ -0,0 +1,51 @@
+"""
+result_cache.py
+Cache LRU em memoria dos resultados de retrieve(). A chave inclui a versao
+do índice, incrementada a cada escrita, de modo que um resultado nunca e
+servido depois de uma inclusao, alteracao ou remocao de nota.
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+from typing import Hashable
+
+from app.services.cache_stats import CacheStats
+
+
+class ResultCache(CacheStats):
+    """LRU chave -> resultado; devolve copias para que o chamador possa alterá-las."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> dict | None:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return copy.deepcopy(result)
+
+    def put(self, key: Hashable, result: dict) -> None:
+        if self.max_entries <= 0:
+            return
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _occupancy(self) -> tuple[int, int]:
+        return len(self._entries), self.max_entries
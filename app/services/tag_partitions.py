@@ -0,0 +1,106 @@
+"""
+tag_partitions.py
+Sub-índices FAISS por tag: um IndexFlatL2 pequeno para cada tag, mantido
+junto com o índice global. Uma busca restrita a uma unica tag consulta so a
+particao dela, com resultado exato e custo proporcional ao tamanho da tag.
+Ao abrir um índice salvo, as particoes sao montadas sob demanda, na primeira
+busca por cada tag, a partir dos vetores em disco (reset com `source`).
+"""
+
+from typing import Callable
+
+import numpy as np
+
+
+def _tags_of(metadata: dict) -> list[str]:
+    return [t for t in metadata.get('tags', '').split('|') if t]
+
+
+class _Partition:
+    def __init__(self, dim: int) -> None:
+        import faiss
+
+        self.index = faiss.IndexFlatL2(dim)
+        self.labels: list[int] = []  # posicao no sub-índice -> rotulo no índice global
+
+
+class TagPartitions:
+    """Particoes tag -> (IndexFlatL2, rotulos), atualizadas incrementalmente."""
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self, source: Callable[[str], tuple[np.ndarray, np.ndarray]] | None = None) -> None:
+        """
+        Descarta as particoes. Com source(tag) -> (rotulos, vetores), as
+        particoes de um índice ja existente sao montadas sob demanda.
+        """
+        self.partitions: dict[str, _Partition] = {}
+        self.label_tags: dict[int, list[str]] = {}
+        self._source = source
+        self._loaded: set[str] = set()
+
+    def _is_lazy(self, tag: str) -> bool:
+        """Particao ainda nao montada a partir de source."""
+        return self._source is not None and tag not in self._loaded
+
+    def _partition(self, tag: str) -> _Partition | None:
+        if self._is_lazy(tag):
+            self._loaded.add(tag)
+            labels, vectors = self._source(tag)
+            if len(labels):
+                self._extend(tag, [int(label) for label in labels], np.asarray(vectors, dtype=np.float32))
+        return self.partitions.get(tag)
+
+    def _extend(self, tag: str, labels: list[int], vectors: np.ndarray) -> None:
+        partition = self.partitions.get(tag)
+        if partition is None:
+            partition = self.partitions[tag] = _Partition(vectors.shape[1])
+        partition.index.add(vectors)
+        partition.labels.extend(labels)
+        for label in labels:
+            self.label_tags.setdefault(label, []).append(tag)
+
+    def add(self, labels: list[int], metadatas: list[dict], vectors: np.ndarray) -> None:
+        """
+        Adiciona os vetores de cada documento as particoes das suas tags.
+        Particoes ainda nao montadas ficam de fora: source ja os inclui.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        grouped: dict[str, list[int]] = {}
+        for row, metadata in enumerate(metadatas):
+            for tag in _tags_of(metadata):
+                grouped.setdefault(tag, []).append(row)
+        for tag, rows in grouped.items():
+            if not self._is_lazy(tag):
+                self._extend(tag, [labels[row] for row in rows], vectors[rows])
+
+    def remove(self, labels: list[int]) -> None:
+        """Remove os rotulos das particoes em que aparecem."""
+        by_tag: dict[str, set[int]] = {}
+        for label in labels:
+            for tag in self.label_tags.pop(label, []):
+                by_tag.setdefault(tag, set()).add(label)
+        for tag, removed in by_tag.items():
+            partition = self.partitions.get(tag)
+            if partition is None:
+                continue
+            positions = [pos for pos, label in enumerate(partition.labels) if label in removed]
+            partition.index.remove_ids(np.array(positions, dtype=np.int64))
+            partition.labels = [label for label in partition.labels if label not in removed]
+            if not partition.labels:
+                del self.partitions[tag]
+
+    def size(self, tag: str) -> int:
+        """Numero de vetores na particao da tag."""
+        partition = self._partition(tag)
+        return 0 if partition is None else partition.index.ntotal
+
+    def search(self, tag: str, query: list[float], k: int) -> list[int]:
+        """Retorna os rotulos dos k vizinhos mais proximos dentro da tag."""
+        partition = self._partition(tag)
+        if partition is None or k <= 0:
+            return []
+        k = min(k, partition.index.ntotal)
+        _, positions = partition.index.search(np.asarray(query, dtype=np.float32).reshape(1, -1), k)
+        return [partition.labels[pos] for pos in positions[0] if pos >= 0]
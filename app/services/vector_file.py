@@ -0,0 +1,81 @@
+"""
+vector_file.py
+Copia float32 dos vetores do índice em um arquivo memory-mapped, uma linha
+por rotulo (label) FAISS. Serve para reordenar com distancia exata os
+candidatos de índices comprimidos (fp16/int8/PQ) e para recriar o índice
+sem perda; so as linhas lidas sao trazidas para a memoria.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+
+class FloatVectorFile:
+    """Matriz float32 [rotulo, dim] em disco, crescendo conforme os rotulos."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.dim: int | None = None
+        self._matrix: np.memmap | None = None
+
+    @property
+    def rows(self) -> int:
+        return 0 if self._matrix is None else len(self._matrix)
+
+    def open(self, dim: int) -> None:
+        """Abre o arquivo existente (ou cria um vazio) para vetores de dimensao dim."""
+        self.close()
+        self.dim = dim
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not self.path.exists():
+            self.path.touch()
+        rows = self.path.stat().st_size // (dim * 4)
+        if rows:
+            self._matrix = np.memmap(self.path, dtype=np.float32, mode='r+', shape=(rows, dim))
+
+    def reset(self, dim: int) -> None:
+        """Descarta todos os vetores e recomeca com a dimensao dim."""
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
+        self.open(dim)
+
+    def close(self) -> None:
+        if self._matrix is not None:
+            self._matrix.flush()
+        self._matrix = None
+        self.dim = None
+
+    def _grow(self, rows: int) -> None:
+        current = self.rows
+        if rows <= current:
+            return
+        new_rows = max(rows, current * 2, 1024)
+        if self._matrix is not None:
+            self._matrix.flush()
+        with open(self.path, 'r+b') as f:
+            f.truncate(new_rows * self.dim * 4)
+        self._matrix = np.memmap(self.path, dtype=np.float32, mode='r+', shape=(new_rows, self.dim))
+
+    def write(self, labels, vectors: np.ndarray) -> None:
+        """Grava os vetores nas linhas dos seus rotulos."""
+        labels = np.asarray(labels, dtype=np.int64)
+        if not len(labels):
+            return
+        self._grow(int(labels.max()) + 1)
+        self._matrix[labels] = np.asarray(vectors, dtype=np.float32)
+
+    def view(self, rows: int) -> np.ndarray:
+        """As primeiras `rows` linhas, sem copia (paginas lidas sob demanda)."""
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[:rows]
+
+    def read(self, labels) -> np.ndarray:
+        """Le os vetores dos rotulos pedidos (copia em memoria)."""
+        return np.asarray(self._matrix[np.asarray(labels, dtype=np.int64)])
+
+    def flush(self) -> None:
+        if self._matrix is not None:
+            self._matrix.flush()
@@ -0,0 +1,222 @@
+"""
+vector_store.py
+Backends de busca vetorial do rag_service atras de uma unica interface
+(VectorBackend): abrir o índice salvo, restaura-lo com os rotulos do
+docstore, salva-lo, inserir/remover vetores e buscar. NumpyBackend busca
+direto nos vetores float32 de vectors.f32 (numpy_index.py), sem arquivo
+proprio; FaissBackend (faiss_index.py) guarda os índices FAISS em
+index.faiss. O faiss so e importado quando um índice FAISS e aberto ou
+criado. choose_spec decide o backend e o tipo de índice.
+"""
+
+import functools
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+
+from app.config import RAG_VECTOR_BACKEND, RAG_NUMPY_MAX_VECTORS, RAG_INDEX_TYPE
+from app.services.numpy_index import NumpyIndex
+from app.services.vector_file import FloatVectorFile
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('auto', 'faiss', 'numpy')
+# Ordem de 'crescimento' dos tipos: o motor NumPy antes dos índices FAISS
+# (faiss_index.INDEX_TYPES).
+INDEX_TYPES = ('numpy', 'flat', 'hnsw', 'ivf_flat', 'ivf_pq')
+INDEX_FILE = 'index.faiss'
+
+
+class VectorBackend(ABC):
+    """
+    Interface dos motores de busca do rag_service. Cada vetor tem um rotulo
+    (label) int64 estavel; os vetores float32 originais ficam em `vectors`
+    (FloatVectorFile), gravados pelo rag_service antes de chegar aqui.
+    """
+
+    # Gravado no manifesto; open_backend escolhe a classe por ele.
+    name = ''
+
+    def __init__(self, vectors: FloatVectorFile, dim: int) -> None:
+        self.vectors = vectors
+        self.dim = dim
+
+    @classmethod
+    @abstractmethod
+    def open(cls, directory: Path, vectors: FloatVectorFile, dim: int) -> 'VectorBackend':
+        """Abre o índice salvo em directory; restore completa a abertura."""
+
+    def restore(self, labels: list[int]) -> None:
+        """Recebe os rotulos do docstore ao abrir (IndexError se faltam vetores)."""
+
+    @abstractmethod
+    def save(self, directory: Path) -> None:
+        """Grava o índice em directory (o manifesto fica com o rag_service)."""
+
+    def prepare_write(self) -> None:
+        """Chamado antes de cada insercao ou remocao."""
+
+    @property
+    @abstractmethod
+    def ntotal(self) -> int:
+        """Vetores guardados, inclusive os removidos so logicamente."""
+
+    @property
+    @abstractmethod
+    def spec(self) -> tuple[str, str]:
+        """(tipo, codificacao) do índice, como em choose_spec."""
+
+    @abstractmethod
+    def add(self, labels: np.ndarray, vectors: np.ndarray) -> None:
+        """Insere os vetores com os seus rotulos."""
+
+    @abstractmethod
+    def remove(self, labels: np.ndarray) -> bool:
+        """Remove os rotulos; False se o índice nao remove (viram tombstones)."""
+
+    @abstractmethod
+    def stored_labels(self) -> np.ndarray:
+        """Rotulos guardados, inclusive tombstones."""
+
+    @abstractmethod
+    def reconstruct(self, labels: np.ndarray) -> np.ndarray:
+        """Vetores (possivelmente aproximados) guardados para os rotulos."""
+
+    @abstractmethod
+    def nbytes(self) -> int:
+        """Bytes ocupados pelos vetores do índice."""
+
+    @abstractmethod
+    def search(self, query, k: int, mask: np.ndarray | None = None,
+               rerank: bool = True) -> tuple[np.ndarray, np.ndarray]:
+        """
+        k vizinhos mais proximos (distancias L2, rotulos), so entre os rotulos
+        marcados no mask. rerank=False desliga o re-ranking com os vetores
+        float32 em índices comprimidos (usado pelo benchmark).
+        """
+
+    @abstractmethod
+    def search_many(self, queries, ks: list[int],
+                    masks: list[np.ndarray | None]) -> list[tuple[np.ndarray, np.ndarray]]:
+        """search de varias consultas, cada uma com o seu k e o seu mask."""
+
+
+class NumpyBackend(VectorBackend):
+    """
+    Busca exata em NumPy sobre vectors.f32 (numpy_index.py). Nao tem arquivo
+    proprio: ao abrir, os rotulos presentes vem do docstore (restore).
+    """
+
+    name = 'numpy'
+
+    def __init__(self, vectors: FloatVectorFile, dim: int) -> None:
+        super().__init__(vectors, dim)
+        self.index = NumpyIndex(vectors, dim)
+
+    @classmethod
+    def open(cls, directory: Path, vectors: FloatVectorFile, dim: int) -> 'NumpyBackend':
+        return cls(vectors, dim)
+
+    def restore(self, labels: list[int]) -> None:
+        self.index.restore(labels)
+
+    def save(self, directory: Path) -> None:
+        # Os vetores ja estao em vectors.f32; um index.faiss antigo e obsoleto.
+        (Path(directory) / INDEX_FILE).unlink(missing_ok=True)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def spec(self) -> tuple[str, str]:
+        return 'numpy', 'float32'
+
+    def add(self, labels: np.ndarray, vectors: np.ndarray) -> None:
+        self.index.add_with_ids(vectors, labels)
+
+    def remove(self, labels: np.ndarray) -> bool:
+        self.index.remove_ids(labels)
+        return True
+
+    def stored_labels(self) -> np.ndarray:
+        return self.index.labels()
+
+    def reconstruct(self, labels: np.ndarray) -> np.ndarray:
+        return self.index.reconstruct_batch(labels)
+
+    def nbytes(self) -> int:
+        return self.index.ntotal * self.dim * 4
+
+    def search(self, query, k: int, mask: np.ndarray | None = None,
+               rerank: bool = True) -> tuple[np.ndarray, np.ndarray]:
+        return self.index.search(query, k, mask)
+
+    def search_many(self, queries, ks: list[int],
+                    masks: list[np.ndarray | None]) -> list[tuple[np.ndarray, np.ndarray]]:
+        return self.index.search_many(queries, ks, masks)
+
+
+@functools.cache
+def _configured_backend() -> str:
+    """RAG_VECTOR_BACKEND validado; avisa (uma vez) das configuracoes ignoradas."""
+    backend = RAG_VECTOR_BACKEND
+    if backend not in BACKENDS:
+        logger.warning("RAG_VECTOR_BACKEND=%s desconhecido, usando 'auto'", backend)
+        backend = 'auto'
+    if backend == 'numpy' and RAG_INDEX_TYPE != 'auto':
+        logger.warning('RAG_INDEX_TYPE=%s ignorado: RAG_VECTOR_BACKEND=numpy usa sempre o motor NumPy',
+                       RAG_INDEX_TYPE)
+    return backend
+
+
+def choose_spec(n: int) -> tuple[str, str]:
+    """
+    (tipo, codificacao) para um corpus de n vetores. RAG_VECTOR_BACKEND
+    'numpy' usa o motor NumPy e 'faiss' um índice FAISS do tipo de
+    RAG_INDEX_TYPE. Em 'auto', o NumPy atende corpora abaixo de
+    RAG_NUMPY_MAX_VECTORS, a menos que RAG_INDEX_TYPE peca um tipo FAISS
+    explicito, que e sempre respeitado.
+    """
+    backend = _configured_backend()
+    if backend == 'numpy' or (
+        backend == 'auto' and RAG_INDEX_TYPE == 'auto' and n < RAG_NUMPY_MAX_VECTORS
+    ):
+        return 'numpy', 'float32'
+    from app.services import faiss_index
+
+    return faiss_index.choose_spec(n)
+
+
+def spec_rank(spec: tuple[str, str]) -> tuple[int, bool]:
+    """Ordem de 'crescimento' dos índices, usada para so subir de tipo durante escritas."""
+    kind, encoding = spec
+    return INDEX_TYPES.index(kind), encoding != 'float32'
+
+
+def _backend_class(name: str) -> type[VectorBackend]:
+    if name == NumpyBackend.name:
+        return NumpyBackend
+    if name == 'faiss':
+        from app.services.faiss_index import FaissBackend
+
+        return FaissBackend
+    raise ValueError(f'backend vetorial desconhecido: {name!r}')
+
+
+def create_backend(spec: tuple[str, str], dim: int, vectors: FloatVectorFile,
+                   train_vectors: np.ndarray | None = None) -> VectorBackend:
+    """Backend vazio com o (tipo, codificacao) pedido, treinado com train_vectors se preciso."""
+    kind, encoding = spec
+    if kind == 'numpy':
+        return NumpyBackend(vectors, dim)
+    from app.services import faiss_index
+
+    return faiss_index.FaissBackend(faiss_index.create_index(kind, encoding, dim, train_vectors), vectors)
+
+
+def open_backend(name: str, directory: Path, vectors: FloatVectorFile, dim: int) -> VectorBackend:
+    """Abre o índice salvo pelo backend `name` (o gravado no manifesto)."""
+    return _backend_class(name).open(directory, vectors, dim)
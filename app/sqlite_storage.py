@@ -0,0 +1,223 @@
+"""
+SQLite storage engine for notes and tags.
+Used by app.storage when STORAGE_BACKEND is 'sqlite'. Every note is one row
+in `notes` and its tags live in the `note_tags` join table, so a write touches
+only the affected note instead of rewriting the whole corpus.
+"""
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+from app.config import SQLITE_DB_FILE, TAGS_FILE
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    content TEXT NOT NULL,
+    source_type TEXT NOT NULL DEFAULT '',
+    source_name TEXT NOT NULL DEFAULT '',
+    source_author TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS note_tags (
+    note_id TEXT NOT NULL REFERENCES notes(id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (note_id, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_note_tags_tag ON note_tags(tag);
+CREATE INDEX IF NOT EXISTS idx_notes_created_at ON notes(created_at);
+CREATE INDEX IF NOT EXISTS idx_notes_source_type ON notes(source_type);
+CREATE TABLE IF NOT EXISTS tags (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_NOTE_COLUMNS = ('id', 'title', 'content', 'source_type', 'source_name',
+                 'source_author', 'created_at')
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    """Return this thread's connection, creating the schema on first use."""
+    global _initialized
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        return conn
+    Path(SQLITE_DB_FILE).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(SQLITE_DB_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    _local.conn = conn
+    with _init_lock:
+        if not _initialized:
+            with conn:
+                conn.executescript(_SCHEMA)
+            migrate_from_json(conn)
+            _initialized = True
+    return conn
+
+
+def db_files() -> tuple[str, str]:
+    """Return the database file and its write-ahead log."""
+    return SQLITE_DB_FILE, SQLITE_DB_FILE + '-wal'
+
+
+def _tags_by_note(conn: sqlite3.Connection, note_ids: list[str] | None = None) -> dict[str, list[str]]:
+    """Map note id -> ordered tag list, optionally restricted to some notes."""
+    if note_ids is None:
+        rows = conn.execute('SELECT note_id, tag FROM note_tags ORDER BY note_id, position')
+    else:
+        placeholders = ','.join('?' * len(note_ids))
+        rows = conn.execute(
+            f'SELECT note_id, tag FROM note_tags WHERE note_id IN ({placeholders}) '
+            'ORDER BY note_id, position',
+            note_ids,
+        )
+    tags: dict[str, list[str]] = {}
+    for row in rows:
+        tags.setdefault(row['note_id'], []).append(row['tag'])
+    return tags
+
+
+def _row_to_note(row: sqlite3.Row, tags: list[str]) -> dict:
+    """Build a note dict with the same key order as the JSON backend."""
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'content': row['content'],
+        'source_type': row['source_type'],
+        'source_name': row['source_name'],
+        'source_author': row['source_author'],
+        'tags': tags,
+        'created_at': row['created_at'],
+    }
+
+
+def _upsert_note(conn: sqlite3.Connection, note: dict) -> None:
+    """Insert or update a single note row and replace its tag rows."""
+    conn.execute(
+        'INSERT INTO notes (id, title, content, source_type, source_name, source_author, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT(id) DO UPDATE SET title = excluded.title, content = excluded.content, '
+        'source_type = excluded.source_type, source_name = excluded.source_name, '
+        'source_author = excluded.source_author',
+        [note.get(col, '') for col in _NOTE_COLUMNS],
+    )
+    conn.execute('DELETE FROM note_tags WHERE note_id = ?', (note['id'],))
+    conn.executemany(
+        'INSERT OR IGNORE INTO note_tags (note_id, tag, position) VALUES (?, ?, ?)',
+        [(note['id'], tag, pos) for pos, tag in enumerate(note.get('tags', []))],
+    )
+
+
+# --- Migration ---
+
+def migrate_from_json(conn: sqlite3.Connection | None = None, force: bool = False) -> int:
+    """
+    Import the JSON backend's notes and tags.json into the database once.
+    Notes are read as the JSON backend sees them: the notes.json snapshot
+    with the journals replayed on top, so writes not yet compacted are kept.
+    Returns the number of notes imported (0 if already migrated).
+    """
+    # app.storage imports this module; import it lazily to avoid a cycle.
+    from app import storage
+
+    conn = conn or _connect()
+    done = conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+    if done is not None and not force:
+        return 0
+
+    notes, tags = [], []
+    if any(Path(p).exists() for p in (storage.DATA_FILE, storage._FROZEN_JOURNAL_FILE,
+                                      storage.NOTES_JOURNAL_FILE)):
+        notes = storage._read_json_notes()
+    if Path(TAGS_FILE).exists():
+        with open(TAGS_FILE, 'r', encoding='utf-8') as f:
+            tags = json.load(f).get('tags', [])
+
+    with conn:
+        for note in notes:
+            _upsert_note(conn, note)
+        conn.executemany(
+            'INSERT OR IGNORE INTO tags (id, name) VALUES (?, ?)',
+            [(t['id'], t['name']) for t in tags],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+            (str(len(notes)),),
+        )
+    return len(notes)
+
+
+# --- Note operations ---
+
+def load_notes() -> list[dict]:
+    """Return all notes in insertion order."""
+    conn = _connect()
+    tags = _tags_by_note(conn)
+    rows = conn.execute('SELECT * FROM notes ORDER BY seq')
+    return [_row_to_note(row, tags.get(row['id'], [])) for row in rows]
+
+
+def get_note(note_id: str) -> dict | None:
+    """Return a single note by ID, or None if not found."""
+    conn = _connect()
+    row = conn.execute('SELECT * FROM notes WHERE id = ?', (note_id,)).fetchone()
+    if row is None:
+        return None
+    return _row_to_note(row, _tags_by_note(conn, [note_id]).get(note_id, []))
+
+
+def upsert_note(note: dict) -> None:
+    """Persist a single note (insert or update) in one transaction."""
+    conn = _connect()
+    with conn:
+        _upsert_note(conn, note)
+
+
+def delete_note(note_id: str) -> bool:
+    """Delete a note row (tags cascade). Returns True if it existed."""
+    conn = _connect()
+    with conn:
+        cur = conn.execute('DELETE FROM notes WHERE id = ?', (note_id,))
+    return cur.rowcount > 0
+
+
+# --- Tag operations ---
+
+def load_tags() -> list[dict]:
+    """Return all registered tags in insertion order."""
+    rows = _connect().execute('SELECT id, name FROM tags ORDER BY seq')
+    return [{'id': row['id'], 'name': row['name']} for row in rows]
+
+
+def insert_tag(tag: dict) -> bool:
+    """Insert a tag. Returns False if a tag with the same name exists."""
+    conn = _connect()
+    with conn:
+        cur = conn.execute('INSERT OR IGNORE INTO tags (id, name) VALUES (?, ?)',
+                           (tag['id'], tag['name']))
+    return cur.rowcount > 0
+
+
+def delete_tag(tag_id: str) -> bool:
+    """Delete a tag by ID. Returns True if it existed."""
+    conn = _connect()
+    with conn:
+        cur = conn.execute('DELETE FROM tags WHERE id = ?', (tag_id,))
+    return cur.rowcount > 0
@@ -1,8 +1,106 @@
+import hashlib
 import json
+import logging
+import os
+import threading
 import uuid
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
 from datetime import datetime
-
-from app.config import NOTES_FILE as DATA_FILE, TAGS_FILE, CHATS_FILE, MAX_CHATS
+from itertools import islice
+
+from app.config import (
+    NOTES_FILE as DATA_FILE, NOTES_JOURNAL_FILE, NOTES_JOURNAL_COMPACT_BYTES,
+    TAGS_FILE, CHATS_FILE, CHATS_DIR, MAX_CHATS, STORAGE_BACKEND,
+)
+from app import sqlite_storage
+
+logger = logging.getLogger(__name__)
+
+# JSON backend: notes.json is a snapshot and every mutation is appended to
+# NOTES_JOURNAL_FILE as one JSONL record ({'op': 'put', 'note': {...}} or
+# {'op': 'delete', 'id': ...}). When the journal grows past
+# NOTES_JOURNAL_COMPACT_BYTES it is renamed to _FROZEN_JOURNAL_FILE and a
+# background thread folds it into a new snapshot. Replaying a record twice is
+# harmless, so a crash at any point of the compaction loses nothing.
+_FROZEN_JOURNAL_FILE = NOTES_JOURNAL_FILE.with_name(NOTES_JOURNAL_FILE.name + '.compacting')
+_notes_lock = threading.RLock()
+_compactor: threading.Thread | None = None
+
+# Process-wide note cache (id -> note, in insertion order). It is tagged with
+# the (inode, size, mtime) of the backing files: a mismatch means another
+# process changed them and the cache is reloaded. Writes made here update the
+# cache in place and re-tag it. All access goes through _notes_lock.
+_notes_cache: dict[str, dict] | None = None
+_notes_cache_signature: tuple | None = None
+_notes_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_notes_write_depth = 0
+
+
+class _NoteIndexes:
+    """Secondary indexes over the note cache, kept in step with every write:
+    tag / source_type / author -> note ids, (source_name, source_type) ->
+    note ids, plus (created_at, id) sorted."""
+
+    FIELDS = ('tags', 'source_type', 'source_author')
+    # Notes saved without a source_type count as 'outro', as the UI shows them.
+    DEFAULTS = {'tags': [], 'source_type': 'outro', 'source_author': ''}
+
+    def __init__(self, notes):
+        self.by_field: dict[str, dict[str, set[str]]] = {f: {} for f in self.FIELDS}
+        self.by_source: dict[tuple[str, str], set[str]] = {}
+        self.by_created: list[tuple[str, str]] = []
+        for note in notes:
+            self.add(note, keep_sorted=False)
+        self.by_created.sort()
+
+    @staticmethod
+    def _keys(note: dict, field: str) -> list[str]:
+        value = note.get(field, _NoteIndexes.DEFAULTS[field])
+        return list(value) if field == 'tags' else [value]
+
+    @staticmethod
+    def _source(note: dict) -> tuple[str, str]:
+        return note.get('source_name', ''), note.get('source_type', _NoteIndexes.DEFAULTS['source_type'])
+
+    def add(self, note: dict, keep_sorted: bool = True) -> None:
+        for field in self.FIELDS:
+            for key in self._keys(note, field):
+                self.by_field[field].setdefault(key, set()).add(note['id'])
+        self.by_source.setdefault(self._source(note), set()).add(note['id'])
+        entry = (note.get('created_at', ''), note['id'])
+        if keep_sorted:
+            insort(self.by_created, entry)
+        else:
+            self.by_created.append(entry)
+
+    def remove(self, note: dict) -> None:
+        for field in self.FIELDS:
+            index = self.by_field[field]
+            for key in self._keys(note, field):
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(note['id'])
+                    if not ids:
+                        del index[key]
+        source = self._source(note)
+        ids = self.by_source.get(source)
+        if ids is not None:
+            ids.discard(note['id'])
+            if not ids:
+                del self.by_source[source]
+        entry = (note.get('created_at', ''), note['id'])
+        pos = bisect_left(self.by_created, entry)
+        if pos < len(self.by_created) and self.by_created[pos] == entry:
+            del self.by_created[pos]
+
+
+_notes_indexes: _NoteIndexes | None = None
+
+
+def _use_sqlite() -> bool:
+    """True when notes and tags are stored in SQLite instead of JSON files."""
+    return STORAGE_BACKEND == 'sqlite'
 
 
 def _ensure_file():
@@ -12,32 +110,383 @@ def _ensure_file():
         DATA_FILE.write_text(json.dumps({'notes': []}, indent=2), encoding='utf-8')
 
 
-def load_notes() -> list[dict]:
-    """Return all notes as a list of dicts."""
+def _write_notes(notes: list[dict]) -> None:
+    """Atomically replace the notes.json snapshot with the given notes."""
+    tmp_file = DATA_FILE.with_name(DATA_FILE.name + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({'notes': notes}, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, DATA_FILE)
+
+
+def _read_snapshot() -> list[dict]:
+    """Return the notes stored in the notes.json snapshot."""
     _ensure_file()
     with open(DATA_FILE, 'r', encoding='utf-8') as f:
         data = json.load(f)
     return data.get('notes', [])
 
 
+def _replay_journal(notes: list[dict], path) -> list[dict]:
+    """Apply the records of a journal file to a list of notes, in order.
+    A trailing record without its newline (crash mid-write) is ignored."""
+    if not path.exists():
+        return notes
+    positions = {n['id']: i for i, n in enumerate(notes)}
+    slots: list[dict | None] = list(notes)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning('Ignoring corrupt record in %s', path)
+                continue
+            if record.get('op') == 'put':
+                note = record['note']
+                pos = positions.get(note['id'])
+                if pos is None:
+                    positions[note['id']] = len(slots)
+                    slots.append(note)
+                else:
+                    slots[pos] = note
+            elif record.get('op') == 'delete':
+                pos = positions.pop(record['id'], None)
+                if pos is not None:
+                    slots[pos] = None
+    return [n for n in slots if n is not None]
+
+
+def _repair_jsonl_tail(path) -> None:
+    """Truncate a partially written last record so new appends stay parseable."""
+    if not path.exists():
+        return
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b'\n':
+            return
+        pos = end
+        while pos > 0:
+            start = max(0, pos - 65536)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                f.truncate(start + newline + 1)
+                break
+            pos = start
+        else:
+            f.truncate(0)
+    logger.warning('Truncated incomplete record at the end of %s', path)
+
+
+def _append_jsonl(path, records: list[dict]) -> None:
+    """Durably append records to a JSONL file, one per line."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _repair_jsonl_tail(path)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _append_journal(record: dict) -> None:
+    """Durably append one mutation record to the notes journal."""
+    with _notes_lock:
+        _append_jsonl(NOTES_JOURNAL_FILE, [record])
+        size = NOTES_JOURNAL_FILE.stat().st_size
+    if size >= NOTES_JOURNAL_COMPACT_BYTES:
+        _start_compaction()
+
+
+def _start_compaction() -> threading.Thread | None:
+    """Freeze the current journal and fold it into the snapshot in a
+    background thread. Returns the running compactor, if any."""
+    global _compactor
+    with _notes_write():
+        if _compactor is not None and _compactor.is_alive():
+            return _compactor
+        if not _FROZEN_JOURNAL_FILE.exists():
+            if not NOTES_JOURNAL_FILE.exists():
+                return None
+            _repair_jsonl_tail(NOTES_JOURNAL_FILE)
+            os.replace(NOTES_JOURNAL_FILE, _FROZEN_JOURNAL_FILE)
+        _compactor = threading.Thread(target=_compact_journal,
+                                      name='notes-journal-compactor', daemon=True)
+        _compactor.start()
+    return _compactor
+
+
+def _compact_journal() -> None:
+    """Write snapshot + frozen journal as the new snapshot, then drop the
+    frozen journal. Appends keep going to the fresh journal meanwhile."""
+    try:
+        notes = _replay_journal(_read_snapshot(), _FROZEN_JOURNAL_FILE)
+        with _notes_write():
+            _write_notes(notes)
+            _FROZEN_JOURNAL_FILE.unlink(missing_ok=True)
+        logger.info('Notes journal compacted into %s (%d notes)', DATA_FILE, len(notes))
+    except Exception:
+        logger.exception('Notes journal compaction failed')
+
+
+def compact_notes_journal(wait: bool = True) -> None:
+    """Fold the journal into notes.json now. With wait=True, block until done."""
+    if _use_sqlite():
+        return
+    compactor = _start_compaction()
+    if wait and compactor is not None:
+        compactor.join()
+
+
+def _apply_note_fields(note: dict, title: str, content: str, source_type: str,
+                       source_name: str, source_author: str, tags: list[str]) -> None:
+    """Normalize and set the user-editable fields of a note in place."""
+    note['title'] = title.strip()
+    note['content'] = content.strip()
+    note['source_type'] = source_type
+    note['source_name'] = source_name.strip()
+    note['source_author'] = source_author.strip()
+    # dict.fromkeys drops tags that only differed in case or spacing, in order.
+    note['tags'] = list(dict.fromkeys(t.strip().lower() for t in tags if t.strip()))
+
+
+def _notes_signature() -> tuple:
+    """Return (inode, size, mtime) of every file backing the notes."""
+    if _use_sqlite():
+        paths = sqlite_storage.db_files()
+    else:
+        paths = (DATA_FILE, _FROZEN_JOURNAL_FILE, NOTES_JOURNAL_FILE)
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            signature.append(None)
+            continue
+        signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+    return tuple(signature)
+
+
+def _read_json_notes() -> list[dict]:
+    """Read the JSON backend's notes: the snapshot plus both journals."""
+    notes = _read_snapshot()
+    notes = _replay_journal(notes, _FROZEN_JOURNAL_FILE)
+    return _replay_journal(notes, NOTES_JOURNAL_FILE)
+
+
+def _read_notes() -> list[dict]:
+    """Read all notes from the configured backend, bypassing the cache."""
+    if _use_sqlite():
+        return sqlite_storage.load_notes()
+    return _read_json_notes()
+
+
+def _cached_notes() -> dict[str, dict]:
+    """Return the note cache, reloading it if the backing files changed.
+    Must be called with _notes_lock held."""
+    global _notes_cache, _notes_cache_signature, _notes_indexes
+    if not _use_sqlite():
+        _ensure_file()
+    signature = _notes_signature()
+    if _notes_cache is not None and signature == _notes_cache_signature:
+        _notes_cache_stats['hits'] += 1
+        return _notes_cache
+    if _notes_cache is not None:
+        _notes_cache_stats['invalidations'] += 1
+    _notes_cache_stats['misses'] += 1
+    _notes_cache = {n['id']: n for n in _read_notes()}
+    _notes_indexes = _NoteIndexes(_notes_cache.values())
+    _notes_cache_signature = signature
+    return _notes_cache
+
+
+@contextmanager
+def _notes_write():
+    """Hold _notes_lock around a write to the note files. Yields True if the
+    cache was in sync before the write, in which case the caller mirrors its
+    change with _cache_put/_cache_remove and the cache is re-tagged after;
+    a stale cache is dropped instead."""
+    global _notes_cache, _notes_cache_signature, _notes_write_depth
+    with _notes_lock:
+        if _notes_write_depth:
+            # Nested in another write (e.g. journal rotation): the outer one re-tags.
+            yield _notes_cache is not None
+            return
+        in_sync = _notes_cache is not None and _notes_signature() == _notes_cache_signature
+        _notes_write_depth += 1
+        try:
+            yield in_sync
+        except BaseException:
+            _notes_cache = None
+            raise
+        finally:
+            _notes_write_depth -= 1
+        if in_sync:
+            _notes_cache_signature = _notes_signature()
+        else:
+            _notes_cache = None
+
+
+def _cache_put(note: dict) -> None:
+    """Insert or replace a note in the cache and its indexes."""
+    previous = _notes_cache.get(note['id'])
+    if previous is not None:
+        _notes_indexes.remove(previous)
+    _notes_cache[note['id']] = note
+    _notes_indexes.add(note)
+
+
+def _cache_remove(note_id: str) -> None:
+    """Drop a note from the cache and its indexes."""
+    previous = _notes_cache.pop(note_id, None)
+    if previous is not None:
+        _notes_indexes.remove(previous)
+
+
+def notes_cache_stats() -> dict:
+    """Return hit/miss/invalidation counters and the size of the note cache."""
+    with _notes_lock:
+        size = len(_notes_cache) if _notes_cache is not None else 0
+        return {**_notes_cache_stats, 'size': size}
+
+
+def load_notes() -> list[dict]:
+    """Return all notes as a list of dicts.
+    The dicts are shared with the process-wide cache: do not mutate them."""
+    with _notes_lock:
+        return list(_cached_notes().values())
+
+
+def get_note(note_id: str) -> dict | None:
+    """Return a copy of a single note by ID, or None if not found."""
+    with _notes_lock:
+        note = _cached_notes().get(note_id)
+    if note is None:
+        return None
+    return {**note, 'tags': list(note.get('tags', []))}
+
+
+def _ordered_note_keys(tag: str | None, source_type: str | None, author: str | None,
+                       since: str | None, until: str | None, newest_first: bool,
+                       after: tuple[str, str] | None = None):
+    """Yield the (created_at, id) keys of matching notes in order, starting
+    after the key `after`. Must be consumed with _notes_lock held."""
+    indexes = _notes_indexes
+    wanted = [('tags', tag), ('source_type', source_type), ('source_author', author)]
+    id_sets = [indexes.by_field[field].get(key, set())
+               for field, key in wanted if key is not None]
+    if id_sets:
+        id_sets.sort(key=len)
+        ids = set(id_sets[0]).intersection(*id_sets[1:])
+        keys = sorted((_notes_cache[i].get('created_at', ''), i) for i in ids)
+    else:
+        keys = indexes.by_created
+    lo = 0 if since is None else bisect_left(keys, (since,))
+    hi = len(keys) if until is None else bisect_right(keys, (until + '\uffff',))
+    if after is not None:
+        if newest_first:
+            hi = min(hi, bisect_left(keys, after))
+        else:
+            lo = max(lo, bisect_right(keys, after))
+    positions = range(hi - 1, lo - 1, -1) if newest_first else range(lo, hi)
+    for pos in positions:
+        yield keys[pos]
+
+
+def find_notes(tag: str | None = None, source_type: str | None = None,
+               author: str | None = None, since: str | None = None,
+               until: str | None = None, limit: int | None = None,
+               newest_first: bool = True) -> list[dict]:
+    """
+    Return notes matching every given filter, ordered by created_at.
+    since/until are inclusive ISO timestamp bounds (a date prefix works).
+    Cost is proportional to the matching notes, not to the whole corpus.
+    The returned dicts are shared with the cache: do not mutate them.
+    """
+    with _notes_lock:
+        cache = _cached_notes()
+        keys = _ordered_note_keys(tag, source_type, author, since, until, newest_first)
+        return [cache[note_id] for _, note_id in islice(keys, limit)]
+
+
+def load_notes_page(cursor: str | None = None, limit: int = 20, order: str = 'desc',
+                    filters: dict | None = None) -> dict:
+    """
+    Return one page of notes ordered by created_at, ties by id ('desc' or 'asc').
+    filters accepts the find_notes filters (tag, source_type, author, since,
+    until) plus 'query', a case-insensitive substring of title, content or tags.
+    Returns {'notes': [...], 'next_cursor': str | None}; pass next_cursor back
+    to get the following page. Only the notes up to the page end are visited.
+    """
+    if order not in ('asc', 'desc'):
+        raise ValueError(f'order must be "asc" or "desc", not {order!r}')
+    filters = dict(filters or {})
+    query = (filters.pop('query', '') or '').lower().strip()
+    after = None
+    if cursor:
+        created_at, _, note_id = cursor.partition('|')
+        after = (created_at, note_id)
+
+    page: list[dict] = []
+    next_cursor = None
+    with _notes_lock:
+        cache = _cached_notes()
+        keys = _ordered_note_keys(filters.get('tag'), filters.get('source_type'),
+                                  filters.get('author'), filters.get('since'),
+                                  filters.get('until'), order == 'desc', after)
+        for _, note_id in keys:
+            note = cache[note_id]
+            if query:
+                searchable = f"{note['title']} {note['content']} {' '.join(note.get('tags', []))}".lower()
+                if query not in searchable:
+                    continue
+            if len(page) == limit:
+                last = page[-1]
+                next_cursor = f"{last.get('created_at', '')}|{last['id']}"
+                break
+            page.append(note)
+    return {'notes': page, 'next_cursor': next_cursor}
+
+
+def count_notes_by(field: str) -> dict[str, int]:
+    """Return note counts per value of 'tags', 'source_type' or 'source_author'."""
+    with _notes_lock:
+        _cached_notes()
+        return {key: len(ids) for key, ids in _notes_indexes.by_field[field].items()}
+
+
+def count_notes_by_source() -> dict[tuple[str, str], int]:
+    """Return note counts per (source_name, source_type) pair."""
+    with _notes_lock:
+        _cached_notes()
+        return {key: len(ids) for key, ids in _notes_indexes.by_source.items()}
+
+
+def _put_note(note: dict) -> None:
+    """Persist a new or changed note and update the cache."""
+    with _notes_write() as in_sync:
+        if _use_sqlite():
+            sqlite_storage.upsert_note(note)
+        else:
+            _append_journal({'op': 'put', 'note': note})
+        if in_sync:
+            _cache_put(note)
+
+
 def save_note(title: str, content: str, source_type: str,
               source_name: str, source_author: str, tags: list[str]) -> dict:
     """Create a new note, persist it, and return the created note dict."""
-    _ensure_file()
-    notes = load_notes()
-    note = {
-        'id': str(uuid.uuid4()),
-        'title': title.strip(),
-        'content': content.strip(),
-        'source_type': source_type,
-        'source_name': source_name.strip(),
-        'source_author': source_author.strip(),
-        'tags': [t.strip().lower() for t in tags if t.strip()],
-        'created_at': datetime.now().isoformat(timespec='seconds'),
-    }
-    notes.append(note)
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump({'notes': notes}, f, indent=2, ensure_ascii=False)
+    note = {'id': str(uuid.uuid4())}
+    _apply_note_fields(note, title, content, source_type,
+                       source_name, source_author, tags)
+    note['created_at'] = datetime.now().isoformat(timespec='seconds')
+    _put_note(note)
     try:
         from app.services import rag_service
         rag_service.add_note(note)
@@ -48,42 +497,40 @@ def save_note(title: str, content: str, source_type: str,
 
 def delete_note(note_id: str) -> bool:
     """Delete note by ID. Returns True if found and deleted."""
-    notes = load_notes()
-    original_len = len(notes)
-    notes = [n for n in notes if n['id'] != note_id]
-    if len(notes) < original_len:
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump({'notes': notes}, f, indent=2, ensure_ascii=False)
-        try:
-            from app.services import rag_service
-            rag_service.delete_note(note_id)
-        except Exception:
-            pass
-        return True
-    return False
+    with _notes_lock:
+        if get_note(note_id) is None:
+            return False
+        with _notes_write() as in_sync:
+            if _use_sqlite():
+                sqlite_storage.delete_note(note_id)
+            else:
+                _append_journal({'op': 'delete', 'id': note_id})
+            if in_sync:
+                _cache_remove(note_id)
+    try:
+        from app.services import rag_service
+        rag_service.delete_note(note_id)
+    except Exception:
+        pass
+    return True
 
 
 def update_note(note_id: str, title: str, content: str, source_type: str,
                 source_name: str, source_author: str, tags: list[str]) -> bool:
     """Update an existing note by ID. Returns True if found and updated."""
-    notes = load_notes()
-    for note in notes:
-        if note['id'] == note_id:
-            note['title'] = title.strip()
-            note['content'] = content.strip()
-            note['source_type'] = source_type
-            note['source_name'] = source_name.strip()
-            note['source_author'] = source_author.strip()
-            note['tags'] = [t.strip().lower() for t in tags if t.strip()]
-            with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump({'notes': notes}, f, indent=2, ensure_ascii=False)
-            try:
-                from app.services import rag_service
-                rag_service.update_note(note_id, note)
-            except Exception:
-                pass
-            return True
-    return False
+    with _notes_lock:
+        note = get_note(note_id)
+        if note is None:
+            return False
+        _apply_note_fields(note, title, content, source_type,
+                           source_name, source_author, tags)
+        _put_note(note)
+    try:
+        from app.services import rag_service
+        rag_service.update_note(note_id, note)
+    except Exception:
+        pass
+    return True
 
 
 # --- Tag operations ---
@@ -97,6 +544,8 @@ def _ensure_tags_file():
 
 def load_tags() -> list[dict]:
     """Return all tags as a list of dicts with id and name."""
+    if _use_sqlite():
+        return sqlite_storage.load_tags()
     _ensure_tags_file()
     with open(TAGS_FILE, 'r', encoding='utf-8') as f:
         data = json.load(f)
@@ -105,17 +554,21 @@ def load_tags() -> list[dict]:
 
 def save_tag(name: str) -> dict | None:
     """Create a new tag. Returns the tag dict, or None if it already exists."""
-    _ensure_tags_file()
-    tags = load_tags()
     normalized = name.strip().lower()
     if not normalized:
         return None
-    if any(t['name'] == normalized for t in tags):
-        return None
     tag = {
         'id': str(uuid.uuid4()),
         'name': normalized,
     }
+    if _use_sqlite():
+        with _notes_write():
+            inserted = sqlite_storage.insert_tag(tag)
+        return tag if inserted else None
+    _ensure_tags_file()
+    tags = load_tags()
+    if any(t['name'] == normalized for t in tags):
+        return None
     tags.append(tag)
     with open(TAGS_FILE, 'w', encoding='utf-8') as f:
         json.dump({'tags': tags}, f, indent=2, ensure_ascii=False)
@@ -124,6 +577,9 @@ def save_tag(name: str) -> dict | None:
 
 def delete_tag(tag_id: str) -> bool:
     """Delete tag by ID. Returns True if found and deleted."""
+    if _use_sqlite():
+        with _notes_write():
+            return sqlite_storage.delete_tag(tag_id)
     tags = load_tags()
     original_len = len(tags)
     tags = [t for t in tags if t['id'] != tag_id]
@@ -135,91 +591,235 @@ def delete_tag(tag_id: str) -> bool:
 
 
 # --- Chat operations ---
-
-def _ensure_chats_file():
-    """Create chats.json if it doesn't exist."""
-    CHATS_FILE.parent.mkdir(parents=True, exist_ok=True)
-    if not CHATS_FILE.exists():
-        CHATS_FILE.write_text(json.dumps({'chats': []}, indent=2), encoding='utf-8')
+#
+# Each chat lives in CHATS_DIR/<id>.jsonl, an append-only log with one message
+# per line, and CHATS_DIR/index.json holds the metadata of every chat (id,
+# title, created_at, updated_at, message_count) plus the size and hash of the
+# committed part of its log. A new turn appends only the new messages and
+# rewrites the small index, never the other conversations. Anything in a log
+# past its committed size is a write interrupted before the index was saved:
+# reads stop at message_count and the next append truncates it.
+
+_CHATS_INDEX_FILE = CHATS_DIR / 'index.json'
+_CHAT_SUMMARY_FIELDS = ('id', 'title', 'created_at', 'updated_at', 'message_count')
+_chats_lock = threading.RLock()
+
+
+def _chat_messages_file(chat_id: str):
+    """Return the path of a chat's message log."""
+    return CHATS_DIR / f'{chat_id}.jsonl'
+
+
+def _chat_log_bytes(messages: list[dict]) -> bytes:
+    """Serialize messages exactly as they are stored in a chat log."""
+    return ''.join(json.dumps(m, ensure_ascii=False) + '\n' for m in messages).encode('utf-8')
+
+
+def _chat_log_state(data: bytes) -> dict:
+    """Index fields identifying the committed content of a chat log."""
+    return {'log_size': len(data), 'log_hash': hashlib.blake2b(data, digest_size=16).hexdigest()}
+
+
+def _rewrite_chat_log(path, data: bytes) -> None:
+    """Atomically replace a chat log: the old one stays until the new one is on disk."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(path.name + '.tmp')
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+def _append_chat_log(path, committed_size: int, data: bytes) -> None:
+    """Append to a chat log after dropping anything past its committed size."""
+    with open(path, 'r+b' if path.exists() else 'wb') as f:
+        f.truncate(committed_size)
+        f.seek(committed_size)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_chats_index(entries: list[dict]) -> None:
+    """Atomically replace the chat metadata index."""
+    tmp_file = _CHATS_INDEX_FILE.with_name(_CHATS_INDEX_FILE.name + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump({'chats': entries}, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, _CHATS_INDEX_FILE)
+
+
+def _ensure_chats_dir():
+    """Create the chats directory and index, migrating chats.json once."""
+    if _CHATS_INDEX_FILE.exists():
+        return
+    CHATS_DIR.mkdir(parents=True, exist_ok=True)
+    entries = []
+    if CHATS_FILE.exists():
+        with open(CHATS_FILE, 'r', encoding='utf-8') as f:
+            legacy_chats = json.load(f).get('chats', [])
+        for chat in legacy_chats:
+            messages = chat.get('messages', [])
+            data = _chat_log_bytes(messages)
+            _rewrite_chat_log(_chat_messages_file(chat['id']), data)
+            entries.append({
+                'id': chat['id'],
+                'title': chat.get('title', ''),
+                'created_at': chat.get('created_at', ''),
+                'updated_at': chat.get('updated_at', ''),
+                'message_count': len(messages),
+                **_chat_log_state(data),
+            })
+    _write_chats_index(entries)
+
+
+def _load_chats_index() -> list[dict]:
+    """Return the metadata entries of every chat (no messages)."""
+    _ensure_chats_dir()
+    with open(_CHATS_INDEX_FILE, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get('chats', [])
+
+
+def _read_chat_messages(chat_id: str, count: int) -> list[dict]:
+    """Read the first `count` messages of a chat's log. Records past them
+    (or cut short) were written by an update that never committed."""
+    path = _chat_messages_file(chat_id)
+    if not path.exists():
+        return []
+    messages = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in islice(f, count):
+            if not line.endswith('\n'):
+                break
+            messages.append(json.loads(line))
+    return messages
+
+
+def _chat_with_messages(entry: dict) -> dict:
+    """Build the full chat dict for an index entry."""
+    return {
+        'id': entry['id'],
+        'title': entry['title'],
+        'messages': _read_chat_messages(entry['id'], entry.get('message_count', 0)),
+        'created_at': entry['created_at'],
+        'updated_at': entry['updated_at'],
+    }
 
 
 def load_chats() -> list[dict]:
     """Return all chats as a list of dicts, sorted by updated_at descending."""
-    _ensure_chats_file()
-    with open(CHATS_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    chats = data.get('chats', [])
+    with _chats_lock:
+        entries = _load_chats_index()
+        chats = [_chat_with_messages(entry) for entry in entries]
     return sorted(chats, key=lambda c: c.get('updated_at', ''), reverse=True)
 
 
+def list_chat_summaries(query: str = '', offset: int = 0,
+                        limit: int | None = None) -> dict:
+    """
+    Return chat metadata (id, title, created_at, updated_at, message_count)
+    sorted by updated_at descending, without reading any message log.
+    query filters by a case-insensitive substring of the title.
+    Returns {'chats': [...], 'total': number of chats matching the query}.
+    """
+    with _chats_lock:
+        entries = _load_chats_index()
+    query = query.lower().strip()
+    if query:
+        entries = [e for e in entries if query in e.get('title', '').lower()]
+    # Reversed first so that, among equal timestamps, newer chats come first.
+    entries = sorted(reversed(entries), key=lambda e: e.get('updated_at', ''), reverse=True)
+    end = None if limit is None else offset + limit
+    chats = [{key: e.get(key) for key in _CHAT_SUMMARY_FIELDS} for e in entries[offset:end]]
+    return {'chats': chats, 'total': len(entries)}
+
+
 def get_chat(chat_id: str) -> dict | None:
     """Return a single chat by ID, or None if not found."""
-    _ensure_chats_file()
-    with open(CHATS_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    for chat in data.get('chats', []):
-        if chat['id'] == chat_id:
-            return chat
+    with _chats_lock:
+        for entry in _load_chats_index():
+            if entry['id'] == chat_id:
+                return _chat_with_messages(entry)
     return None
 
 
 def save_chat(title: str, messages: list[dict]) -> dict | None:
     """Create a new chat. Returns the chat dict, or None if limit reached."""
-    _ensure_chats_file()
-    with open(CHATS_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    chats = data.get('chats', [])
-    if len(chats) >= MAX_CHATS:
-        return None
-    now = datetime.now().isoformat(timespec='seconds')
-    chat = {
-        'id': str(uuid.uuid4()),
-        'title': title[:50],
-        'messages': messages,
-        'created_at': now,
-        'updated_at': now,
-    }
-    chats.append(chat)
-    with open(CHATS_FILE, 'w', encoding='utf-8') as f:
-        json.dump({'chats': chats}, f, indent=2, ensure_ascii=False)
+    with _chats_lock:
+        entries = _load_chats_index()
+        if len(entries) >= MAX_CHATS:
+            return None
+        now = datetime.now().isoformat(timespec='seconds')
+        chat = {
+            'id': str(uuid.uuid4()),
+            'title': title[:50],
+            'messages': messages,
+            'created_at': now,
+            'updated_at': now,
+        }
+        data = _chat_log_bytes(messages)
+        _rewrite_chat_log(_chat_messages_file(chat['id']), data)
+        entries.append({
+            'id': chat['id'],
+            'title': chat['title'],
+            'created_at': now,
+            'updated_at': now,
+            'message_count': len(messages),
+            **_chat_log_state(data),
+        })
+        _write_chats_index(entries)
     return chat
 
 
 def update_chat(chat_id: str, messages: list[dict],
                 title: str | None = None) -> bool:
     """Update a chat's messages and updated_at. Optionally update title.
+    When the stored messages are an unchanged prefix of `messages` (checked
+    against the log's hash), only the new ones are appended; otherwise (history
+    edited or shortened) the log is atomically replaced.
     Returns True if found and updated."""
-    _ensure_chats_file()
-    with open(CHATS_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    chats = data.get('chats', [])
-    for chat in chats:
-        if chat['id'] == chat_id:
-            chat['messages'] = messages
-            if title is not None:
-                chat['title'] = title[:50]
-            chat['updated_at'] = datetime.now().isoformat(timespec='seconds')
-            with open(CHATS_FILE, 'w', encoding='utf-8') as f:
-                json.dump({'chats': chats}, f, indent=2, ensure_ascii=False)
-            return True
-    return False
+    with _chats_lock:
+        entries = _load_chats_index()
+        entry = next((e for e in entries if e['id'] == chat_id), None)
+        if entry is None:
+            return False
+        path = _chat_messages_file(chat_id)
+        stored = entry.get('message_count', 0)
+        prefix = _chat_log_bytes(messages[:stored])
+        if len(messages) >= stored and _chat_log_state(prefix) == {
+            'log_size': entry.get('log_size'), 'log_hash': entry.get('log_hash'),
+        }:
+            new = _chat_log_bytes(messages[stored:])
+            _append_chat_log(path, len(prefix), new)
+            data = prefix + new
+        else:
+            data = _chat_log_bytes(messages)
+            _rewrite_chat_log(path, data)
+        entry['message_count'] = len(messages)
+        entry.update(_chat_log_state(data))
+        if title is not None:
+            entry['title'] = title[:50]
+        entry['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        _write_chats_index(entries)
+    return True
 
 
 def delete_chat(chat_id: str) -> bool:
     """Delete chat by ID. Returns True if found and deleted."""
-    _ensure_chats_file()
-    with open(CHATS_FILE, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    chats = data.get('chats', [])
-    original_len = len(chats)
-    chats = [c for c in chats if c['id'] != chat_id]
-    if len(chats) < original_len:
-        with open(CHATS_FILE, 'w', encoding='utf-8') as f:
-            json.dump({'chats': chats}, f, indent=2, ensure_ascii=False)
-        return True
-    return False
+    with _chats_lock:
+        entries = _load_chats_index()
+        remaining = [e for e in entries if e['id'] != chat_id]
+        if len(remaining) == len(entries):
+            return False
+        _write_chats_index(remaining)
+        _chat_messages_file(chat_id).unlink(missing_ok=True)
+    return True
 
 
 def count_chats() -> int:
-    """Return the number of saved chats."""
-    return len(load_chats())
+    """Return the number of saved chats (read from the metadata index)."""
+    with _chats_lock:
+        return len(_load_chats_index())
@@ -3,7 +3,7 @@ from collections import Counter
 from nicegui import ui
 
 from app.ui.components import create_sidebar
-from app.storage import load_notes
+from app.storage import count_notes_by, count_notes_by_source
 
 
 @ui.page('/fontmap')
@@ -13,21 +13,19 @@ def fontmap_page():
     with ui.column().classes('w-full max-w-5xl mx-auto p-6'):
         ui.label('Mapa de Fontes').classes('text-h4 q-mb-md')
 
-        notes = load_notes()
+        # Calcular agregacoes
+        type_counts = count_notes_by('source_type')
 
-        if not notes:
+        if not type_counts:
             with ui.card().classes('w-full q-pa-xl text-center'):
                 ui.icon('info', size='xl', color='grey')
                 ui.label('Nenhuma nota ainda. Crie algumas notas primeiro!') \
                     .classes('text-subtitle1 text-grey q-mt-md')
             return
 
-        # Calcular agregacoes
-        type_counts = Counter(n.get('source_type', 'outro') for n in notes)
-        source_counts = Counter(
-            (n.get('source_name', 'Desconhecido') or 'Desconhecido', n.get('source_type', 'outro'))
-            for n in notes
-        )
+        source_counts = Counter()
+        for (name, stype), count in count_notes_by_source().items():
+            source_counts[name or 'Desconhecido', stype] += count
 
         # Linha de graficos
         with ui.row().classes('w-full gap-4 q-mb-lg flex-wrap'):
@@ -7,7 +7,8 @@ from agents.guardrail_agent import check_coherence
 from agents import chat_agent
 from app.config import GUARDRAIL_MAX_RETRIES, MAX_CHATS
 from app.storage import (
-    count_chats, delete_chat, get_chat, load_chats, save_chat, update_chat,
+    count_chats, delete_chat, get_chat, list_chat_summaries, save_chat,
+    update_chat,
 )
 from app.ui.components import create_sidebar
 
@@ -25,6 +26,7 @@ TYPE_ICONS = {
 
 BOT_NAME = 'Assistente'
 BOT_AVATAR = '/static/gandalf-avatar.png'
+CHATS_PAGE_SIZE = 20
 
 
 # ---------------------------------------------------------------------------
@@ -71,11 +73,18 @@ def knowledge_chat_page():
                 ).classes('w-full q-mb-sm') \
                     .props('outline dense color=primary no-caps')
 
+                chat_search = ui.input(placeholder='Buscar conversas') \
+                    .classes('w-full q-mb-sm') \
+                    .props('outlined dense clearable')
+
                 ui.separator()
 
                 with ui.scroll_area().classes('flex-grow w-full'):
                     sidebar_list = ui.column().classes('w-full gap-1 q-pa-xs')
 
+                chat_pagination = ui.pagination(1, 1, direction_links=True) \
+                    .classes('self-center').props('dense size=sm')
+
             # ---- CENTER: Chat ----
             with ui.column().classes('min-w-0 flex-[7] no-wrap') \
                     .style('min-height: 0; height: 100%; overflow: hidden'):
@@ -245,8 +254,16 @@ def knowledge_chat_page():
     def render_chat_sidebar():
         """Re-render the conversations list in the sidebar."""
         sidebar_list.clear()
-        chats = load_chats()
-        chat_count_label.text = f'{len(chats)}/{MAX_CHATS}'
+        page = list_chat_summaries(
+            query=chat_search.value or '',
+            offset=(chat_pagination.value - 1) * CHATS_PAGE_SIZE,
+            limit=CHATS_PAGE_SIZE,
+        )
+        chats = page['chats']
+        chat_count_label.text = f'{count_chats()}/{MAX_CHATS}'
+        page_count = max(1, -(-page['total'] // CHATS_PAGE_SIZE))
+        chat_pagination.max = page_count
+        chat_pagination.set_visibility(page_count > 1)
 
         if not chats:
             with sidebar_list:
@@ -371,6 +388,16 @@ def knowledge_chat_page():
                 ).props('flat')
         dlg.open()
 
+    def handle_chat_search():
+        # Voltar para a pagina 1 ja dispara on_value_change -> render_chat_sidebar.
+        if chat_pagination.value != 1:
+            chat_pagination.value = 1
+        else:
+            render_chat_sidebar()
+
+    chat_search.on('update:model-value', lambda _: handle_chat_search())
+    chat_pagination.on_value_change(lambda _: render_chat_sidebar())
+
     # Initial render
     render_messages()
     render_chat_sidebar()
@@ -2,7 +2,9 @@ from nicegui import ui
 
 from app.ui.components import create_sidebar
 from app.models import SOURCE_TYPES
-from app.storage import load_notes, delete_note, update_note, load_tags
+from app.storage import load_notes_page, delete_note, update_note, load_tags
+
+NOTES_PAGE_SIZE = 20
 
 
 @ui.page('/notes')
@@ -22,6 +24,9 @@ def notes_page():
             ).classes('w-48').props('outlined dense')
 
         notes_container = ui.column().classes('w-full gap-2')
+        with ui.row().classes('w-full justify-center'):
+            load_more_btn = ui.button('Carregar mais', icon='expand_more') \
+                .props('flat color=primary')
 
         def open_edit_dialog(note):
             edit_tags: list[str] = list(note.get('tags', []))
@@ -125,75 +130,85 @@ def notes_page():
 
             dialog.open()
 
-        def render_notes():
-            notes_container.clear()
-            notes = load_notes()
+        next_cursor: str | None = None
+
+        def render_note(note):
+            caption = f"{note.get('source_type', '')} | {', '.join(note.get('tags', []))} | {note.get('created_at', '')[:10]}"
+            with ui.expansion(
+                text=note['title'],
+                caption=caption,
+                icon='description',
+            ).classes('w-full bg-grey-1'):
+                ui.markdown(note.get('content', '')).classes('q-pa-md')
+
+                with ui.row().classes('q-pa-sm gap-4'):
+                    ui.label(f"Fonte: {note.get('source_name') or 'N/A'}") \
+                        .classes('text-caption text-grey-8')
+                    ui.label(f"Autor: {note.get('source_author') or 'N/A'}") \
+                        .classes('text-caption text-grey-8')
+                    ui.label(f"Tipo: {note.get('source_type', '')}") \
+                        .classes('text-caption text-grey-8')
+                    ui.label(f"Criado em: {note.get('created_at', '')}") \
+                        .classes('text-caption text-grey-8')
+
+                if note.get('tags'):
+                    with ui.row().classes('gap-1 q-pa-sm'):
+                        for tag in note['tags']:
+                            ui.chip(tag, color='primary').props('dense outline')
+
+                with ui.row().classes('q-pa-sm gap-2'):
+                    def make_edit(n):
+                        return lambda: open_edit_dialog(n)
+
+                    ui.button('Editar', icon='edit', color='primary',
+                              on_click=make_edit(note)).props('flat dense')
+
+                    def make_delete(nid):
+                        def do_delete():
+                            with ui.dialog() as dlg, ui.card():
+                                ui.label('Excluir esta nota?').classes('text-h6')
+                                ui.label('Esta ação não pode ser desfeita.')
+                                with ui.row().classes('q-mt-md gap-2'):
+                                    ui.button('Cancelar', on_click=dlg.close).props('flat')
+                                    ui.button('Excluir', color='negative',
+                                              on_click=lambda: (delete_note(nid), dlg.close(), render_notes())) \
+                                        .props('flat')
+                            dlg.open()
+                        return do_delete
+
+                    ui.button('Excluir', icon='delete', color='negative',
+                              on_click=make_delete(note['id'])).props('flat dense')
+
+        def load_more():
+            nonlocal next_cursor
+            is_first_page = next_cursor is None
             query = (search_input.value or '').lower().strip()
             source_filter = filter_select.value
+            filters = {'query': query}
+            if source_filter != 'Todos':
+                filters['source_type'] = source_filter
+
+            # mais recentes primeiro, uma página por vez
+            page = load_notes_page(next_cursor, NOTES_PAGE_SIZE, 'desc', filters)
+            next_cursor = page['next_cursor']
+            load_more_btn.set_visibility(next_cursor is not None)
 
-            filtered = []
-            for note in reversed(notes):  # mais recentes primeiro
-                if query:
-                    searchable = f"{note['title']} {note['content']} {' '.join(note.get('tags', []))}".lower()
-                    if query not in searchable:
-                        continue
-                if source_filter != 'Todos' and note.get('source_type') != source_filter:
-                    continue
-                filtered.append(note)
-
-            if not filtered:
+            if is_first_page and not page['notes']:
                 with notes_container:
                     ui.label('Nenhuma nota encontrada.').classes('text-subtitle1 text-grey q-pa-lg')
                 return
 
-            for note in filtered:
-                with notes_container:
-                    caption = f"{note.get('source_type', '')} | {', '.join(note.get('tags', []))} | {note.get('created_at', '')[:10]}"
-                    with ui.expansion(
-                        text=note['title'],
-                        caption=caption,
-                        icon='description',
-                    ).classes('w-full bg-grey-1'):
-                        ui.markdown(note.get('content', '')).classes('q-pa-md')
-
-                        with ui.row().classes('q-pa-sm gap-4'):
-                            ui.label(f"Fonte: {note.get('source_name') or 'N/A'}") \
-                                .classes('text-caption text-grey-8')
-                            ui.label(f"Autor: {note.get('source_author') or 'N/A'}") \
-                                .classes('text-caption text-grey-8')
-                            ui.label(f"Tipo: {note.get('source_type', '')}") \
-                                .classes('text-caption text-grey-8')
-                            ui.label(f"Criado em: {note.get('created_at', '')}") \
-                                .classes('text-caption text-grey-8')
-
-                        if note.get('tags'):
-                            with ui.row().classes('gap-1 q-pa-sm'):
-                                for tag in note['tags']:
-                                    ui.chip(tag, color='primary').props('dense outline')
-
-                        with ui.row().classes('q-pa-sm gap-2'):
-                            def make_edit(n):
-                                return lambda: open_edit_dialog(n)
-
-                            ui.button('Editar', icon='edit', color='primary',
-                                      on_click=make_edit(note)).props('flat dense')
-
-                            def make_delete(nid):
-                                def do_delete():
-                                    with ui.dialog() as dlg, ui.card():
-                                        ui.label('Excluir esta nota?').classes('text-h6')
-                                        ui.label('Esta ação não pode ser desfeita.')
-                                        with ui.row().classes('q-mt-md gap-2'):
-                                            ui.button('Cancelar', on_click=dlg.close).props('flat')
-                                            ui.button('Excluir', color='negative',
-                                                      on_click=lambda: (delete_note(nid), dlg.close(), render_notes())) \
-                                                .props('flat')
-                                    dlg.open()
-                                return do_delete
-
-                            ui.button('Excluir', icon='delete', color='negative',
-                                      on_click=make_delete(note['id'])).props('flat dense')
+            with notes_container:
+                for note in page['notes']:
+                    render_note(note)
+
+        def render_notes():
+            nonlocal next_cursor
+            notes_container.clear()
+            next_cursor = None
+            load_more()
 
+        load_more_btn.on_click(load_more)
         search_input.on('update:model-value', lambda _: render_notes())
         filter_select.on('update:model-value', lambda _: render_notes())
 
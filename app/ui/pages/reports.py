@@ -1,9 +1,7 @@
-from collections import Counter
-
 from nicegui import ui
 
 from app.ui.components import create_sidebar
-from app.storage import load_notes, load_tags
+from app.storage import count_notes_by, load_tags
 
 MIN_NOTES_PER_TAG = 10
 
@@ -84,15 +82,6 @@ DEFAULT_MOCK_REPORT = {
 }
 
 
-def _count_notes_per_tag(notes: list[dict]) -> dict[str, int]:
-    """Retorna um dicionario com a contagem de notas por tag."""
-    counts: dict[str, int] = Counter()
-    for note in notes:
-        for tag in note.get('tags', []):
-            counts[tag] += 1
-    return dict(counts)
-
-
 def _get_mock_report(tag: str) -> dict:
     """Retorna o relatório mockado para uma tag."""
     if tag in MOCK_REPORTS:
@@ -109,8 +98,7 @@ def _get_mock_report(tag: str) -> dict:
 def reports_page():
     create_sidebar()
 
-    notes = load_notes()
-    tag_counts = _count_notes_per_tag(notes)
+    tag_counts = count_notes_by('tags')
     all_tags = sorted(tag_counts.keys())
 
     with ui.column().classes('w-full max-w-4xl mx-auto p-6 gap-6'):
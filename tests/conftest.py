@@ -0,0 +1,102 @@
+"""
+Shared fixtures: every test runs against its own data directory, with the
+storage layer and the RAG service pointed at tmp_path and a deterministic
+fake embedding model (no model download, no network).
+"""
+import threading
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app import sqlite_storage, storage
+from app.services import rag_service
+from app.services.doc_store import DocStore
+from app.services.embedding_cache import QueryEmbeddingCache
+from app.services.filter_bitmaps import FilterBitmaps
+from app.services.result_cache import ResultCache
+from app.services.vector_file import FloatVectorFile
+
+
+class NormalizedFakeEmbedding(DeterministicFakeEmbedding):
+    """Deterministic random vectors, L2-normalized like the real model's."""
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = np.asarray(super().embed_query(text))
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point app.storage and app.sqlite_storage at an empty tmp_path."""
+    journal = tmp_path / 'notes.journal.jsonl'
+    chats_dir = tmp_path / 'chats'
+    for name, value in {
+        'DATA_FILE': tmp_path / 'notes.json',
+        'NOTES_JOURNAL_FILE': journal,
+        '_FROZEN_JOURNAL_FILE': journal.with_name(journal.name + '.compacting'),
+        'TAGS_FILE': tmp_path / 'tags.json',
+        'CHATS_FILE': tmp_path / 'chats.json',
+        'CHATS_DIR': chats_dir,
+        '_CHATS_INDEX_FILE': chats_dir / 'index.json',
+        '_notes_cache': None,
+        '_notes_cache_signature': None,
+        '_notes_indexes': None,
+        '_compactor': None,
+    }.items():
+        monkeypatch.setattr(storage, name, value)
+    monkeypatch.setattr(sqlite_storage, 'SQLITE_DB_FILE', str(tmp_path / 'knowledge.db'))
+    monkeypatch.setattr(sqlite_storage, 'TAGS_FILE', tmp_path / 'tags.json')
+    monkeypatch.setattr(sqlite_storage, '_local', threading.local())
+    monkeypatch.setattr(sqlite_storage, '_initialized', False)
+    return tmp_path
+
+
+@pytest.fixture
+def save_note(data_dir):
+    """storage.save_note with defaults for the fields a test does not care about."""
+    def save(title, content=None, tags=(), source_type='livro'):
+        return storage.save_note(title=title, content=f'{title} content' if content is None else content,
+                                 source_type=source_type, source_name='', source_author='',
+                                 tags=list(tags))
+    return save
+
+
+@pytest.fixture
+def embedded_texts(monkeypatch):
+    """Texts sent to the fake model's embed_documents during the test."""
+    texts = []
+    embed = NormalizedFakeEmbedding.embed_documents
+
+    def spy(self, batch):
+        texts.extend(batch)
+        return embed(self, batch)
+    monkeypatch.setattr(NormalizedFakeEmbedding, 'embed_documents', spy)
+    return texts
+
+
+@pytest.fixture(autouse=True)
+def rag(data_dir, monkeypatch):
+    """Isolate rag_service: index files under data_dir and fake embeddings."""
+    index_dir = data_dir / 'faiss_index'
+    for name, value in {
+        'FAISS_INDEX_DIR': str(index_dir),
+        '_docstore': DocStore(index_dir / 'docstore.db'),
+        '_vectors': FloatVectorFile(index_dir / 'vectors.f32'),
+        '_embeddings': NormalizedFakeEmbedding(size=64),
+        '_query_cache': QueryEmbeddingCache(64),
+        '_result_cache': ResultCache(64),
+        '_filters': FilterBitmaps(),
+        '_next_label': 0,
+        '_tombstones': 0,
+        '_index': None,
+        '_index_loaded': False,
+        '_initialized': False,
+    }.items():
+        monkeypatch.setattr(rag_service, name, value)
+    yield rag_service
+    rag_service.flush_index(10)
+    rag_service._docstore.close()
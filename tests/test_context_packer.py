@@ -0,0 +1,33 @@
+from langchain_core.documents import Document
+
+from app.services.context_packer import count_tokens, pack_context
+
+
+def _note(note_id, chunks, tags='|habits|', source_type='livro'):
+    return [Document(page_content=text, metadata={
+        'note_id': note_id, 'title': f'Title {note_id}', 'source_type': source_type,
+        'source_name': '', 'source_author': '', 'tags': tags, 'chunk': chunk,
+    }) for chunk, text in chunks]
+
+
+def test_context_stays_within_the_token_budget():
+    words = ' '.join(f'word{i}' for i in range(400))
+    notes = [_note(f'n{i}', [(0, f'Title n{i}\n\n{words}'), (1, words)]) for i in range(5)]
+
+    for budget in (60, 200, 1000):
+        packed = pack_context(notes, budget)
+        assert packed['tokens'] == count_tokens(packed['context']) <= budget
+        ids = [s['note_id'] for s in packed['sources']]
+        assert ids == [f'n{i}' for i in range(len(ids))] and ids
+    assert '[...]' in pack_context(notes, 200)['context']
+
+
+def test_shared_metadata_is_written_once_and_chunks_in_order():
+    notes = [_note('a', [(2, 'third part'), (0, 'Title a\n\nfirst part')]),
+             _note('b', [(0, 'Title b\n\nother note')])]
+    context = pack_context(notes, 1000)['context']
+
+    assert context.count('Tags: habits') == 1 and context.startswith('Todas as notas - ')
+    assert context.index('first part') < context.index('[...]\nthird part')
+    assert 'Title a\n\n' not in context
+    assert pack_context([], 1000) == {'context': '', 'sources': [], 'tokens': 0}
@@ -0,0 +1,46 @@
+import sqlite3
+
+from langchain_core.documents import Document
+
+from app.services import doc_store
+from app.services.doc_store import DocStore
+
+
+def _doc(note_id, chunk=0, **extra):
+    metadata = {'note_id': note_id, 'title': f'title {note_id}', 'source_type': 'livro',
+                'source_name': 'book', 'source_author': 'author', 'tags': '|a|b|',
+                'created_at': '2024-01-01T00:00:00', 'chunk': chunk, **extra}
+    return Document(page_content=f'text {note_id} {chunk}', metadata=metadata)
+
+
+def test_documents_round_trip_after_commit(tmp_path):
+    store = DocStore(tmp_path / 'docstore.db')
+    docs = [_doc('n1'), _doc('n1', chunk=1), _doc('n2', score=0.5, pages=[1, 2])]
+    store.add([4, 7, 9], docs, ['h1', 'h1', 'h2'])
+    store.commit('token-1')
+    store.add([10], [_doc('n3')], ['h3'])
+    store.close()
+
+    store = DocStore(tmp_path / 'docstore.db')
+    assert store.token() == 'token-1'
+    # Uncommitted writes are lost; results keep the requested order.
+    assert store.get_many([9, 10, 4]) == [docs[2], docs[0]]
+    assert store.labels_of(['n1', 'n3']) == {'n1': [4, 7]}
+    assert store.hashes() == {'n1': 'h1', 'n2': 'h2'}
+    assert store.max_label() == 9
+    store.close()
+
+
+def test_other_format_version_starts_empty(tmp_path, monkeypatch):
+    store = DocStore(tmp_path / 'docstore.db')
+    store.add([0], [_doc('n1')], ['h1'])
+    store.commit('token-1')
+    store.close()
+
+    monkeypatch.setattr(doc_store, 'FORMAT_VERSION', doc_store.FORMAT_VERSION + 1)
+    store = DocStore(tmp_path / 'docstore.db')
+    assert store.token() is None and store.get_many([0]) == []
+    store.close()
+    conn = sqlite3.connect(tmp_path / 'docstore.db')
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == doc_store.FORMAT_VERSION
+    conn.close()
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from app.services.embedding_cache import EmbeddingCache, QueryEmbeddingCache, text_key
+
+DIM = 8
+
+
+def _vectors(texts):
+    return np.array([[float(sum(map(ord, t))), *range(DIM - 1)] for t in texts], dtype=np.float32)
+
+
+def _keys(texts):
+    return [text_key(t) for t in texts]
+
+
+def _assert_consistent(cache):
+    """Every cached key must return its own text's vector."""
+    for text in [f'text {i}' for i in range(20)]:
+        vector = cache.get_many(_keys([text]))[0]
+        if vector is not None:
+            np.testing.assert_array_equal(vector, _vectors([text])[0])
+
+
+def test_entries_survive_reopening(tmp_path):
+    texts = [f'text {i}' for i in range(5)]
+    cache = EmbeddingCache(tmp_path, 'model', 1024 * 1024)
+    cache.put_many(_keys(texts), _vectors(texts))
+
+    reopened = EmbeddingCache(tmp_path, 'model', 1024 * 1024)
+    found = reopened.get_many(_keys(texts + ['missing']))
+    np.testing.assert_array_equal(np.array(found[:5]), _vectors(texts))
+    assert found[5] is None
+    assert EmbeddingCache(tmp_path, 'other model', 1024 * 1024).stats()['entries'] == 0
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = EmbeddingCache(tmp_path, 'model', 4 * DIM * 4)  # 4 slots
+    texts = [f'text {i}' for i in range(4)]
+    cache.put_many(_keys(texts), _vectors(texts))
+    cache.get_many(_keys(['text 0']))
+    cache.put_many(_keys(['text 4']), _vectors(['text 4']))
+
+    reopened = EmbeddingCache(tmp_path, 'model', 4 * DIM * 4)
+    present = [v is not None for v in reopened.get_many(_keys([f'text {i}' for i in range(5)]))]
+    assert present == [True, False, True, True, True]
+    _assert_consistent(reopened)
+
+
+def test_crash_while_reusing_a_slot_never_maps_a_key_to_another_vector(tmp_path, monkeypatch):
+    cache = EmbeddingCache(tmp_path, 'model', 4 * DIM * 4)
+    texts = [f'text {i}' for i in range(4)]
+    cache.put_many(_keys(texts), _vectors(texts))
+
+    # The evicted slots are overwritten, then the process dies before the
+    # new keys are recorded.
+    write = EmbeddingCache._write_vectors
+
+    def write_then_crash(self, slots, vectors):
+        write(self, slots, vectors)
+        raise OSError('crash')
+
+    monkeypatch.setattr(EmbeddingCache, '_write_vectors', write_then_crash)
+    with pytest.raises(OSError):
+        cache.put_many(_keys(['text 4', 'text 5']), _vectors(['text 4', 'text 5']))
+    monkeypatch.undo()
+
+    reopened = EmbeddingCache(tmp_path, 'model', 4 * DIM * 4)
+    assert reopened.get_many(_keys(['text 0', 'text 1'])) == [None, None]
+    _assert_consistent(reopened)
+    _assert_consistent(cache)
+
+
+def test_query_cache_normalizes_queries_and_evicts_the_oldest():
+    cache = QueryEmbeddingCache(2)
+    cache.put('model', 'caf\u0065\u0301  habits', [1.0, 2.0])
+    assert cache.get('model', ' caf\u00e9 habits\n') == [1.0, 2.0]
+    assert cache.get('other model', 'caf\u00e9 habits') is None
+
+    cache.put('model', 'second', [2.0])
+    cache.get('model', 'cafe\u0301 habits')
+    cache.put('model', 'third', [3.0])
+    assert cache.get('model', 'second') is None
+    assert cache.get('model', 'third') == [3.0]
+    assert cache.stats() == {'hits': 3, 'misses': 2, 'hit_rate': 0.6, 'entries': 2, 'capacity': 2}
+
+
+def test_repeated_question_is_encoded_once(rag, monkeypatch, save_note):
+    save_note('note')
+    rag.flush_index(30)
+    encoded = []
+
+    def encode(texts):
+        encoded.extend(texts)
+        return rag._encode_queries(texts)
+    monkeypatch.setattr(rag._query_batcher, 'encode_batch', encode)
+    rag.retrieve('what  is a note', top_k=1)
+    rag.retrieve('what is a note ', top_k=2)
+    assert len(encoded) == 1
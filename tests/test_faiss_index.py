@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from app.services import faiss_index
+from app.services.faiss_index import EXACT_SEARCH_MAX_CANDIDATES
+from app.services.vector_file import FloatVectorFile
+
+DIM = 16
+
+
+@pytest.fixture(scope='module')
+def corpus():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((10_000, DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def vectors(tmp_path, corpus):
+    vectors = FloatVectorFile(tmp_path / 'vectors.f32')
+    vectors.reset(DIM)
+    vectors.write(np.arange(len(corpus)), corpus)
+    yield vectors
+    vectors.close()
+
+
+def _index(kind, encoding, corpus):
+    index = faiss_index.create_index(kind, encoding, DIM, corpus)
+    index.add_with_ids(corpus, np.arange(len(corpus), dtype=np.int64))
+    return index
+
+
+def _exact(corpus, query, mask, k):
+    labels = np.flatnonzero(mask)
+    distances = ((corpus[labels] - query) ** 2).sum(axis=1)
+    return labels[np.argsort(distances, kind='stable')[:k]].tolist()
+
+
+def test_filtered_flat_pq_search_above_the_exact_limit(corpus, vectors):
+    index = _index('flat', 'pq', corpus)
+    assert not faiss_index.supports_selector(index)
+    mask = np.zeros(len(corpus), dtype=bool)
+    mask[::2] = True
+    assert np.count_nonzero(mask) > EXACT_SEARCH_MAX_CANDIDATES
+
+    queries = corpus[[1, 3, 5]] + 0.01
+    for query in queries:
+        _, labels = faiss_index.search(index, query, 5, mask, vectors)
+        assert len(labels) == 5 and mask[labels].all()
+        assert labels.tolist() == _exact(corpus, query, mask, 5)
+
+    results = faiss_index.search_many(index, queries, [5, 5, 5], [mask, mask, None], vectors)
+    assert [len(labels) for _, labels in results] == [5, 5, 5]
+    assert all(mask[labels].all() for _, labels in results[:2])
+
+
+def test_ivf_training_sample_keeps_enough_points_per_centroid(monkeypatch):
+    monkeypatch.setattr(faiss_index, '_TRAIN_SAMPLE_POINTS', 1000)
+    train = np.zeros((5000, DIM), dtype=np.float32)
+
+    assert len(faiss_index._training_sample(train)) == 1000
+    assert len(faiss_index._training_sample(train, nlist=64)) == 64 * faiss_index._MIN_POINTS_PER_CENTROID
+    assert len(faiss_index._training_sample(train, nlist=200)) == 5000
+
+
+def test_flat_float32_uses_the_exact_path_for_small_filters(corpus, vectors, monkeypatch):
+    index = _index('flat', 'float32', corpus)
+    exact = []
+
+    def spy(index, query, labels, k, vectors=None):
+        exact.append(len(labels))
+        return original(index, query, labels, k, vectors)
+    original = faiss_index._exact_topk
+    monkeypatch.setattr(faiss_index, '_exact_topk', spy)
+
+    mask = np.zeros(len(corpus), dtype=bool)
+    mask[:100] = True
+    query = corpus[7] + 0.01
+    _, labels = faiss_index.search(index, query, 5, mask, vectors)
+    assert labels.tolist() == _exact(corpus, query, mask, 5)
+    results = faiss_index.search_many(index, [query], [5], [mask], vectors)
+    assert results[0][1].tolist() == labels.tolist()
+    assert exact == [100, 100]
@@ -0,0 +1,42 @@
+from app.services.index_queue import IndexingQueue
+
+
+def _queue(apply_batch, **kwargs):
+    return IndexingQueue(apply_batch, lambda: None, batch_wait=0, persist_debounce=0,
+                         retry_backoff=0.01, **kwargs)
+
+
+def test_failed_batch_is_retried():
+    applied = []
+    calls = []
+
+    def flaky(note_ids):
+        calls.append(list(note_ids))
+        if len(calls) == 1:
+            raise RuntimeError('embedding server down')
+        applied.extend(note_ids)
+
+    queue = _queue(flaky)
+    queue.enqueue(['a', 'b'])
+
+    assert queue.flush(5)
+    assert sorted(applied) == ['a', 'b']
+    stats = queue.stats()
+    assert (stats['errors'], stats['retried'], stats['dropped'], stats['depth']) == (1, 2, 0, 0)
+    assert stats['processed'] == 2
+
+
+def test_batch_failing_every_attempt_is_dropped():
+    calls = []
+
+    def broken(note_ids):
+        calls.append(list(note_ids))
+        raise RuntimeError('bad note')
+
+    queue = _queue(broken, max_attempts=3)
+    queue.enqueue(['a'])
+
+    assert queue.flush(5)
+    assert calls == [['a']] * 3
+    stats = queue.stats()
+    assert (stats['errors'], stats['dropped'], stats['processed']) == (3, 1, 0)
@@ -0,0 +1,85 @@
+"""
+Exports a small sentence-transformers model to int8 ONNX and checks it
+against the PyTorch model. The model is built locally (random BERT weights,
+mean pooling, normalization, like all-MiniLM-L6-v2) so the test needs no
+download; it is skipped when the ONNX packages are not installed.
+"""
+import pytest
+
+pytest.importorskip('onnxruntime')
+pytest.importorskip('onnx')
+
+import torch  # noqa: E402
+from langchain_huggingface import HuggingFaceEmbeddings  # noqa: E402
+from sentence_transformers import SentenceTransformer, models  # noqa: E402
+from transformers import BertConfig, BertModel, BertTokenizerFast  # noqa: E402
+
+from app.services.onnx_embeddings import (  # noqa: E402
+    MODEL_FILE,
+    OnnxEmbeddings,
+    check_parity,
+    export_model,
+)
+
+_WORDS = ('the of to and in is that for it with as on be this are by note habit '
+          'leader team book video idea work learn read write').split()
+_TEXTS = [
+    'the habit of a leader',
+    'note',
+    'learn to work with the team in this book ' * 20,  # truncated at max_seq_length
+    'xyz video idea',
+    '',
+]
+
+
+@pytest.fixture(scope='module')
+def torch_model_dir(tmp_path_factory):
+    root = tmp_path_factory.mktemp('model')
+    letters = list('abcdefghijklmnopqrstuvwxyz')
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', *letters, *(f'##{c}' for c in letters), *_WORDS]
+    (root / 'vocab.txt').write_text('\n'.join(vocab) + '\n', encoding='utf-8')
+    torch.manual_seed(0)
+    bert = BertModel(BertConfig(vocab_size=len(vocab), hidden_size=64, num_hidden_layers=2,
+                                num_attention_heads=4, intermediate_size=128,
+                                max_position_embeddings=128))
+    bert.save_pretrained(root / 'bert')
+    BertTokenizerFast(str(root / 'vocab.txt')).save_pretrained(root / 'bert')
+    model = SentenceTransformer(modules=[
+        models.Transformer(str(root / 'bert'), max_seq_length=64),
+        models.Pooling(64, 'mean'),
+        models.Normalize(),
+    ])
+    model.save(str(root / 'st'))
+    return root / 'st'
+
+
+@pytest.fixture(scope='module')
+def onnx_model_dir(torch_model_dir, tmp_path_factory):
+    return export_model(str(torch_model_dir), tmp_path_factory.mktemp('onnx'))
+
+
+def test_int8_export_matches_pytorch(torch_model_dir, onnx_model_dir):
+    assert (onnx_model_dir / MODEL_FILE).exists()
+    reference = HuggingFaceEmbeddings(model_name=str(torch_model_dir), model_kwargs={'device': 'cpu'},
+                                      encode_kwargs={'normalize_embeddings': True})
+
+    result = check_parity(OnnxEmbeddings(onnx_model_dir, batch_size=2), reference, _TEXTS)
+
+    assert result['passed'], result
+    assert result['min_cosine'] >= 0.99
+
+
+def test_onnx_backend_serves_retrieve(rag, monkeypatch, onnx_model_dir):
+    from app import storage
+
+    monkeypatch.setattr(rag, '_embeddings', OnnxEmbeddings(onnx_model_dir))
+    note = storage.save_note(title='leader habit', content='the habit of a leader', source_type='livro',
+                             source_name='', source_author='', tags=[])
+    storage.save_note(title='video', content='an idea for a video', source_type='video',
+                      source_name='', source_author='', tags=[])
+    rag.flush_index(30)
+
+    results = rag.retrieve_many([{'question': 'leader habit', 'top_k': 1},
+                                 {'question': 'video idea', 'top_k': 2}])
+    assert results[0]['sources'][0]['note_id'] == note['id']
+    assert len(results[1]['sources']) == 2
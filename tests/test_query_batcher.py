@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from app.services.query_batcher import QueryBatcher
+
+
+def _encode_concurrently(batcher, texts):
+    results = {}
+
+    def run(text):
+        try:
+            results[text] = batcher.encode(text)
+        except Exception as e:
+            results[text] = e
+    threads = [threading.Thread(target=run, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_each_caller_gets_its_own_vector():
+    batches = []
+
+    def encode_batch(texts):
+        batches.append(list(texts))
+        # Each row carries its text's length and its position in the batch.
+        return [[float(len(text)), float(i)] for i, text in enumerate(texts)]
+
+    texts = [f'query {"x" * i}' for i in range(8)]
+    batcher = QueryBatcher(encode_batch, max_batch=8, max_wait=5)
+    results = _encode_concurrently(batcher, texts)
+
+    assert batches and sorted(sum(batches, [])) == sorted(texts)
+    for text, vector in results.items():
+        batch = next(b for b in batches if text in b)
+        assert vector == [float(len(text)), float(batch.index(text))]
+    stats = batcher.stats()
+    assert stats['queries'] == 8 and stats['batches'] == len(batches) and stats['pending'] == 0
+
+
+def test_a_failed_batch_raises_in_every_caller():
+    def broken(texts):
+        raise RuntimeError('model unavailable')
+
+    batcher = QueryBatcher(broken, max_batch=4, max_wait=5)
+    results = _encode_concurrently(batcher, ['a', 'b', 'c', 'd'])
+    assert len(results) == 4 and all(isinstance(error, RuntimeError) for error in results.values())
+
+    with pytest.raises(RuntimeError):
+        QueryBatcher(broken, max_batch=1).encode('a')
@@ -0,0 +1,99 @@
+import pytest
+
+from app import storage
+from app.services.result_cache import ResultCache
+from app.services.tag_partitions import TagPartitions
+
+
+@pytest.mark.parametrize('partitions', [False, True])
+def test_long_note_does_not_crowd_out_top_k(rag, monkeypatch, save_note, partitions):
+    monkeypatch.setattr(rag, '_partitions', TagPartitions() if partitions else None)
+    long_id = save_note('long', ' '.join(f'alpha beta gamma {i}' for i in range(1500)), ['t'])['id']
+    for i in range(10):
+        save_note(f'short {i}', f'short note {i}', ['t'])
+    rag.flush_index(30)
+    assert len(rag._docstore.labels_of([long_id])[long_id]) >= 15
+
+    # The long note's chunks are the closest, filling the first fetch.
+    result = rag.retrieve('alpha beta gamma 7', tags=['t'], top_k=5, max_tokens=100_000)
+    assert len(result['sources']) == 5
+
+    batched = rag.retrieve_many([
+        {'question': 'alpha beta gamma 7', 'tags': ['t'], 'top_k': 5, 'max_tokens': 100_000},
+        {'question': 'alpha beta gamma 9', 'top_k': 11, 'max_tokens': 100_000},
+    ])
+    assert [len(r['sources']) for r in batched] == [5, 11]
+
+
+def test_updates_and_deletes_touch_only_the_changed_note(rag, save_note, embedded_texts):
+    notes = [save_note(f'note {i}') for i in range(3)]
+    rag.flush_index(30)
+    index = rag._index
+    embedded_texts.clear()
+
+    storage.update_note(notes[1]['id'], 'edited', 'edited content', 'livro', '', '', [])
+    rag.flush_index(30)
+    assert len(embedded_texts) == 1 and 'edited content' in embedded_texts[0]
+    storage.delete_note(notes[2]['id'])
+    rag.flush_index(30)
+    assert len(embedded_texts) == 1
+
+    assert rag._index is index and index.ntotal == 2
+    sources = rag.retrieve('edited content', top_k=10)['sources']
+    assert sorted(s['note_id'] for s in sources) == sorted([notes[0]['id'], notes[1]['id']])
+
+
+def test_single_tag_search_uses_the_partition(rag, monkeypatch, save_note):
+    monkeypatch.setattr(rag, '_partitions', TagPartitions())
+    monkeypatch.setattr(rag, '_result_cache', ResultCache(0))
+    notes = [save_note(f'note {i}', tags=['a'] if i % 3 else ['a', 'b']) for i in range(9)]
+    rag.flush_index(30)
+    storage.delete_note(notes[1]['id'])
+    rag.flush_index(30)
+
+    with_partition = rag.retrieve('note', tags=['a'], top_k=5)['sources']
+    assert rag._partitions.size('a') == 8 and rag._partitions.size('b') == 3
+    monkeypatch.setattr(rag, '_use_partition', lambda source_type, tags: False)
+    assert rag.retrieve('note', tags=['a'], top_k=5)['sources'] == with_partition
+    assert notes[1]['id'] not in [s['note_id'] for s in with_partition]
+
+
+def test_cached_results_are_dropped_when_the_index_changes(rag, save_note):
+    first = save_note('note one')
+    rag.flush_index(30)
+    result = rag.retrieve('note', top_k=5)
+    result['sources'].clear()
+    cached = rag.retrieve('note ', top_k=5)
+    assert [s['note_id'] for s in cached['sources']] == [first['id']]
+    assert rag._result_cache.stats()['hits'] == 1
+
+    second = save_note('note two')
+    rag.flush_index(30)
+    fresh = rag.retrieve('note', top_k=5)
+    assert sorted(s['note_id'] for s in fresh['sources']) == sorted([first['id'], second['id']])
+    assert rag._result_cache.stats()['hits'] == 1
+
+
+def test_retrieve_many_matches_separate_retrieves(rag, monkeypatch, save_note):
+    monkeypatch.setattr(rag, '_result_cache', ResultCache(0))
+    for i in range(6):
+        save_note(f'note {i}', tags=['a'] if i % 2 else ['b'], source_type='video' if i < 3 else 'livro')
+    rag.flush_index(30)
+    queries = [
+        {'question': 'note 1', 'top_k': 3},
+        {'question': 'note 2', 'tags': ['a'], 'top_k': 2},
+        {'question': 'note 3', 'source_type': 'video', 'tags': ['b'], 'top_k': 5},
+        {'question': 'note 4', 'source_type': 'artigo'},
+    ]
+    encoded = []
+    encode = rag._encode_queries
+
+    def spy(texts):
+        encoded.append(list(texts))
+        return encode(texts)
+    monkeypatch.setattr(rag, '_encode_queries', spy)
+
+    batched = rag.retrieve_many(queries)
+    assert len(encoded) == 1 and len(encoded[0]) == 4
+    assert batched == [rag.retrieve(**query) for query in queries]
+    assert [len(r['sources']) for r in batched] == [3, 2, 2, 0]
@@ -0,0 +1,173 @@
+import json
+
+import pytest
+
+from app import storage
+
+
+def _reload(monkeypatch):
+    """Drop the process-wide cache, as a fresh process would start."""
+    monkeypatch.setattr(storage, '_notes_cache', None)
+    monkeypatch.setattr(storage, '_notes_cache_signature', None)
+
+
+def test_journal_truncated_mid_record_recovers(data_dir, monkeypatch, save_note):
+    first = save_note('first')
+    second = save_note('second')
+    # Crash while appending a third record: no trailing newline.
+    with open(storage.NOTES_JOURNAL_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'put', 'note': {**first, 'id': 'partial'}})[:40])
+    _reload(monkeypatch)
+
+    assert [n['id'] for n in storage.load_notes()] == [first['id'], second['id']]
+
+    third = save_note('third')
+    _reload(monkeypatch)
+    assert [n['id'] for n in storage.load_notes()] == [first['id'], second['id'], third['id']]
+
+
+def test_journal_survives_compaction(data_dir, monkeypatch, save_note):
+    notes = [save_note(f'note {i}') for i in range(3)]
+    storage.compact_notes_journal()
+    storage.delete_note(notes[0]['id'])
+    _reload(monkeypatch)
+
+    assert [n['id'] for n in storage.load_notes()] == [n['id'] for n in notes[1:]]
+    assert not storage._FROZEN_JOURNAL_FILE.exists()
+
+
+def test_sqlite_migration_replays_journals(data_dir, monkeypatch, save_note):
+    snapshot = [save_note(f'snapshot {i}') for i in range(3)]
+    storage.compact_notes_journal()
+    frozen = save_note('frozen', tags=['x'])
+    # Leave a compaction half done: the journal frozen but not yet folded in.
+    storage.NOTES_JOURNAL_FILE.rename(storage._FROZEN_JOURNAL_FILE)
+    journaled = save_note('journaled')
+    storage.delete_note(snapshot[0]['id'])
+
+    monkeypatch.setattr(storage, 'STORAGE_BACKEND', 'sqlite')
+    _reload(monkeypatch)
+
+    expected = [snapshot[1], snapshot[2], frozen, journaled]
+    assert storage.load_notes() == expected
+
+
+@pytest.mark.parametrize('backend', ['json', 'sqlite'])
+def test_tags_are_deduplicated_after_normalization(data_dir, monkeypatch, backend, save_note):
+    monkeypatch.setattr(storage, 'STORAGE_BACKEND', backend)
+    note = save_note('tagged', tags=['x', 'X ', 'y', ' x'])
+    assert note['tags'] == ['x', 'y']
+
+    storage.update_note(note['id'], 'tagged', 'content', 'livro', '', '', ['Y', 'z', 'y'])
+    _reload(monkeypatch)
+    assert storage.get_note(note['id'])['tags'] == ['y', 'z']
+
+
+def _msg(role, content):
+    return {'role': role, 'content': content}
+
+
+def test_update_chat_saves_edited_history(data_dir):
+    chat = storage.save_chat('chat', [_msg('user', 'u'), _msg('assistant', 'a')])
+
+    edited = [_msg('user', 'u'), _msg('assistant', 'EDITED')]
+    assert storage.update_chat(chat['id'], edited)
+    assert storage.get_chat(chat['id'])['messages'] == edited
+
+    longer = edited[:1] + [_msg('assistant', 'b'), _msg('user', 'c')]
+    storage.update_chat(chat['id'], longer)
+    assert storage.get_chat(chat['id'])['messages'] == longer
+
+    storage.update_chat(chat['id'], longer[:1])
+    assert storage.get_chat(chat['id'])['messages'] == longer[:1]
+
+    appended = longer[:1] + [_msg('assistant', 'd')]
+    storage.update_chat(chat['id'], appended)
+    assert storage.get_chat(chat['id'])['messages'] == appended
+    assert storage.list_chat_summaries()['chats'][0]['message_count'] == 2
+
+
+def test_update_chat_ignores_uncommitted_append(data_dir, monkeypatch):
+    messages = [_msg('user', 'u'), _msg('assistant', 'a')]
+    chat = storage.save_chat('chat', messages)
+
+    # Crash after appending to the log but before saving the index.
+    def crash(entries):
+        raise OSError('crash')
+
+    with monkeypatch.context() as m, pytest.raises(OSError):
+        m.setattr(storage, '_write_chats_index', crash)
+        storage.update_chat(chat['id'], messages + [_msg('user', 'lost')])
+    assert storage.get_chat(chat['id'])['messages'] == messages
+
+    messages.append(_msg('user', 'kept'))
+    storage.update_chat(chat['id'], messages)
+    assert storage.get_chat(chat['id'])['messages'] == messages
+
+
+def test_chat_summaries_search_and_page_without_reading_logs(data_dir, monkeypatch):
+    chats = [storage.save_chat(f'{topic} chat', [_msg('user', topic)] * (i + 1))
+             for i, topic in enumerate(['habits', 'video', 'habit loop'])]
+    monkeypatch.setattr(storage, '_read_chat_messages', lambda *args: pytest.fail('message log read'))
+
+    found = storage.list_chat_summaries('HABIT', offset=0, limit=1)
+    assert found['total'] == 2
+    # Newest first (chats saved in the same second keep their save order reversed).
+    assert [(c['title'], c['message_count']) for c in found['chats']] == [('habit loop chat', 3)]
+    assert [c['title'] for c in storage.list_chat_summaries('habit', offset=1, limit=1)['chats']] == \
+        ['habits chat']
+    assert storage.count_chats() == 3
+    storage.delete_chat(chats[1]['id'])
+    assert storage.list_chat_summaries()['total'] == storage.count_chats() == 2
+
+
+def test_counts_put_notes_without_source_type_under_outro(data_dir, monkeypatch, save_note):
+    kept = save_note('kept')
+    legacy = {k: v for k, v in save_note('legacy').items() if k not in ('source_type', 'source_name')}
+    with open(storage.NOTES_JOURNAL_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'put', 'note': legacy}) + '\n')
+    _reload(monkeypatch)
+
+    assert storage.count_notes_by('source_type') == {'livro': 1, 'outro': 1}
+    assert storage.count_notes_by_source() == {('', 'livro'): 1, ('', 'outro'): 1}
+    storage.delete_note(kept['id'])
+    assert storage.count_notes_by_source() == {('', 'outro'): 1}
+
+
+def test_note_cache_reloads_after_an_external_write(data_dir, monkeypatch, save_note):
+    monkeypatch.setattr(storage, '_notes_cache_stats', {'hits': 0, 'misses': 0, 'invalidations': 0})
+    first = save_note('first')
+    storage.load_notes()
+    storage.load_notes()
+    assert storage.notes_cache_stats()['invalidations'] == 0
+
+    # Another process appends a note to the journal.
+    other = {**first, 'id': 'other', 'title': 'other'}
+    with open(storage.NOTES_JOURNAL_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'put', 'note': other}) + '\n')
+
+    assert [n['id'] for n in storage.load_notes()] == [first['id'], 'other']
+    stats = storage.notes_cache_stats()
+    assert stats['invalidations'] == 1 and stats['size'] == 2
+
+
+def test_notes_pages_cover_every_match_once(data_dir, monkeypatch, save_note):
+    notes = [save_note(f'note {i}', tags=['even' if i % 2 == 0 else 'odd']) for i in range(7)]
+    # Notes saved in the same second share created_at: ties are broken by id.
+
+    for order in ('desc', 'asc'):
+        seen, cursor = [], None
+        while True:
+            page = storage.load_notes_page(cursor, limit=2, order=order)
+            assert len(page['notes']) <= 2
+            seen += [n['id'] for n in page['notes']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        expected = sorted(notes, key=lambda n: (n['created_at'], n['id']), reverse=order == 'desc')
+        assert seen == [n['id'] for n in expected]
+
+    page = storage.load_notes_page(limit=10, filters={'tag': 'odd', 'query': 'NOTE 3'})
+    assert [n['id'] for n in page['notes']] == [notes[3]['id']] and page['next_cursor'] is None
+    with pytest.raises(ValueError):
+        storage.load_notes_page(order='sideways')
@@ -0,0 +1,173 @@
+import sys
+
+import numpy as np
+import pytest
+
+from app import storage
+from app.services import faiss_index, vector_store
+from app.services.doc_store import DocStore
+from app.services.filter_bitmaps import FilterBitmaps
+from app.services.result_cache import ResultCache
+from app.services.tag_partitions import TagPartitions
+from app.services.vector_file import FloatVectorFile
+
+
+def _configure(monkeypatch, backend, index_type='auto'):
+    monkeypatch.setattr(vector_store, 'RAG_VECTOR_BACKEND', backend)
+    monkeypatch.setattr(vector_store, 'RAG_INDEX_TYPE', index_type)
+    monkeypatch.setattr(faiss_index, 'RAG_INDEX_TYPE', index_type)
+    vector_store._configured_backend.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def _clear_backend_cache():
+    yield
+    vector_store._configured_backend.cache_clear()
+
+
+def _reopen(rag, monkeypatch):
+    """Drop the in-memory index, as a fresh process would start."""
+    rag.flush_index(30)
+    rag._docstore.close()
+    index_dir = rag.FAISS_INDEX_DIR
+    for name, value in {
+        '_docstore': DocStore(f'{index_dir}/docstore.db'),
+        '_vectors': FloatVectorFile(f'{index_dir}/vectors.f32'),
+        '_filters': FilterBitmaps(),
+        '_result_cache': ResultCache(64),
+        '_index': None,
+        '_index_loaded': False,
+    }.items():
+        monkeypatch.setattr(rag, name, value)
+    return rag._get_index()
+
+
+def _ranking(rag, question='note'):
+    return [s['note_id'] for s in rag.retrieve(question, top_k=10)['sources']]
+
+
+@pytest.mark.parametrize('backend', ['numpy', 'faiss'])
+def test_index_reopens_and_accepts_writes(rag, monkeypatch, save_note, backend):
+    _configure(monkeypatch, backend)
+    ids = [save_note(f'note {i}')['id'] for i in range(5)]
+    rag.flush_index(30)
+    ranking = _ranking(rag)
+
+    index = _reopen(rag, monkeypatch)
+    assert index.name == backend and index.ntotal == 5
+    assert _ranking(rag) == ranking
+
+    storage.delete_note(ids[3])
+    added = save_note('added note')['id']
+    index = _reopen(rag, monkeypatch)
+    assert index.name == backend
+    assert sorted(_ranking(rag)) == sorted(ids[:3] + ids[4:] + [added])
+
+
+def test_auto_backend_honours_explicit_index_type(monkeypatch):
+    _configure(monkeypatch, 'auto')
+    assert vector_store.choose_spec(100) == ('numpy', 'float32')
+
+    _configure(monkeypatch, 'auto', 'hnsw')
+    assert vector_store.choose_spec(100) == ('hnsw', 'float32')
+
+
+def test_switching_backend_rebuilds_with_the_configured_one(rag, monkeypatch, save_note):
+    _configure(monkeypatch, 'numpy')
+    note_id = save_note('note')['id']
+    rag.ensure_index()
+    assert _reopen(rag, monkeypatch).name == 'numpy'
+
+    _configure(monkeypatch, 'faiss', 'hnsw')
+    rag.ensure_index()
+    assert rag._index.spec == ('hnsw', 'float32')
+    index = _reopen(rag, monkeypatch)
+    assert index.name == 'faiss' and index.spec == ('hnsw', 'float32')
+    assert _ranking(rag) == [note_id]
+
+
+def test_numpy_backend_does_not_import_faiss(monkeypatch, tmp_path):
+    from app.services import tag_partitions
+
+    assert 'faiss' not in vars(vector_store) and 'faiss' not in vars(tag_partitions)
+    # From here on, any import of faiss or faiss_index raises ImportError.
+    import app.services
+
+    monkeypatch.setitem(sys.modules, 'faiss', None)
+    monkeypatch.setitem(sys.modules, 'app.services.faiss_index', None)
+    monkeypatch.delattr(app.services, 'faiss_index')
+    _configure(monkeypatch, 'numpy')
+
+    vectors = FloatVectorFile(tmp_path / 'vectors.f32')
+    vectors.reset(4)
+    data = np.eye(4, dtype=np.float32)
+    vectors.write(range(4), data)
+    backend = vector_store.create_backend(vector_store.choose_spec(4), 4, vectors, data)
+    backend.add(np.arange(4), data)
+    assert backend.search(data[2], 1)[1].tolist() == [2]
+    backend.save(tmp_path)
+    assert vector_store.open_backend('numpy', tmp_path, vectors, 4).name == 'numpy'
+    TagPartitions().search('tag', data[0], 1)
+    vectors.close()
+
+
+def test_reopen_loads_saved_filters_and_builds_partitions_lazily(rag, monkeypatch, save_note):
+    _configure(monkeypatch, 'numpy')
+    for i in range(6):
+        save_note(f'note {i}', tags=['even' if i % 2 == 0 else 'odd'])
+    monkeypatch.setattr(rag, '_partitions', TagPartitions())
+    rag.flush_index(30)
+    expected = rag.retrieve('note', tags=['even'], top_k=10)['sources']
+
+    monkeypatch.setattr(rag, '_partitions', TagPartitions())
+    monkeypatch.setattr(DocStore, 'label_rows', lambda self: pytest.fail('filters.npz not used'))
+    _reopen(rag, monkeypatch)
+    assert rag._partitions.partitions == {}
+
+    assert rag.retrieve('note', tags=['even'], top_k=10)['sources'] == expected
+    assert list(rag._partitions.partitions) == ['even']
+
+
+def test_filter_bitmaps_round_trip(tmp_path):
+    filters = FilterBitmaps()
+    filters.add([0, 2, 9], [{'tags': 'a|b', 'source_type': 'livro'},
+                            {'tags': 'b', 'source_type': 'artigo'},
+                            {'tags': '', 'source_type': 'livro'}])
+    filters.remove([2])
+    filters.save(tmp_path / 'filters.npz', 'token-1')
+
+    loaded = FilterBitmaps()
+    assert not loaded.load(tmp_path / 'filters.npz', 'token-2')
+    assert len(loaded.live) == 0
+    assert loaded.load(tmp_path / 'filters.npz', 'token-1')
+    assert np.array_equal(loaded.live, filters.live)
+    for tags, source_type in ((['a'], ''), (['b'], ''), ([], 'livro'), ([], 'artigo')):
+        assert np.array_equal(loaded.mask(source_type, tags), filters.mask(source_type, tags))
+
+
+def test_reopen_embeds_only_notes_changed_while_closed(rag, monkeypatch, save_note, embedded_texts):
+    _configure(monkeypatch, 'numpy')
+    notes = [save_note(f'note {i}') for i in range(4)]
+    rag.ensure_index()
+    rag.flush_index(30)
+    # Changes made while the service is down never reach the index queue.
+    with monkeypatch.context() as m:
+        for hook in ('add_note', 'update_note', 'delete_note'):
+            m.setattr(rag, hook, lambda *args: None)
+        storage.update_note(notes[0]['id'], 'edited', 'edited content', 'livro', '', '', [])
+        storage.delete_note(notes[1]['id'])
+        added = save_note('added')
+    embedded_texts.clear()
+
+    _reopen(rag, monkeypatch)
+    assert rag.ensure_index() == 4
+    assert len(embedded_texts) == 2
+    assert any('edited content' in t for t in embedded_texts) and any('added content' in t for t in embedded_texts)
+    assert sorted(_ranking(rag)) == sorted([notes[0]['id'], notes[2]['id'], notes[3]['id'], added['id']])
+
+    # An index written by another embedding model is rebuilt from scratch.
+    embedded_texts.clear()
+    monkeypatch.setattr(rag, '_EMBEDDING_ID', 'another-model')
+    assert _reopen(rag, monkeypatch) is None
+    rag.ensure_index()
+    assert len(embedded_texts) == 4
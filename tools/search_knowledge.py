@@ -24,6 +24,52 @@ def _get_available_tag_names() -> list[str]:
     return [t['name'] for t in tags]
 
 
+def _tool_output(tag: str, result: dict, sources_collector: list[dict]) -> str:
+    """Texto devolvido ao modelo para o resultado de uma busca."""
+    if not result['sources']:
+        return (
+            f'Nenhuma nota encontrada com a tag "{tag}" '
+            f'relevante para a pergunta.'
+        )
+    sources_collector.extend(result['sources'])
+    return result['context']
+
+
+def _unknown_tag_message(tag: str, available_tags: list[str]) -> str:
+    return (
+        f'Erro: A tag "{tag}" não existe no sistema. '
+        f'Tags disponíveis: {", ".join(available_tags)}'
+    )
+
+
+def search_knowledge_many(calls: list[SearchKnowledgeInput],
+                          sources_collector: list[dict]) -> list[str]:
+    """
+    Executa varias chamadas de search_knowledge de uma vez, com uma unica
+    busca em lote no RAG (rag_service.retrieve_many).
+
+    Args:
+        calls: Argumentos de cada chamada, na ordem em que o modelo as fez.
+        sources_collector: Lista onde as fontes encontradas serão acumuladas.
+
+    Returns:
+        O texto de resultado de cada chamada, na mesma ordem.
+    """
+    available_tags = _get_available_tag_names()
+    valid = [call for call in calls if call.tag in available_tags]
+    results = rag_service.retrieve_many(
+        [{'question': call.question, 'tags': [call.tag]} for call in valid]
+    )
+    by_call = {id(call): result for call, result in zip(valid, results)}
+    outputs = []
+    for call in calls:
+        if call.tag not in available_tags:
+            outputs.append(_unknown_tag_message(call.tag, available_tags))
+        else:
+            outputs.append(_tool_output(call.tag, by_call[id(call)], sources_collector))
+    return outputs
+
+
 def create_search_knowledge_tool(sources_collector: list[dict]) -> StructuredTool:
     """
     Cria e retorna a ferramenta search_knowledge.
@@ -40,18 +86,9 @@ def create_search_knowledge_tool(sources_collector: list[dict]) -> StructuredToo
         """Busca notas na base de conhecimento filtradas por tag."""
         available_tags = _get_available_tag_names()
         if tag not in available_tags:
-            return (
-                f'Erro: A tag "{tag}" não existe no sistema. '
-                f'Tags disponíveis: {", ".join(available_tags)}'
-            )
+            return _unknown_tag_message(tag, available_tags)
         result = rag_service.retrieve(question=question, tags=[tag])
-        if not result['sources']:
-            return (
-                f'Nenhuma nota encontrada com a tag "{tag}" '
-                f'relevante para a pergunta.'
-            )
-        sources_collector.extend(result['sources'])
-        return result['context']
+        return _tool_output(tag, result, sources_collector)
 
     available_tags = _get_available_tag_names()
     tags_description = (